@@ -41,6 +41,7 @@ define('NO_OUTPUT_BUFFERING', true);
 
 require_once(__DIR__ . '/../../../../config.php');
 require_once($CFG->libdir . '/questionlib.php');
+require_once($CFG->libdir . '/filelib.php');
 
 // ── Parameters ────────────────────────────────────────────────────────────────
 
@@ -77,6 +78,23 @@ function extract_ai_feedback(string $html): ?string {
     return null;
 }
 
+/**
+ * If the AI feedback in the given -output HTML blob is a placeholder for
+ * deferred feedback, fetch the feedback from the AI feedback worker's server,
+ * whose URL is in the script following the placeholder. Returns the original
+ * feedback if it isn't deferred or the worker doesn't (yet) have it.
+ */
+function fetch_deferred_ai_feedback(string $html, string $feedback): string {
+    if (!preg_match('/\(reference [0-9a-f]{32}\)/', $feedback) ||
+            !preg_match('/\}\)\(("[^"]+")\);\s*<\/script>/', $html, $m)) {
+        return $feedback;
+    }
+    $url = json_decode($m[1]);
+    $response = is_string($url) ? download_file_content($url, null, null, false, 10) : false;
+    $result = $response ? json_decode($response, true) : null;
+    return $result['feedback'] ?? $feedback;
+}
+
 // ── Shared CSS (injected once in detail mode) ─────────────────────────────────
 
 function ai_feedback_css(): string {
@@ -215,6 +233,9 @@ if ($quizid) {
     foreach ($rows as $row) {
         $authorsolution = extract_author_solution($row->html_value);
         $aifeedback     = extract_ai_feedback($row->html_value);
+        if ($aifeedback !== null) {
+            $aifeedback = fetch_deferred_ai_feedback($row->html_value, $aifeedback);
+        }
 
         if ($authorsolution === null && $aifeedback === null) {
             continue;
@@ -0,0 +1,529 @@
+"""Worker process for the host-wide build caches of the
+   programming_contest_problem template. Jobs run as the Jobe users, which
+   also run the submissions, so a job can't be trusted to write a cache
+   entry: a submission could plant a program for later jobs to run. Instead,
+   jobs only read the caches, and leave a build request here for anything
+   they missed. This worker builds each request from its sources, with a
+   command it constructs itself, and adds the result to the cache. It also
+   records the test statistics that jobs send it (for the template
+   parameter order_by_failures).
+   The sources in a request can't be trusted either: a compile can pull any
+   file it can read into its output (e.g. with #include or .incbin). So
+   they're compiled as SANDBOX_USER, another dedicated user who owns no files,
+   with resource limits like a job's, in a directory that the Jobe users
+   can't find.
+   Run it on the Jobe host as a dedicated user (neither root nor a Jobe user)
+   that owns CACHE_ROOT and may run commands as SANDBOX_USER, e.g. after
+       sudo mkdir /var/cache/coderunner
+       sudo chown coderunner: /var/cache/coderunner
+       sudo useradd --system --no-create-home coderunner-build
+       echo 'coderunner ALL=(coderunner-build) NOPASSWD: ALL' | sudo tee /etc/sudoers.d/coderunner
+   It creates the cache directories (mode 0755, so jobs can only read them),
+   the request directory (mode 1733, so jobs can add requests but can't
+   list or alter other jobs' requests) and the build directory (mode 0711),
+   then repeatedly processes requests.
+   Usage: python3 buildcacheworker.py [--once]
+"""
+import base64
+import fcntl
+import hashlib
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import signal
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+from zipfile import ZipFile
+
+# Must match the programming_contest_problem template
+CACHE_ROOT = '/var/cache/coderunner'
+BUILD_REQUEST_DIR = os.path.join(CACHE_ROOT, 'requests')
+BUILD_REQUEST_MODE = 0o1733
+VALIDATOR_CACHE_DIR = os.path.join(CACHE_ROOT, 'validators')
+VALIDATOR_CPP_FLAGS = ['-std=c++17', '-O3', '-include', 'optionalhack.h']
+JAVA_CDS_DIR = os.path.join(CACHE_ROOT, 'java_cds')
+COMPILE_CACHE_DIR = os.path.join(CACHE_ROOT, 'compiles')
+COMPILE_FLAG_PARAMS = ['cflags', 'cldflags', 'cppflags']
+TEST_STATS_DIR = os.path.join(CACHE_ROOT, 'test_stats')
+BUILD_DIR = os.path.join(CACHE_ROOT, 'builds')  # Holds a directory per build
+
+CACHE_DIR_MODE = 0o755
+BUILD_DIR_MODE = 0o711  # So that only those who know a build's directory name can get to it
+SANDBOX_USER = 'coderunner-build'
+SANDBOX_COMMAND = ['sudo', '-n', '-u', SANDBOX_USER, '--']  # Prefix for commands run as SANDBOX_USER
+MAX_VALIDATOR_CACHE_ENTRIES = 200
+MAX_COMPILE_CACHE_ENTRIES = 1000
+MAX_COMPILE_CACHE_BYTES = 500 * 1024 * 1024
+COMPILED_LANGUAGES = ['c', 'cpp', 'java', 'csharp']
+PROBLEM_KEY_PATTERN = re.compile(r'[0-9a-f]{64}$')
+SOURCE_FILENAME_PATTERN = re.compile(r'[A-Za-z_]\w*\.(c|cpp|java|cs)$')
+# The compile flags a request may use. Anything that names a file or
+# directory (e.g. -o, -B, -include, -specs, -fplugin, @file) could make the
+# compiler write outside the build directory or run a program from a
+# request, so isn't allowed.
+SAFE_FLAG_PATTERN = re.compile(r'-(std=[\w+]+|O[0-3sgz]?|w|W[\w=+-]*|[lDU]\w+(=\w*)?|g[0-3]?|pthread|static'
+                               r'|f(?!plugin)[\w=+-]+|m[\w=+-]+)$')
+MAX_REQUEST_BYTES = 10 * 1024 * 1024    # Larger requests are ignored
+MAX_EXTRACTED_BYTES = 100 * 1024 * 1024  # Max total size of the files in a validator zip
+BUILD_TIMEOUT = 60  # Wall clock secs
+# The prlimit options for sandboxed builds, as the template's rlimits for a run:
+# no core dumps, limited CPU time, file size and (except for Java, which
+# manages its own memory) address space.
+SANDBOX_LIMITS = ['--core=0', f'--cpu={BUILD_TIMEOUT}', f'--fsize={8192 * 1024}']  # As the default fsizelimit
+SANDBOX_MEMORY_LIMIT = f'--as={4000000 * 1024}'  # The template's MEMLIMIT
+STALE_REQUEST_SECS = 3600  # Age at which a partly written request is deleted
+POLL_INTERVAL = 2  # Seconds to sleep when there are no requests
+JAVA_CDS_TRAINING_CLASS = '__CdsTraining'
+JDK_CLASS_PREFIXES = ('java/', 'javax/', 'jdk/', 'sun/', 'com/sun/')
+
+# A typical small contest program, run to find the JDK classes that
+# submissions commonly load, for the class-data-sharing archive. Run without
+# arguments, it runs itself as the template's Java test harness runs a
+# test: in a new class loader and thread, timed by the management bean.
+JAVA_CDS_TRAINING_SOURCE = r"""
+import java.io.*;
+import java.lang.management.ManagementFactory;
+import java.lang.reflect.Method;
+import java.net.URL;
+import java.net.URLClassLoader;
+import java.util.*;
+
+public class __CdsTraining {
+    public static void main(String[] args) throws Exception {
+        if (args.length == 0) {
+            com.sun.management.OperatingSystemMXBean os =
+                (com.sun.management.OperatingSystemMXBean) ManagementFactory.getOperatingSystemMXBean();
+            long cpuStart = os.getProcessCpuTime();
+            URL[] classPath = new URL[] {new File(".").toURI().toURL()};
+            try (URLClassLoader loader = new URLClassLoader(classPath, ClassLoader.getPlatformClassLoader())) {
+                Method main = loader.loadClass("__CdsTraining").getMethod("main", String[].class);
+                Thread thread = new Thread(new ThreadGroup("test"), () -> {
+                    try {
+                        main.invoke(null, (Object) new String[] {"test"});
+                    } catch (ReflectiveOperationException e) {
+                        throw new RuntimeException(e);
+                    }
+                }, "main", 0);
+                thread.start();
+                thread.join();
+            }
+            System.err.println(os.getProcessCpuTime() - cpuStart);
+            return;
+        }
+        BufferedReader reader = new BufferedReader(new InputStreamReader(System.in));
+        int n = Integer.parseInt(reader.readLine().trim());
+        Scanner scanner = new Scanner(reader);
+        List<Long> values = new ArrayList<>();
+        Map<Long, Integer> counts = new HashMap<>();
+        for (int i = 0; i < n; i++) {
+            long value = scanner.nextLong();
+            values.add(value);
+            counts.merge(value, 1, Integer::sum);
+        }
+        Collections.sort(values);
+        StringBuilder builder = new StringBuilder();
+        for (long value : values) {
+            builder.append(value).append(' ');
+        }
+        System.out.println(builder.toString().trim());
+        System.out.printf("%d %.3f%n", counts.size(), values.stream().mapToLong(Long::longValue).average().orElse(0));
+        System.out.println(Arrays.toString(new TreeSet<>(values).toArray()) + String.join(",", "a", "b"));
+    }
+}
+"""
+
+
+class BadRequest(Exception): pass
+
+
+class BuildCache:
+    """A directory-per-entry cache of build products, written only by this
+       worker. Entries are addressed by a hash of everything that determines
+       the build (see key), are added atomically and are evicted oldest first
+       when there are too many or (if max_bytes is given) they're too big in
+       total.
+    """
+    def __init__(self, cache_dir, max_entries, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(*parts):
+        """The cache key for a build determined by the given parts (strs or bytes).
+           [Shared with the programming_contest_problem template.]
+        """
+        digest = hashlib.sha256()
+        for part in parts:
+            data = part if isinstance(part, bytes) else str(part).encode()
+            digest.update(len(data).to_bytes(8, 'little') + data)
+        return digest.hexdigest()
+
+    def contains(self, key):
+        """True if there's an entry for the given key"""
+        return os.path.isdir(os.path.join(self.cache_dir, key))
+
+    def put(self, key, src_dir, filenames):
+        """Store copies of the given files in src_dir under the given key,
+           readable (but not writable) by everyone. The files must be regular
+           files, not links, as a sandboxed build could link to a file only
+           this worker can read.
+        """
+        temp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix='.')
+        try:
+            for filename in filenames:
+                with open(os.open(os.path.join(src_dir, filename), os.O_RDONLY | os.O_NOFOLLOW), 'rb') as infile:
+                    mode = os.fstat(infile.fileno()).st_mode
+                    if not stat.S_ISREG(mode):
+                        raise OSError(f"{filename} isn't a regular file")
+                    path = os.path.join(temp_dir, filename)
+                    with open(path, 'wb') as outfile:
+                        shutil.copyfileobj(infile, outfile)
+                os.chmod(path, 0o755 if mode & 0o100 else 0o644)
+            os.chmod(temp_dir, CACHE_DIR_MODE)
+            os.rename(temp_dir, os.path.join(self.cache_dir, key))
+        except OSError:  # Including the entry having been added by another worker
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Delete the oldest tenth of the entries if there are too many, then
+           the oldest entries until they're within max_bytes, if given.
+        """
+        entries = [entry for entry in os.listdir(self.cache_dir) if not entry.startswith('.')]
+        paths = sorted((os.path.join(self.cache_dir, entry) for entry in entries), key=os.path.getmtime)
+        if len(paths) > self.max_entries:
+            for path in paths[:len(paths) // 10]:
+                shutil.rmtree(path, ignore_errors=True)
+            paths = paths[len(paths) // 10:]
+        if self.max_bytes is not None:
+            sizes = [self.size(path) for path in paths]
+            total = sum(sizes)
+            for path, size in zip(paths, sizes):
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+
+    @staticmethod
+    def size(path):
+        """The total size in bytes of the files in the given entry directory"""
+        total = 0
+        for dirpath, _, filenames in os.walk(path):
+            total += sum(os.path.getsize(os.path.join(dirpath, filename)) for filename in filenames)
+        return total
+
+
+def host_build_info():
+    """A dictionary describing this host's build environment: the machine
+       type, C library and g++ version. Built binaries are reusable only on
+       hosts with the same build info.
+       [Shared with the programming_contest_problem template.]
+    """
+    try:
+        version = subprocess.run(['g++', '--version'], stdout=subprocess.PIPE,
+                                 universal_newlines=True).stdout.split('\n')[0]
+    except OSError:
+        version = ''
+    return {'machine': platform.machine(),
+            'libc': ' '.join(platform.libc_ver()),
+            'compiler': version}
+
+
+def program_identity(program):
+    """A str identifying the installed version of the given program (e.g. a
+       compiler) on the PATH: its real path, size and modification time.
+       [Shared with the programming_contest_problem template.]
+    """
+    path = shutil.which(program)
+    if path is None:
+        return ''
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    return f'{path}:{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def compile_command(language, filenames, options):
+    """The command to compile the given source files (the main one first)
+       in the given language (c, cpp, java or csharp), with the flags in the
+       given dictionary of options (see COMPILE_FLAG_PARAMS).
+       [Shared with the programming_contest_problem template.]
+    """
+    basename = filenames[0].rsplit('.', 1)[0]
+    if language == 'c':
+        return ['gcc'] + options['cflags'].split() + ['-o', basename, filenames[0]] + options['cldflags'].split()
+    elif language == 'cpp':
+        return ['g++'] + options['cppflags'].split() + ['-o', basename, filenames[0]]
+    elif language == 'java':
+        return ['javac', '-J-Xss64m', '-J-Xmx4g', '-Xlint:-unchecked'] + filenames
+    else:
+        return ['mcs', filenames[0]]
+
+
+def java_cds_archive_path():
+    """The path of the class-data-sharing archive for the JDK on the PATH,
+       or None if there's no JDK. [Shared with the programming_contest_problem template.]
+    """
+    java = shutil.which('java')
+    if java is None:
+        return None
+    java = os.path.realpath(java)
+    return os.path.join(JAVA_CDS_DIR, BuildCache.key(java, str(os.stat(java).st_mtime_ns)) + '.jsa')
+
+
+def run_build(command, build_dir, stdin=subprocess.DEVNULL):
+    """Run the given build command in build_dir, with the given stdin, and
+       return its output, or None if it failed or took more than
+       BUILD_TIMEOUT secs.
+    """
+    try:
+        process = subprocess.Popen(command, cwd=build_dir, stdin=stdin, stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT, universal_newlines=True, start_new_session=True)
+    except OSError:
+        return None
+    try:
+        output = process.communicate(timeout=BUILD_TIMEOUT)[0]
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)  # The compiler's children too
+        process.communicate()
+        return None
+    return output if process.returncode == 0 else None
+
+
+def run_sandboxed_build(command, build_dir, language=None):
+    """Run the given command, which builds sources from a request, as
+       run_build does but as SANDBOX_USER with SANDBOX_LIMITS (and the memory
+       limit unless the language is Java), so that the build can read only
+       what every user can and can't exhaust the host. The build directory and
+       its contents are first made accessible to that user.
+    """
+    os.chmod(build_dir, 0o777)
+    for filename in os.listdir(build_dir):
+        path = os.path.join(build_dir, filename)
+        os.chmod(path, 0o755 if os.path.isdir(path) else 0o644)
+    limits = SANDBOX_LIMITS + ([] if language == 'java' else [SANDBOX_MEMORY_LIMIT])
+    return run_build(SANDBOX_COMMAND + ['prlimit'] + limits + ['--'] + command, build_dir)
+
+
+def build_validator(request, build_dir):
+    """Build the validator in the given request, which is its zip file, as
+       the template would. Only validators consisting of a single C++ source
+       file (no build script) are built.
+    """
+    validator_zip = base64.b64decode(request['zip'])
+    zip_hash = hashlib.sha256(validator_zip).hexdigest()
+    cache_key = BuildCache.key(zip_hash, ' '.join(VALIDATOR_CPP_FLAGS), json.dumps(host_build_info(), sort_keys=True))
+    cache = BuildCache(VALIDATOR_CACHE_DIR, MAX_VALIDATOR_CACHE_ENTRIES)
+    if cache.contains(cache_key):
+        return
+    with ZipFile(io.BytesIO(validator_zip)) as zip_file:
+        if sum(info.file_size for info in zip_file.infolist()) > MAX_EXTRACTED_BYTES:
+            raise BadRequest("validator zip is too big")
+        zip_file.extractall(build_dir)
+    filenames = os.listdir(build_dir)
+    cpp_filenames = [filename for filename in filenames if filename.endswith('.cpp') or filename.endswith('.cc')]
+    if 'build' in filenames or len(cpp_filenames) != 1 or any(filename.endswith('.py') for filename in filenames):
+        raise BadRequest("validator isn't a single C++ source file")
+    with open(os.path.join(build_dir, 'optionalhack.h'), 'w') as outfile:
+        outfile.write('#include <optional>\n')
+    if run_sandboxed_build(['g++', cpp_filenames[0]] + VALIDATOR_CPP_FLAGS + ['-o', 'run'], build_dir) is None:
+        raise BadRequest("validator build failed")
+    cache.put(cache_key, build_dir, ['run'])
+
+
+def build_java_cds(request, build_dir):
+    """Build the class-data-sharing archive for the template's
+       java_cds_flags. The classes loaded by javac compiling a training
+       program, and by running it, are dumped to a static archive. Only JDK
+       classes are included, so the archive is valid whatever the classpath.
+       On failure, archive.failed is created instead, so that jobs stop
+       asking for it.
+    """
+    archive = java_cds_archive_path()
+    if archive is None:
+        raise BadRequest("there's no JDK")
+    if os.path.exists(archive) or os.path.exists(archive + '.failed'):
+        return
+    with open(os.path.join(build_dir, JAVA_CDS_TRAINING_CLASS + '.java'), 'w') as outfile:
+        outfile.write(JAVA_CDS_TRAINING_SOURCE)
+    with open(os.path.join(build_dir, 'input.txt'), 'w') as outfile:
+        outfile.write('3\n3 1 3\n')
+    built = run_build(['javac', '-J-Xss64m', '-J-Xmx4g', '-J-XX:DumpLoadedClassList=javac.classlist',
+                       '-Xlint:-unchecked', JAVA_CDS_TRAINING_CLASS + '.java'], build_dir) is not None
+    if built:
+        with open(os.path.join(build_dir, 'input.txt')) as stdin:
+            built = run_build(['java', '-Xss64m', '-Xmx800m', '-XX:DumpLoadedClassList=java.classlist',
+                               JAVA_CDS_TRAINING_CLASS], build_dir, stdin) is not None
+    if built:
+        classes = {}  # Used as an ordered set
+        for classlist in ['javac.classlist', 'java.classlist']:
+            with open(os.path.join(build_dir, classlist)) as infile:
+                for line in infile:
+                    if line.startswith(JDK_CLASS_PREFIXES):
+                        classes[line.split()[0]] = None
+        with open(os.path.join(build_dir, 'all.classlist'), 'w') as outfile:
+            outfile.write(''.join(classname + '\n' for classname in classes))
+        built = run_build(['java', '-Xshare:dump', '-Xmx800m', '-XX:SharedClassListFile=all.classlist',
+                           '-XX:SharedArchiveFile=archive.jsa'], build_dir) is not None
+    if not built:
+        open(archive + '.failed', 'w').close()
+        raise BadRequest("the archive couldn't be built")
+    temp_path = os.path.join(JAVA_CDS_DIR, '.' + os.path.basename(archive))
+    shutil.copy(os.path.join(build_dir, 'archive.jsa'), temp_path)
+    os.chmod(temp_path, 0o644)
+    os.rename(temp_path, archive)
+
+
+def build_compile(request, build_dir):
+    """Compile the submission in the given request (its language, sources
+       and compile flags) as the template would, caching the files the
+       compile creates if it's clean (no compiler output).
+    """
+    language, options = request['language'], request['options']
+    filenames = [filename for filename, _ in request['sources']]
+    sources = [base64.b64decode(source) for _, source in request['sources']]
+    if language not in COMPILED_LANGUAGES:
+        raise BadRequest(f"can't compile {language}")
+    if not filenames or not all(SOURCE_FILENAME_PATTERN.match(filename) for filename in filenames):
+        raise BadRequest("bad source filename")
+    if sorted(options) != sorted(COMPILE_FLAG_PARAMS) or not all(
+            SAFE_FLAG_PATTERN.match(flag) for name in COMPILE_FLAG_PARAMS for flag in options[name].split()):
+        raise BadRequest("bad compile flags")
+    command = compile_command(language, filenames, options)
+    cache_key = BuildCache.key(language, ' '.join(command), program_identity(command[0]), *sources)
+    cache = BuildCache(COMPILE_CACHE_DIR, MAX_COMPILE_CACHE_ENTRIES, MAX_COMPILE_CACHE_BYTES)
+    if cache.contains(cache_key):
+        return
+    for filename, source in zip(filenames, sources):
+        with open(os.path.join(build_dir, filename), 'wb') as outfile:
+            outfile.write(source)
+    if run_sandboxed_build(command, build_dir, language) != '':
+        raise BadRequest("compile failed or wasn't clean")
+    cache.put(cache_key, build_dir, sorted(set(os.listdir(build_dir)) - set(filenames)))
+
+
+def record_test_stats(request, build_dir):
+    """Add the outcomes in the given request, a list of (test name, failed,
+       cpu_secs), to the statistics for its problem (see the template's
+       TestStats). Updates are serialised with flock, so that multiple
+       workers don't lose each other's, and are written atomically.
+    """
+    problem, outcomes = request['problem'], request['outcomes']
+    if not isinstance(problem, str) or not PROBLEM_KEY_PATTERN.match(problem):
+        raise BadRequest("bad problem key")
+    if not all(isinstance(name, str) and isinstance(failed, bool) and isinstance(cpu_secs, (int, float))
+               and 0 <= cpu_secs for name, failed, cpu_secs in outcomes):
+        raise BadRequest("bad test outcomes")
+    path = os.path.join(TEST_STATS_DIR, problem + '.json')
+    with open(os.path.join(TEST_STATS_DIR, '.lock'), 'w') as lockfile:
+        fcntl.flock(lockfile, fcntl.LOCK_EX)
+        try:
+            with open(path) as infile:
+                stats = json.load(infile)
+        except (FileNotFoundError, ValueError):
+            stats = {}
+        for name, failed, cpu_secs in outcomes:
+            runs, failures, total_cpu_secs = stats.get(name, [0, 0, 0])
+            stats[name] = [runs + 1, failures + failed, total_cpu_secs + cpu_secs]
+        temp_path = os.path.join(TEST_STATS_DIR, '.' + problem + '.json')
+        with open(temp_path, 'w') as outfile:
+            json.dump(stats, outfile)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+
+
+BUILDERS = {'validator': build_validator, 'java_cds': build_java_cds, 'compile': build_compile,
+            'test_stats': record_test_stats}
+
+
+def read_request(path):
+    """The request (a dictionary) in the given file, which mustn't be a
+       symbolic link or bigger than MAX_REQUEST_BYTES.
+    """
+    with open(os.open(path, os.O_RDONLY | os.O_NOFOLLOW)) as infile:
+        if os.fstat(infile.fileno()).st_size > MAX_REQUEST_BYTES:
+            raise BadRequest("request is too big")
+        request = json.load(infile)
+    if not isinstance(request, dict) or request.get('kind') not in BUILDERS:
+        raise BadRequest("unknown kind of request")
+    return request
+
+
+def prepare_cache_dirs():
+    """Create the request and cache directories with the right modes, as the
+       worker's user. Raise RuntimeError if any already exists but belongs to
+       another user, who could then tamper with the caches.
+    """
+    for path, mode in [(CACHE_ROOT, CACHE_DIR_MODE), (BUILD_REQUEST_DIR, BUILD_REQUEST_MODE),
+                       (VALIDATOR_CACHE_DIR, CACHE_DIR_MODE), (JAVA_CDS_DIR, CACHE_DIR_MODE),
+                       (COMPILE_CACHE_DIR, CACHE_DIR_MODE), (TEST_STATS_DIR, CACHE_DIR_MODE),
+                       (BUILD_DIR, BUILD_DIR_MODE)]:
+        os.makedirs(path, exist_ok=True)
+        if os.stat(path).st_uid != os.getuid():
+            raise RuntimeError(f"{path} belongs to another user. Delete it and restart the worker.")
+        os.chmod(path, mode)
+
+
+def process_build_requests():
+    """Process all requests currently in BUILD_REQUEST_DIR, oldest first,
+       deleting each. Requests are claimed by renaming, so multiple workers
+       can share the directory. Return the number of requests processed.
+    """
+    try:
+        filenames = os.listdir(BUILD_REQUEST_DIR)
+    except FileNotFoundError:
+        return 0
+    paths = []
+    for filename in filenames:
+        path = os.path.join(BUILD_REQUEST_DIR, filename)
+        try:
+            if filename.endswith('.json'):
+                paths.append((os.lstat(path).st_mtime, path))
+            elif filename.endswith('.tmp') and os.lstat(path).st_mtime < time.time() - STALE_REQUEST_SECS:
+                os.remove(path)  # Abandoned by a job that was killed while writing it
+        except FileNotFoundError:
+            pass
+    num_done = 0
+    for _, path in sorted(paths):
+        claimed = path + '.claimed'
+        try:
+            os.rename(path, claimed)
+        except OSError:
+            continue  # Another worker got there first
+        build_dir = tempfile.mkdtemp(dir=BUILD_DIR)
+        try:
+            request = read_request(claimed)
+            BUILDERS[request['kind']](request, build_dir)
+            num_done += 1
+        except Exception as e:
+            print(f"Failed to process build request {path}: {e}")
+        finally:
+            shutil.rmtree(build_dir, ignore_errors=True)
+            if os.path.lexists(claimed):
+                os.remove(claimed)
+    return num_done
+
+
+def main():
+    if os.getuid() == 0:
+        sys.exit("Run the build cache worker as a dedicated user, not root")
+    once = '--once' in sys.argv[1:]
+    prepare_cache_dirs()
+    while True:
+        num_done = process_build_requests()
+        if once:
+            print(f"Processed {num_done} build request(s)")
+            break
+        if num_done == 0:
+            time.sleep(POLL_INTERVAL)
+
+
+if __name__ == '__main__':
+    main()
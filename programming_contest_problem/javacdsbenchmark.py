@@ -0,0 +1,69 @@
+"""Measure the JVM startup time saved by the class-data-sharing archive that
+   buildcacheworker.py builds on a Jobe host (in /var/cache/coderunner/java_cds)
+   for the programming_contest_problem template's java_cds_archive parameter,
+   which is off by default until this shows it's worthwhile. Compiles and runs
+   a trivial Java program repeatedly, with and without the archive, and prints
+   the mean wall clock and CPU times per run. Run it on the Jobe host, after
+   the worker has built the archive (which it does when a Java job with
+   java_cds_archive set asks it to).
+"""
+import glob
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+# Must match the template's JAVA_CDS_DIR and java_cds_flags
+JAVA_CDS_DIR = '/var/cache/coderunner/java_cds'
+CDS_FLAGS = ['-Xshare:auto', '-Xlog:disable']
+
+HELLO_JAVA = """import java.util.*;
+
+public class Hello {
+    public static void main(String[] args) {
+        Scanner scanner = new Scanner(System.in);
+        System.out.println("Hello " + scanner.nextLine());
+    }
+}
+"""
+
+
+def children_cpu_time():
+    """Total CPU secs used by all reaped child processes"""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def time_command(command, repetitions):
+    """Return the mean (wall clock secs, CPU secs) of running the given command"""
+    start_time, start_cpu = time.perf_counter(), children_cpu_time()
+    for _ in range(repetitions):
+        subprocess.run(command, input='world\n', universal_newlines=True,
+                       stdout=subprocess.DEVNULL, check=True)
+    return ((time.perf_counter() - start_time) / repetitions,
+            (children_cpu_time() - start_cpu) / repetitions)
+
+
+def main():
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    archives = sorted(glob.glob(os.path.join(JAVA_CDS_DIR, '*.jsa')), key=os.path.getmtime)
+    if not archives:
+        print(f"No archive in {JAVA_CDS_DIR}. Run buildcacheworker.py and grade a Java submission first.")
+        sys.exit(1)
+    cds_flags = [f'-XX:SharedArchiveFile={archives[-1]}'] + CDS_FLAGS
+    os.chdir(tempfile.mkdtemp())
+    with open('Hello.java', 'w') as outfile:
+        outfile.write(HELLO_JAVA)
+    benchmarks = [
+        ('javac', ['javac', '-J-Xss64m', '-J-Xmx4g'], ['-Xlint:-unchecked', 'Hello.java'], ['-J' + flag for flag in cds_flags]),
+        ('java', ['java'], ['-Xss64m', '-Xmx800m', 'Hello'], cds_flags)]
+    print(f"Mean of {repetitions} runs")
+    for name, command, args, flags in benchmarks:
+        without_wall, without_cpu = time_command(command + args, repetitions)
+        with_wall, with_cpu = time_command(command + flags + args, repetitions)
+        print(f"{name:5}: wall {without_wall:.3f}s -> {with_wall:.3f}s, cpu {without_cpu:.3f}s -> {with_cpu:.3f}s "
+              f"({100 * (1 - with_wall / without_wall):.0f}% faster)")
+
+main()
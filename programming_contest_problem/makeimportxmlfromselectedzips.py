@@ -7,9 +7,14 @@ import os
 import base64
 import zipfile
 import json
+import platform
+import subprocess
 import sys
 import io
+import tempfile
 
+# Must match the validator build in the programming_contest_problem template
+VALIDATOR_CPP_FLAGS = ['-std=c++17', '-O3', '-include', 'optionalhack.h']
 
 QUIZ_XML = """<?xml version="1.0" encoding="UTF-8"?>
 <quiz>
@@ -122,6 +127,63 @@ def make_verifier_zip(zippy, verifiers):
         return zip_buffer.getvalue()
         
         
+def host_build_info():
+    """A dictionary describing this host's build environment: the machine
+       type, C library and g++ version. Built binaries are reusable only on
+       hosts with the same build info.
+       [Shared with the programming_contest_problem template.]
+    """
+    try:
+        version = subprocess.run(['g++', '--version'], stdout=subprocess.PIPE,
+                                 universal_newlines=True).stdout.split('\n')[0]
+    except OSError:
+        version = ''
+    return {'machine': platform.machine(),
+            'libc': ' '.join(platform.libc_ver()),
+            'compiler': version}
+
+
+def prebuild_validator(verifier_zip):
+    """Given the contents of a validator zip file, try to build the validator
+       as the template would and, if successful, return the contents of a new
+       zip file that also contains the built binary as prebuilt/run and this
+       host's build info as prebuilt/buildinfo.json. The template uses the
+       prebuilt binary only on Jobe servers with the same build info.
+       Only validators consisting of a single C++ source file (no build
+       script) are prebuilt. Otherwise the original zip is returned.
+    """
+    with tempfile.TemporaryDirectory() as build_dir:
+        with zipfile.ZipFile(io.BytesIO(verifier_zip)) as zip_file:
+            zip_file.extractall(build_dir)
+        filenames = os.listdir(build_dir)
+        cpp_filenames = [filename for filename in filenames if filename.endswith('.cpp') or filename.endswith('.cc')]
+        if 'build' in filenames or len(cpp_filenames) != 1 or any(filename.endswith('.py') for filename in filenames):
+            return verifier_zip
+        with open(os.path.join(build_dir, 'optionalhack.h'), 'w') as outfile:
+            outfile.write('#include <optional>\n')
+        try:
+            build_result = subprocess.run(['g++', cpp_filenames[0]] + VALIDATOR_CPP_FLAGS + ['-o', 'run'],
+                                          cwd=build_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        except OSError:
+            return verifier_zip  # No compiler
+        if build_result.returncode != 0:
+            return verifier_zip
+        with open(os.path.join(build_dir, 'run'), 'rb') as infile:
+            binary = infile.read()
+
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        with zipfile.ZipFile(io.BytesIO(verifier_zip)) as original:
+            for info in original.infolist():
+                zip_file.writestr(info, original.read(info))
+        run_info = zipfile.ZipInfo('prebuilt/run')
+        run_info.external_attr = 0o755 << 16  # Executable
+        run_info.compress_type = zipfile.ZIP_DEFLATED
+        zip_file.writestr(run_info, binary)
+        zip_file.writestr('prebuilt/buildinfo.json', json.dumps(host_build_info()))
+    return zip_buffer.getvalue()
+
+
 def best(solns):
     """Return the best of the set of solutions, with the ordering being
        .py, .cpp, .cc, .java
@@ -159,7 +221,7 @@ def make_question_xml(problem_name, zip_name):
             print(f"Found solution {best_soln.split('/')[-1]} for problem {problem_name}")
             template_params_dict["answer_language"] = 'pypy3' if language == 'python3' else language
         if verifiers:
-            verifier = make_verifier_zip(zippy, verifiers)
+            verifier = prebuild_validator(make_verifier_zip(zippy, verifiers))
             encoded_verifier = base64.b64encode(verifier).decode('utf-8')
             validator_name = 'output_validator.zip'
             files.append((validator_name, encoded_verifier))
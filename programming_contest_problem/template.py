@@ -7,13 +7,28 @@
 
 import subprocess
 import re
+import base64
+import contextlib
+import hashlib
+import io
 import json
+import locale
 import os
+import platform
+import resource
+import selectors
+import shutil
+import signal
+import socket
+import tempfile
+import time
 import sys
 import os.path
 import urllib.parse
+import uuid
 from collections import defaultdict
 from enum import Enum
+from itertools import zip_longest
 from random import randint
 from zipfile import ZipFile
 
@@ -24,16 +39,36 @@ MEMLIMIT = 4000000          # Max k-bytes for stack and data segments
 TICKS_PER_SEC = os.sysconf(os.sysconf_names['SC_CLK_TCK'])
 PID = os.getpid()
 VALIDATOR_FILENAME = 'validator_from_archive.zip'
+VALIDATOR_CPP_FLAGS = ['-std=c++17', '-O3', '-include', 'optionalhack.h']
+CACHE_ROOT = '/var/cache/coderunner'  # Host-wide caches, written only by buildcacheworker.py
+BUILD_REQUEST_DIR = os.path.join(CACHE_ROOT, 'requests')  # Where jobs ask the worker to build something
+BUILD_REQUEST_MODE = 0o1733
+VALIDATOR_CACHE_DIR = os.path.join(CACHE_ROOT, 'validators')  # Built validators, shared by all jobs on this host
+COMPILE_CACHE_DIR = os.path.join(CACHE_ROOT, 'compiles')  # Compiled submissions, shared by all jobs on this host
+COMPILE_FLAG_PARAMS = ['cflags', 'cldflags', 'cppflags']  # The parameters that compile_command uses
+TEST_STATS_DIR = os.path.join(CACHE_ROOT, 'test_stats')  # Per-problem test failure statistics, shared by all jobs on this host
+PIPE_CHUNK_SIZE = 65536     # Max bytes per read from or write to a test's pipes
+ENCODING = locale.getpreferredencoding(False)
+JAVA_HARNESS_CLASS = '__TestHarness'
+JAVA_HARNESS_FILES = ['__stdin__.txt', '__stdout__.txt', '__stderr__.txt']  # Per-test I/O of the harness JVM
+JAVA_CDS_DIR = os.path.join(CACHE_ROOT, 'java_cds')  # Class-data-sharing archives of JDK classes, one per JDK on this host
+FORK_SERVER_FILENAME = '__forkserver__.py'
 
 KNOWN_PARAMS = {
     "answer_language": "cpp",   # Used only by validator - ignore it
     "cflags": "-std=gnu17 -w -O2",
     "cppflags": "-std=gnu++17 -w -O2",
     "cldflags": "-lm",
+    "compile_cache": True,     # True to reuse the compiled program when the same code is resubmitted
     "float_tolerance": None,   # Hacked up attempt to mimic domjudge
     "fsizelimit": 8192,        # Maximum output (incl. stdout) file size (512byte blocks)
+    "java_cds_archive": False, # True to start javac and java with the host's class-data-sharing archive
+    "java_test_harness": True, # True to run Java tests in one JVM (when tests aren't run in parallel)
+    "max_parallel_tests": 1,   # Maximum number of tests to run concurrently (limited to the number of cores)
+    "order_by_failures": False, # True to run the secret tests most likely to fail quickly first (an order that depends on the host's history)
     "pertest_timeout": None,   # Timeout (cpu secs) on each test (actual default is 10 secs).
     "problem_spec_filename": "", # Name of file containing problem spec
+    "python_fork_server": True, # True to fork python3/pypy3 tests from one interpreter (when tests aren't run in parallel)
     "programming_contest_problem": True,  # We wouldn't be here without this one!
     "result_table_header": 'Sample test case results (all other tests are hidden)',   # Header to display above result table.
     "show_first_fail": False,  # True to display the first failing test.
@@ -83,15 +118,582 @@ def process_cpu_time():
         cpu_times = map(int, infile.readline().split()[14:18])
         return sum(cpu_times) / TICKS_PER_SEC
 
+def raise_stack_limit():
+    """Raise this process's soft stack limit to its hard limit (normally
+       unlimited), so every program it starts has a large stack. This can't
+       be done with prlimit once a program has started, because the kernel
+       lays out a program's address space according to the stack limit when
+       it's exec'd: with the usual 8 MB limit, the stack can grow only a
+       little beyond that before it runs into the memory-mapped area.
+    """
+    _, hard = resource.getrlimit(resource.RLIMIT_STACK)
+    try:
+        resource.setrlimit(resource.RLIMIT_STACK, (hard, hard))
+    except (ValueError, OSError):
+        pass
+
+def iter_byte_lines(stream):
+    """Generate the lines of the given binary stream one at a time, each with
+       trailing white space removed, omitting any blank lines at the end.
+       Lines end with a newline byte (a preceding carriage return is trailing white space).
+    """
+    num_blank_lines = 0  # Number of blank lines pending
+    for line in stream:
+        line = line.rstrip()
+        if line:
+            yield from [b''] * num_blank_lines
+            num_blank_lines = 0
+            yield line
+        else:
+            num_blank_lines += 1
+
+
+def host_build_info():
+    """A dictionary describing this host's build environment: the machine
+       type, C library and g++ version. Built binaries are reusable only on
+       hosts with the same build info.
+       [Shared with makeimportxmlfromselectedzips.py.]
+    """
+    try:
+        version = subprocess.run(['g++', '--version'], stdout=subprocess.PIPE,
+                                 universal_newlines=True).stdout.split('\n')[0]
+    except OSError:
+        version = ''
+    return {'machine': platform.machine(),
+            'libc': ' '.join(platform.libc_ver()),
+            'compiler': version}
+
+
+class BuildCache:
+    """A directory-per-entry cache of build products on the Jobe host,
+       shared by all jobs. Entries are addressed by a hash of everything that
+       determines the build (see key). Jobs run as the same users as the
+       submissions, so they only read the caches under CACHE_ROOT, which are
+       written by buildcacheworker.py: a job that misses asks the worker to
+       build the entry (see request_build). Caching is best effort: any
+       failure just behaves as a cache miss.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def key(*parts):
+        """The cache key for a build determined by the given parts (strs or bytes).
+           [Shared with buildcacheworker.py.]
+        """
+        digest = hashlib.sha256()
+        for part in parts:
+            data = part if isinstance(part, bytes) else str(part).encode()
+            digest.update(len(data).to_bytes(8, 'little') + data)
+        return digest.hexdigest()
+
+    def trusted(self):
+        """True if the cache directory and its parent exist and can't have
+           been written by a job: they belong to another user (the worker's)
+           and only that user can write them.
+        """
+        try:
+            for path in [self.cache_dir, os.path.dirname(self.cache_dir)]:
+                stat = os.stat(path)
+                if stat.st_uid == os.getuid() or stat.st_mode & 0o022:
+                    return False
+            return True
+        except OSError:
+            return False
+
+    def get(self, key, dest_dir, filenames=None):
+        """Copy the cached build products for the given key into dest_dir,
+           which is created if necessary. If a list of filenames is given,
+           only those files are copied. Return True on success, False if
+           there's no such entry or the cache isn't trusted.
+        """
+        path = os.path.join(self.cache_dir, key)
+        if not self.trusted():
+            return False
+        try:
+            if filenames is None:
+                shutil.copytree(path, dest_dir, dirs_exist_ok=True)
+            else:
+                os.makedirs(dest_dir, exist_ok=True)
+                for filename in filenames:
+                    shutil.copy(os.path.join(path, filename), dest_dir)
+            return True
+        except OSError:
+            return False
+
+
+def request_build(request):
+    """Ask buildcacheworker.py to build something for a host-wide cache, by
+       writing the given request (a dictionary) as JSON to BUILD_REQUEST_DIR.
+       Does nothing if the worker hasn't set that directory up. A job that
+       missed the cache will have built the same thing itself, so it doesn't
+       wait for the worker.
+    """
+    try:
+        if os.stat(BUILD_REQUEST_DIR).st_mode & 0o7777 != BUILD_REQUEST_MODE:
+            return
+        filename = os.path.join(BUILD_REQUEST_DIR, uuid.uuid4().hex + '.json')
+        with open(filename + '.tmp', 'w') as outfile:
+            json.dump(request, outfile)
+        os.chmod(filename + '.tmp', 0o644)  # For the worker, which doesn't own it
+        os.replace(filename + '.tmp', filename)  # Atomic, so the worker never sees a partial request
+    except OSError:
+        pass
+
+
+class TestStats:
+    """The failure statistics of the tests of a problem, accumulated over all
+       submissions graded on the Jobe host, in a JSON file in TEST_STATS_DIR
+       mapping each test name to [runs, failures, cpu_secs]. As with the
+       build caches, jobs only read the statistics, and buildcacheworker.py
+       adds the outcomes that jobs send it. Failures to read or record just
+       lose statistics.
+    """
+    def __init__(self, tests):
+        """The statistics for the problem with the given list of ZipTests,
+           identified by the tests' names and data CRCs.
+        """
+        parts = []
+        for test in tests:
+            parts.append(test.name)
+            for filename in [test.input_filename, test.output_filename]:
+                parts.append(test.zipfile.getinfo(filename).CRC if filename else '')
+        self.problem = BuildCache.key(*parts)
+        self.path = os.path.join(TEST_STATS_DIR, self.problem + '.json')
+
+    def load(self):
+        """Return the statistics as a dictionary (empty if there are none or
+           they could have been written by a job)
+        """
+        if not BuildCache(TEST_STATS_DIR).trusted():
+            return {}
+        try:
+            with open(self.path) as infile:
+                return json.load(infile)
+        except (OSError, ValueError):
+            return {}
+
+    def record(self, outcomes):
+        """Ask buildcacheworker.py to add the given list of (test name,
+           failed, cpu_secs) outcomes
+        """
+        request_build({'kind': 'test_stats', 'problem': self.problem, 'outcomes': outcomes})
+
+
+def program_identity(program):
+    """A str identifying the installed version of the given program (e.g. a
+       compiler) on the PATH: its real path, size and modification time,
+       which change whenever it's upgraded. That's much cheaper than running
+       it to ask its version.
+    """
+    path = shutil.which(program)
+    if path is None:
+        return ''
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    return f'{path}:{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def compile_command(language, filenames, options):
+    """The command to compile the given source files (the main one first)
+       in the given language (c, cpp, java or csharp), with the flags in the
+       given dictionary of options (see COMPILE_FLAG_PARAMS).
+       [Shared with buildcacheworker.py.]
+    """
+    basename = filenames[0].rsplit('.', 1)[0]
+    if language == 'c':
+        return ['gcc'] + options['cflags'].split() + ['-o', basename, filenames[0]] + options['cldflags'].split()
+    elif language == 'cpp':
+        return ['g++'] + options['cppflags'].split() + ['-o', basename, filenames[0]]
+    elif language == 'java':
+        return ['javac', '-J-Xss64m', '-J-Xmx4g', '-Xlint:-unchecked'] + filenames
+    else:
+        return ['mcs', filenames[0]]
+
+
 def htmlise(s):
     """Convert newlines to <br> and tweak '<'"""
     return s.replace("<", "&lt;").replace("\n", "<br>")
 
 
+class ZipTest:
+    """A test in a DOMjudge problem archive. The test data isn't read until
+       it's needed and is then streamed from the archive as bytes, so the
+       whole archive never has to be held in memory.
+    """
+    def __init__(self, zipfile, name, is_sample, input_filename, output_filename):
+        self.zipfile = zipfile
+        self.name = name
+        self.is_sample = is_sample
+        self.input_filename = input_filename    # None if there's no input file
+        self.output_filename = output_filename  # None if there's no output file
+
+    def open_member(self, filename):
+        """A binary stream of the contents of the given archive member"""
+        return self.zipfile.open(filename) if filename else io.BytesIO()
+
+    def open_input(self):
+        """A binary stream of the test's standard input"""
+        return self.open_member(self.input_filename)
+
+    def open_expected(self):
+        """A binary stream of the test's expected output"""
+        return self.open_member(self.output_filename)
+
+    def preview(self, filename):
+        """The start of the given member's contents as a str, long enough for
+           Results.table_cell to display it exactly as it would the whole.
+        """
+        with self.open_member(filename) as infile:
+            data = infile.read(4 * (MAX_STRING_LENGTH + 1))  # At most 4 bytes per UTF-8 char
+        return data.decode('utf-8', errors='replace')[:MAX_STRING_LENGTH + 1]
+
+    def input_preview(self):
+        return self.preview(self.input_filename)
+
+    def expected_preview(self):
+        return self.preview(self.output_filename)
+
+
+# The harness for running all the tests of a Java submission in a single
+# JVM, to avoid the JVM startup and JIT warm-up costs on every test. For each
+# line n read from stdin, it runs the submission's main with System.in/out/err
+# redirected to the files given on the command line, in a fresh class loader
+# (so static state is reset) and with a CPU limit of n secs, then replies with
+# a line OK or FAILED. If the limit is reached it replies TIMEOUT and halts.
+JAVA_HARNESS_SOURCE = r"""
+import java.io.*;
+import java.lang.management.ManagementFactory;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.net.URL;
+import java.net.URLClassLoader;
+
+public class __TestHarness {
+    private static final com.sun.management.OperatingSystemMXBean OS =
+        (com.sun.management.OperatingSystemMXBean) ManagementFactory.getOperatingSystemMXBean();
+
+    public static void main(String[] args) throws Exception {
+        String className = args[0];
+        // Commands and replies have pipes of their own (fds args[1] and args[2]),
+        // so fds 0, 1 and 2, which are the per-test files, are all the test's.
+        BufferedReader commands = new BufferedReader(new InputStreamReader(new FileInputStream("/dev/fd/" + args[1])));
+        PrintStream replies = new PrintStream(new FileOutputStream("/dev/fd/" + args[2]), true);
+        URL[] classPath = new URL[] {new File(".").toURI().toURL()};
+        String line;
+        while ((line = commands.readLine()) != null) {
+            long cpuLimit = Long.parseLong(line.trim()) * 1000000000L;
+            long cpuStart = OS.getProcessCpuTime();
+            // As the JVM sets up System.in, System.out and System.err.
+            PrintStream out = new PrintStream(new BufferedOutputStream(new FileOutputStream(FileDescriptor.out), 128), true);
+            PrintStream err = new PrintStream(new BufferedOutputStream(new FileOutputStream(FileDescriptor.err), 128), true);
+            InputStream in = new BufferedInputStream(new FileInputStream(FileDescriptor.in));
+            System.setIn(in);
+            System.setOut(out);
+            System.setErr(err);
+            String verdict = "OK";
+            try (URLClassLoader loader = new URLClassLoader(classPath, ClassLoader.getPlatformClassLoader())) {
+                Method main = loader.loadClass(className).getMethod("main", String[].class);
+                Throwable[] failure = new Throwable[1];
+                ThreadGroup group = new ThreadGroup("test");
+                Thread thread = new Thread(group, () -> {
+                    try {
+                        main.invoke(null, (Object) new String[0]);
+                    } catch (InvocationTargetException e) {
+                        failure[0] = e.getCause();
+                    } catch (Throwable e) {
+                        failure[0] = e;
+                    }
+                }, "main", 0);  // 0 for the -Xss stack size, as for the launcher's main thread
+                thread.setContextClassLoader(loader);
+                thread.start();
+                while (!finished(thread, group)) {
+                    if (OS.getProcessCpuTime() - cpuStart > cpuLimit) {
+                        out.flush();
+                        err.flush();
+                        replies.println("TIMEOUT");
+                        replies.flush();
+                        Runtime.getRuntime().halt(1);
+                    }
+                }
+                if (failure[0] != null) {
+                    verdict = "FAILED";
+                }
+            } catch (Throwable e) {  // No usable main method
+                verdict = "FAILED";
+            }
+            out.flush();  // Not closed, as that would close fds 1 and 2
+            err.flush();
+            replies.println(verdict);
+        }
+    }
+
+    // Wait briefly for the test's threads. True once the main thread and all
+    // other non-daemon threads have ended, which is when a JVM would exit.
+    private static boolean finished(Thread main, ThreadGroup group) throws InterruptedException {
+        Thread[] threads = new Thread[group.activeCount() + 1];
+        int count = group.enumerate(threads);
+        for (int i = 0; i < count; i++) {
+            if (threads[i] == main || !threads[i].isDaemon()) {
+                threads[i].join(10);
+                return false;
+            }
+        }
+        return true;
+    }
+}
+"""
+
+def java_cds_flags():
+    """Return the JVM options for using this host's class-data-sharing
+       (AppCDS) archive of the JDK classes loaded by javac and by typical
+       submissions, which cuts JVM startup time. The archive is built, once
+       per JDK, by buildcacheworker.py, out of band: if it isn't there yet,
+       the worker is asked to build it. Return [] if there's no usable
+       archive. Unified logging is disabled, so that a JVM that can't use
+       the archive doesn't warn and nothing is added to the program's output.
+    """
+    try:
+        archive = java_cds_archive_path()
+        if archive is None:
+            return []
+        if not os.path.exists(archive):
+            if not os.path.exists(archive + '.failed'):
+                request_build({'kind': 'java_cds'})
+            return []
+        if not BuildCache(JAVA_CDS_DIR).trusted():
+            return []
+    except OSError:
+        return []
+    return [f'-XX:SharedArchiveFile={archive}', '-Xshare:auto', '-Xlog:disable']
+
+
+def java_cds_archive_path():
+    """The path of the class-data-sharing archive for the JDK on the PATH,
+       or None if there's no JDK. [Shared with buildcacheworker.py.]
+    """
+    java = shutil.which('java')
+    if java is None:
+        return None
+    java = os.path.realpath(java)
+    return os.path.join(JAVA_CDS_DIR, BuildCache.key(java, str(os.stat(java).st_mtime_ns)) + '.jsa')
+
+# The fork server for running the tests of a python3 or pypy3 submission
+# without starting a new interpreter for each. Run as
+#     python3 __forkserver__.py prog.py socket_fd
+# it imports nothing that the interpreter doesn't already need and, for
+# each request received on the socket (the limits as "resource value ..."
+# with the stdin, stdout and stderr fds attached), forks a child to run the
+# program as a fresh interpreter would. It replies with the child's pid
+# and then with its wait status and CPU secs used, when it has ended.
+# The program is compiled and exec'd in a new __main__ module rather than
+# with runpy, whose lazy imports would otherwise be repeated in every child.
+FORK_SERVER_SOURCE = r"""
+import builtins
+import gc
+import os
+import resource
+import socket
+import sys
+
+
+def run_child(script, fds, limits):
+    program = os.path.abspath(script)
+    os.setsid()
+    for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+        os.close(fd)
+    for limit, value in limits:
+        try:
+            resource.setrlimit(limit, (value, value))
+        except (ValueError, OSError):
+            pass
+    sys.argv = [script]
+    main = type(sys)('__main__')
+    main.__file__ = program
+    main.__builtins__ = builtins
+    sys.modules['__main__'] = main
+    try:
+        with open(program, 'rb') as infile:
+            code = compile(infile.read(), program, 'exec')
+        exec(code, main.__dict__)
+    except SystemExit:
+        raise
+    except BaseException as exception:
+        traceback = exception.__traceback__
+        while traceback is not None and traceback.tb_frame.f_code.co_filename != program:
+            traceback = traceback.tb_next  # Omit the server's frames
+        exception.__traceback__ = traceback  # Used in preference to the excepthook parameter by some versions
+        sys.excepthook(type(exception), exception, traceback)
+        sys.exit(1)
+    sys.exit(0)
+
+
+def main():
+    script = sys.argv[1]
+    server = socket.socket(fileno=int(sys.argv[2]))
+    if hasattr(gc, 'freeze'):
+        gc.freeze()  # Saves the children copying the pages of objects the collector would visit
+    while True:
+        message, fds, _, _ = socket.recv_fds(server, 4096, 3)
+        if not message:
+            break
+        values = [int(value) for value in message.split()]
+        pid = os.fork()
+        if pid == 0:
+            server.close()
+            run_child(script, fds, list(zip(values[0::2], values[1::2])))
+        for fd in fds:
+            os.close(fd)
+        server.sendall(b'%d\n' % pid)
+        _, status, rusage = os.wait4(pid, 0)
+        server.sendall(b'%d %f\n' % (status, rusage.ru_utime + rusage.ru_stime))
+
+main()
+"""
+
+
+def running_cpu_time(process):
+    """The CPU secs used by the given running (so unreaped) child process
+       and its reaped children, none of which process_cpu_time includes.
+    """
+    try:
+        with open(f"/proc/{process.pid}/stat") as infile:
+            fields = infile.readline().rsplit(')', 1)[1].split()
+    except OSError:
+        return 0
+    return sum(int(field) for field in fields[11:15]) / TICKS_PER_SEC  # utime, stime, cutime, cstime
+
+
+class JavaHarness:
+    """A running Java test harness (see JAVA_HARNESS_SOURCE) for the given
+       command, which must be of the form [java, ..., JAVA_HARNESS_CLASS,
+       classname]. The harness's stdin, stdout and stderr are the files
+       JAVA_HARNESS_FILES, which are rewritten for each test, and it takes
+       commands and sends replies through pipes of its own.
+    """
+    def __init__(self, command):
+        stdin_filename, stdout_filename, stderr_filename = JAVA_HARNESS_FILES
+        self.fds = [os.open(stdin_filename, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)]
+        for filename in [stdout_filename, stderr_filename]:
+            # Appending, so that the harness writes from the start after each truncation
+            self.fds.append(os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND, 0o644))
+        command_read, self.commands = os.pipe()
+        self.replies, reply_write = os.pipe()
+        self.process = subprocess.Popen(
+            command + [str(command_read), str(reply_write)],
+            stdin=self.fds[0],
+            stdout=self.fds[1],
+            stderr=self.fds[2],
+            pass_fds=[command_read, reply_write],
+            start_new_session=True)
+        os.close(command_read)
+        os.close(reply_write)
+        self.cpu_start = 0
+
+    def start(self, stdin, timeout):
+        """Start a test with the given binary stdin stream and CPU timeout.
+           Return False if the harness has failed.
+        """
+        for fd in self.fds:
+            os.ftruncate(fd, 0)
+        os.lseek(self.fds[0], 0, os.SEEK_SET)
+        with open(self.fds[0], 'wb', closefd=False) as outfile:
+            shutil.copyfileobj(stdin, outfile)
+        os.lseek(self.fds[0], 0, os.SEEK_SET)  # Shared with the harness's stdin
+        self.cpu_start = running_cpu_time(self.process)
+        try:
+            os.write(self.commands, f'{timeout}\n'.encode())
+            return True
+        except BrokenPipeError:
+            return False
+
+    def wait(self, wall_timeout):
+        """Wait at most wall_timeout secs for the started test to end. Return
+           a tuple (verdict, cpu_used) where verdict is the harness's reply
+           (OK, TIMEOUT or FAILED), '' if the harness died or None if it
+           didn't reply in time, and cpu_used is the CPU secs the harness
+           used meanwhile.
+        """
+        reply = b''
+        deadline = time.monotonic() + wall_timeout
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.replies, selectors.EVENT_READ)
+            while not reply.endswith(b'\n'):
+                remaining_secs = deadline - time.monotonic()
+                if remaining_secs <= 0 or not selector.select(remaining_secs):
+                    reply = None
+                    break
+                data = os.read(self.replies, 256)
+                if not data:
+                    break
+                reply += data
+        verdict = None if reply is None else reply.decode(errors='replace').strip()
+        return verdict, running_cpu_time(self.process) - self.cpu_start
+
+    def stop(self):
+        """Kill and reap the harness"""
+        for fd in self.fds + [self.commands, self.replies]:
+            os.close(fd)
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.process.wait()
+
+
+class ForkServer:
+    """A running fork server (see FORK_SERVER_SOURCE) for the given command,
+       which must be of the form [python, FORK_SERVER_FILENAME, program].
+    """
+    def __init__(self, command):
+        self.socket, server_socket = socket.socketpair()
+        self.process = subprocess.Popen(
+            command + [str(server_socket.fileno())],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            pass_fds=[server_socket.fileno()],
+            start_new_session=True)
+        server_socket.close()
+        self.replies = self.socket.makefile('rb')
+
+    def start(self, fds, limits):
+        """Start a run of the program with the given stdin, stdout and stderr
+           fds and the given (resource, value) limits. Return the pid of the
+           child running it, or None if the server has failed.
+        """
+        message = ' '.join(f'{limit} {value}' for limit, value in limits).encode()
+        try:
+            socket.send_fds(self.socket, [message], fds)
+        except OSError:
+            return None
+        reply = self.replies.readline()
+        return int(reply) if reply else None
+
+    def wait(self):
+        """Wait for the started run to end. Return a tuple (wait status, cpu_used)"""
+        reply = self.replies.readline().split()
+        if not reply:  # The server has died, presumably killed along with the child
+            return signal.SIGKILL, 0
+        return int(reply[0]), float(reply[1])
+
+    def stop(self):
+        """Kill and reap the server"""
+        self.replies.close()
+        self.socket.close()
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.process.wait()
+
+
 class TestResult:
-    def __init__(self, state, output):
+    def __init__(self, state, output, cpu_used=0):
         self.state = state
         self.output = output
+        self.cpu_used = cpu_used  # CPU secs used by the run, if known
 
 
 class Results:
@@ -146,6 +748,15 @@ class JobRunner:
     FREE_BOARD_SECS = 2   # Number of seconds freeboard to allow for cleaning up, overheads etc.
     # Default timeout, only if pertest_timeout parameter missing and no domjudge-ini timeout
     DEFAULT_PER_TEST_TIMEOUT = 10
+    # CPU limits are enforced at clock-tick granularity, so a process killed
+    # at its limit can show slightly less than that in its rusage.
+    RUSAGE_CPU_SLACK = 0.1
+    # Lower bound on a test's CPU time when ordering tests, as measured times
+    # of the fastest tests are mostly noise.
+    MIN_TEST_CPU_SECS = 0.01
+    # Wall clock secs allowed per CPU sec of a test's timeout in the Java
+    # test harness, which can't otherwise tell that a test is sleeping.
+    HARNESS_WALL_CLOCK_FACTOR = 3
 
     def __init__(self, student_answer, language, params, tests, timeout):
         self.student_answer = student_answer
@@ -154,11 +765,23 @@ class JobRunner:
         self.tests = tests
         self.timeout = timeout
         self.exec_command = None
+        self.java_harness_command = None  # Command to start the Java test harness, if it's in use
+        self.java_harness = None  # The running JavaHarness
+        self.fork_server_command = None  # Command to start the Python fork server, if it's in use
+        self.fork_server = None  # The running ForkServer
         self.validator = None
+        self.test_outcomes = []  # List of (test name, failed, cpu secs) for the tests graded
+        raise_stack_limit()
         self.setup_validator_if_given()
 
     def setup_validator_if_given(self):
-        """If there is a valid supplied as a zip file, build the validator"""
+        """If there is a valid supplied as a zip file, build the validator.
+           A compiled validator is taken, in order of preference, from a
+           prebuilt binary in the zip (added by makeimportxmlfromselectedzips.py)
+           if it was built on a matching host, from the host's validator build
+           cache, or by building it (after which buildcacheworker.py is asked
+           to add it to the cache).
+        """
         validator_zip_filename = self.params.get('validator_zip_filename', None)
         if validator_zip_filename:
             os.mkdir("Validator")
@@ -175,7 +798,20 @@ class JobRunner:
                 if len(python_filenames) > 1:
                     raise Exception("Validator has more than one python file")
                 # Assume python is the validator
+                os.chdir(cwd)
                 self.validator = os.path.join('Validator', python_filenames[0])
+                return
+
+            build_info = host_build_info()
+            with open(os.path.join(cwd, validator_zip_filename), 'rb') as infile:
+                validator_zip = infile.read()
+            zip_hash = hashlib.sha256(validator_zip).hexdigest()
+            cache_key = BuildCache.key(zip_hash, ' '.join(VALIDATOR_CPP_FLAGS), json.dumps(build_info, sort_keys=True))
+            if self.prebuilt_validator_usable(build_info):
+                shutil.copy('prebuilt/run', 'run')
+                build_result = subprocess.CompletedProcess([], 0, '')
+            elif BuildCache(VALIDATOR_CACHE_DIR).get(cache_key, '.', ['run']):
+                build_result = subprocess.CompletedProcess([], 0, '')
             elif os.path.isfile('build'):
                 build_result = subprocess.run(['/bin/bash', 'build'],
                                           encoding='utf-8',
@@ -184,11 +820,12 @@ class JobRunner:
             elif len(cpp_filenames) == 1:
                 with open('optionalhack.h', 'w') as outfile:
                     outfile.write('#include <optional>\n')
-                build_result = subprocess.run(['/usr/bin/g++',
-                    cpp_filenames[0], '-std=c++17', '-O3', '-include',  'optionalhack.h', '-o', 'run'],
+                build_result = subprocess.run(['/usr/bin/g++', cpp_filenames[0]] + VALIDATOR_CPP_FLAGS + ['-o', 'run'],
                     encoding='utf-8',
                     stdout=subprocess.PIPE,
                     stderr=subprocess.STDOUT)
+                if build_result.returncode == 0:
+                    request_build({'kind': 'validator', 'zip': base64.b64encode(validator_zip).decode('ascii')})
             else:
                 raise Exception("No build file for validator and no (single) cpp source file")
             os.chdir(cwd)
@@ -197,24 +834,66 @@ class JobRunner:
                 self.validator = 'Validator/run'
             else:
                 raise ValidatorBuildFailure(build_result.stdout)
+        if self.validator:
+            os.makedirs('validator_feedback', exist_ok=True)
+
+    @staticmethod
+    def prebuilt_validator_usable(build_info):
+        """True if the current directory (the extracted validator) contains
+           a prebuilt validator, built on a host with the given build info.
+        """
+        try:
+            with open('prebuilt/buildinfo.json') as infile:
+                return os.path.isfile('prebuilt/run') and json.load(infile) == build_info
+        except (OSError, ValueError):
+            return False
 
     def validator_check(self, test, got):
         """Check the answer using a supplied validator. """
-        _, _, stdin, expected = test
-        with open('test_stdin', 'w') as outfile:
-            outfile.write(stdin)
-        with open('test_expected', 'w') as outfile:
-            outfile.write(expected)
+        return self.validator_verdict(self.start_validator(test, got).wait())
+
+    @staticmethod
+    def memory_file(stream):
+        """Return a file descriptor, positioned at the start, for an in-memory
+           (memfd) file containing the contents of the given binary stream.
+           Falls back to an unlinked temporary file if memfd isn't available.
+        """
         try:
-            os.mkdir('validator_feedback')
-        except FileExistsError:
-            pass
-        validator_result = subprocess.run([
-            self.validator, 'test_stdin', 'test_expected', 'validator_feedback'],
-            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, input=got, encoding='utf-8')
-        if validator_result.returncode == 42:
+            fd = os.memfd_create('judgedata')
+        except (AttributeError, OSError):
+            fd, path = tempfile.mkstemp()
+            os.unlink(path)
+        with open(fd, 'wb', closefd=False) as outfile:
+            shutil.copyfileobj(stream, outfile)
+        os.lseek(fd, 0, os.SEEK_SET)
+        return fd
+
+    def start_validator(self, test, got):
+        """Start the validator checking the output got from the given test,
+           as a new session (process group), and return its Popen object.
+           The judge input and answer files are passed as /dev/fd paths to
+           in-memory files, so nothing is written to disk per test.
+        """
+        with test.open_input() as stdin, test.open_expected() as expected:
+            input_fd, expected_fd = self.memory_file(stdin), self.memory_file(expected)
+        got_fd = self.memory_file(io.BytesIO(got.encode('utf-8')))
+        try:
+            return subprocess.Popen(
+                [self.validator, f'/dev/fd/{input_fd}', f'/dev/fd/{expected_fd}', 'validator_feedback'],
+                stdin=got_fd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                pass_fds=(input_fd, expected_fd), start_new_session=True)
+        finally:
+            for fd in (input_fd, expected_fd, got_fd):
+                os.close(fd)
+
+    @staticmethod
+    def validator_verdict(returncode):
+        """True if the given validator returncode means the answer is correct,
+           False if it means it's wrong. Raise ValidatorFailure otherwise.
+        """
+        if returncode == 42:
             return True
-        elif validator_result.returncode == 43:
+        elif returncode == 43:
             #files = os.listdir('validator_feedback')
             #error_out = 'Validator feedback:'
             #for file in files:
@@ -224,10 +903,10 @@ class JobRunner:
             #raise ValidatorFailure(f"Validator said 'No' with output {error_out}")
             return False
         else:
-            raise ValidatorFailure(f"Validator failed with return code {validator_result.returncode}")
+            raise ValidatorFailure(f"Validator failed with return code {returncode}")
 
     def lines_match(self, left, right):
-        """True iff the two strings left and right are equal or if there
+        """True iff the two byte strings left and right are equal or if there
            is a defined float tolerance AND the two lines contains an equal number of
            floats AND the floats match one-for-one within the given tolerance.
         """
@@ -258,42 +937,262 @@ class JobRunner:
            at attempt is made to compare non-matching lines as 
            sequences of space-separated floats, within
            the given tolerance. This is a gross hack. ** TODO ** fix me.
+           Lines are compared as bytes, in step as they're generated, stopping
+           at the first mismatch, so the expected output is streamed from the
+           archive and never decoded.
         """
         if self.validator:
             return self.validator_check(test, got)
         else:
-            _, _, _, expected = test
-            expected_lines = [line.rstrip() for line in expected.rstrip().splitlines()]
-            got_lines = [line.rstrip() for line in got.rstrip().splitlines()]
-            if len(expected_lines) != len(got_lines):
-                return False
-            for left, right in zip(expected_lines, got_lines):
-                if not self.lines_match(left, right):
-                    return False
+            got_lines = iter_byte_lines(io.BytesIO(got.encode('utf-8')))
+            with test.open_expected() as expected:
+                for left, right in zip_longest(iter_byte_lines(expected), got_lines):
+                    if left is None or right is None:
+                        return False  # Different numbers of lines
+                    if not self.lines_match(left, right):
+                        return False
             return True
 
     def test_sequence(self):
         """Return a list of the order in which tests should be performed.
            Namely all sample tests, then all tests listed in show_tests, then
-           everything else.
+           everything else. If order_by_failures is set, everything else is
+           ordered by the tests' past failures (see failure_ordered).
         """
-        shows = [i for i in range(len(self.tests)) if self.tests[i][1]]  # All sample tests
+        shows = [i for i in range(len(self.tests)) if self.tests[i].is_sample]  # All sample tests
         shows += self.params['show_tests']
         rest = sorted(set(range(0, len(self.tests))) - set(shows))
+        if self.params['order_by_failures']:
+            rest = self.failure_ordered(rest)
         return shows + rest
 
-    def get_output(self, stdoutfile, stderrfile):
-        """Read the subprocesses standard output and standard error files"""
-        output = ''
-        with open(stdoutfile) as out:
-            output += out.read()
-        with open(stderrfile) as err:
-            stderr_output = err.read()
-            if stderr_output:
-                spacer = '\n====Output prior to error====\n' if output else ''
-                output = stderr_output + spacer + output
+    def failure_ordered(self, test_indices):
+        """Return the given list of test indices sorted so that the tests that
+           have most often failed, per CPU sec they take, come first. As
+           testing stops at the first failure, this rejects most wrong answers
+           sooner. The failure probability of a test is estimated from its
+           statistics (see TestStats) as (failures + 1) / (runs + 2), so tests
+           that have rarely been run are tried early. A test that has never
+           run is assumed to take the mean CPU time of those that have.
+           Ties keep their given order.
+        """
+        stats = TestStats(self.tests).load()
+        mean_cpu_secs = {name: cpu_secs / runs for name, (runs, _, cpu_secs) in stats.items() if runs}
+        default_cpu_secs = sum(mean_cpu_secs.values()) / len(mean_cpu_secs) if mean_cpu_secs else 0
+
+        def failures_per_cpu_sec(i):
+            name = self.tests[i].name
+            runs, failures, _ = stats.get(name, [0, 0, 0])
+            cpu_secs = max(mean_cpu_secs.get(name, default_cpu_secs), self.MIN_TEST_CPU_SECS)
+            return (failures + 1) / (runs + 2) / cpu_secs
+
+        return sorted(test_indices, key=failures_per_cpu_sec, reverse=True)
+
+    @staticmethod
+    def combined_output(stdout, stderr):
+        """The output to report from a run that gave the given standard output
+           and standard error text.
+        """
+        output = stdout
+        if stderr:
+            spacer = '\n====Output prior to error====\n' if output else ''
+            output = stderr + spacer + output
         return output
 
+    def rlimits(self, timeout):
+        """The list of (resource, value) limits for a run with the given CPU
+           timeout: no core dumps, limited address space (except for Java,
+           which manages its own memory), CPU time and file size. The stack
+           limit isn't included as it must be set before exec (see
+           raise_stack_limit).
+        """
+        limits = [
+            (resource.RLIMIT_CORE, 0),
+            (resource.RLIMIT_CPU, timeout),
+            (resource.RLIMIT_FSIZE, self.params['fsizelimit'] * 1024),  # ulimit -f units
+        ]
+        if self.language != 'java':
+            limits.append((resource.RLIMIT_AS, MEMLIMIT * 1024))
+        return limits
+
+    @contextlib.contextmanager
+    def spawn_limits(self, timeout):
+        """A context within which this process's soft resource limits, other
+           than the CPU limit, are those of a run with the given CPU timeout
+           (see rlimits), so that a program started within it is subject to
+           them from exec. This avoids a preexec_fn, which stops subprocess
+           from using vfork. The CPU limit is left out as this process's own
+           CPU time counts towards it; it's set by apply_limits instead.
+        """
+        saved_limits = []
+        try:
+            for limit, value in self.rlimits(timeout):
+                if limit != resource.RLIMIT_CPU:
+                    soft, hard = resource.getrlimit(limit)
+                    try:
+                        resource.setrlimit(limit, (value, hard))
+                        saved_limits.append((limit, soft, hard))
+                    except (ValueError, OSError):
+                        pass
+            yield
+        finally:
+            for limit, soft, hard in saved_limits:
+                resource.setrlimit(limit, (soft, hard))
+
+    def apply_limits(self, pid, timeout):
+        """Set the resource limits (see rlimits) of the process pid, just
+           started within spawn_limits, for a run with the given CPU timeout.
+           This sets the CPU limit, which applies to all CPU time used since
+           exec, and makes the hard limits equal to the soft ones, so the
+           program can't raise them. Limits that can't be set are ignored,
+           as with bash's ulimit.
+        """
+        for limit, value in self.rlimits(timeout):
+            try:
+                resource.prlimit(pid, limit, (value, value))
+            except (ValueError, OSError):
+                pass
+
+    def run_with_limits(self, stdin, timeout):
+        """Run self.exec_command directly (no shell) with the resource limits
+           (see apply_limits) for the given CPU timeout, feeding it the given
+           binary stdin stream and capturing its stdout and stderr through
+           pipes (see capture_output). Return a tuple (stdout, stderr,
+           returncode, cpu_used) where returncode is as for subprocess
+           (negative for a signal) and cpu_used is the CPU secs used, from
+           the program's rusage.
+           If the Python fork server is in use, the run is forked from that.
+        """
+        if self.fork_server_command:
+            return self.run_in_fork_server(stdin, timeout)
+        with self.spawn_limits(timeout):
+            process = subprocess.Popen(
+                self.exec_command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                start_new_session=True)
+        self.apply_limits(process.pid, timeout)
+        stdout, stderr = self.capture_output(process.pid, process.stdin, process.stdout, process.stderr, stdin)
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = self.returncode(status)  # Already reaped, so Popen mustn't wait for it
+        return stdout, stderr, process.returncode, rusage.ru_utime + rusage.ru_stime
+
+    def run_in_fork_server(self, stdin, timeout):
+        """As for run_with_limits, but with the run forked from the Python
+           fork server, which is started if necessary. If the server fails
+           to start the run, it's dropped and the run is exec'd as usual.
+        """
+        if self.fork_server is None:
+            self.fork_server = ForkServer(self.fork_server_command)
+        stdin_read, stdin_write = os.pipe()
+        stdout_read, stdout_write = os.pipe()
+        stderr_read, stderr_write = os.pipe()
+        child_fds = [stdin_read, stdout_write, stderr_write]
+        pid = self.fork_server.start(child_fds, self.rlimits(timeout))
+        for fd in child_fds:
+            os.close(fd)
+        pipes = [open(stdin_write, 'wb', buffering=0), open(stdout_read, 'rb', buffering=0),
+                 open(stderr_read, 'rb', buffering=0)]
+        if pid is None:
+            for pipe in pipes:
+                pipe.close()
+            self.stop_servers()
+            self.fork_server_command = None  # Exec each run from now on
+            return self.run_with_limits(stdin, timeout)
+        stdout, stderr = self.capture_output(pid, *pipes, stdin)
+        status, cpu_used = self.fork_server.wait()
+        return stdout, stderr, self.returncode(status), cpu_used
+
+    def capture_output(self, pid, stdin_pipe, stdout_pipe, stderr_pipe, stdin):
+        """Feed the given binary stdin stream to the running program pid
+           through the binary stdin_pipe, while capturing its output from
+           stdout_pipe and stderr_pipe, until it closes them. The pipes are
+           all closed afterwards. Each output stream is capped at the
+           fsizelimit size: if it reaches that, the program's process group
+           is killed. Return the (stdout, stderr) text.
+        """
+        max_bytes = self.params['fsizelimit'] * 1024
+        to_send = memoryview(stdin.read(PIPE_CHUNK_SIZE))
+        captured = {stdout_pipe: bytearray(), stderr_pipe: bytearray()}
+        with selectors.DefaultSelector() as selector:
+            selector.register(stdout_pipe, selectors.EVENT_READ)
+            selector.register(stderr_pipe, selectors.EVENT_READ)
+            if to_send:
+                os.set_blocking(stdin_pipe.fileno(), False)
+                selector.register(stdin_pipe, selectors.EVENT_WRITE)
+            else:
+                stdin_pipe.close()
+            while selector.get_map():
+                for key, _ in selector.select():
+                    stream = key.fileobj
+                    if stream is stdin_pipe:
+                        try:
+                            to_send = to_send[os.write(stream.fileno(), to_send):]
+                        except BlockingIOError:
+                            continue
+                        except BrokenPipeError:
+                            to_send = to_send[:0]  # Program has stopped reading
+                        else:
+                            if not to_send:
+                                to_send = memoryview(stdin.read(PIPE_CHUNK_SIZE))
+                        if not to_send:
+                            selector.unregister(stream)
+                            stream.close()
+                        continue
+                    data = os.read(stream.fileno(), PIPE_CHUNK_SIZE)
+                    buffer = captured[stream]
+                    buffer += data
+                    is_full = len(buffer) >= max_bytes
+                    if is_full:
+                        del buffer[max_bytes:]
+                        try:
+                            os.killpg(pid, signal.SIGKILL)  # Excessive output
+                        except ProcessLookupError:
+                            pass
+                    if not data or is_full:
+                        selector.unregister(stream)
+                        stream.close()
+        if not stdin_pipe.closed:
+            stdin_pipe.close()
+        return self.decoded(captured[stdout_pipe]), self.decoded(captured[stderr_pipe])
+
+    @staticmethod
+    def decoded(data):
+        """The given output bytes as text, with newlines translated as when
+           reading a text file.
+        """
+        text = data.decode(ENCODING, errors='replace')
+        return text.replace('\r\n', '\n').replace('\r', '\n')
+
+    @staticmethod
+    def returncode(status):
+        """The subprocess-style returncode for the given wait status"""
+        if os.WIFSIGNALED(status):
+            return -os.WTERMSIG(status)
+        return os.WEXITSTATUS(status)
+
+    def run_result(self, stdout, stderr, returncode, cpu_used, timeout, pertest_timeout):
+        """Return the TestResult for a run with the given outputs, returncode
+           and CPU secs used (from its rusage) with the given timeout.
+           Death by a signal is reported as bash used to report it (we
+           used to run tests via bash): returncode 128 + the signal number,
+           plus 'Killed' on stderr for SIGKILL.
+        """
+        if returncode < 0:
+            signal_num = -returncode
+            returncode = 128 + signal_num
+            if signal_num == signal.SIGKILL:
+                stderr = 'Killed\n' + stderr
+        output = self.combined_output(stdout, stderr)
+        if returncode == 0:
+            test_result = TestResult(State.correct, output)
+        else:
+            test_result = self.failed_run_result(output, returncode, cpu_used + self.RUSAGE_CPU_SLACK,
+                                                 timeout, pertest_timeout)
+        test_result.cpu_used = cpu_used
+        return test_result
+
     def run_one_test(self, stdin, remaining_secs, pertest_timeout):
         """ Run a single test of the compiled ready-to-run program
             using the given exec_command. remaining_secs is the total CPU time
@@ -308,70 +1207,118 @@ class JobRunner:
             return value is a TestResult object in which the State is 'correct' if
             no runtime errors occurred. This might later change to wrong_answer when
             the output is checked.
-            Use subprocess.run with output to files in order that ulimit filesize
-            works on stdout and stderr.
+            The program is exec'd directly, with limits set by prlimit
+            and output captured through size-capped pipes (see run_with_limits).
+            Java tests are run in the Java test harness if it's in use, but
+            if the harness can't give the result a separate JVM would, the
+            test is run again in a separate JVM and the harness is dropped.
         """
-        output = ''
         timeout = int(min(remaining_secs, pertest_timeout))
         if timeout <= 0:
             return TestResult(State.time_budget_exceeded, "*** Time budget exceeded ***")
-        t_start = process_cpu_time()
-        state = State.correct  # In this context, 'correct' means the run didn't break
-        cmd = ' '.join(self.exec_command)
-        fsizelimit = self.params['fsizelimit']
-        limit_memory = '' if self.language == 'java' else f"ulimit -v {MEMLIMIT}; "; 
-        bash_cmd = f"ulimit -s unlimited; ulimit -c 0; {{limit_memory}}ulimit -t {timeout}; ulimit -f {fsizelimit}; {cmd}"
-        try:
-            with open('__stdout__.txt', 'w') as output:
-                with open('__stderr__.txt', 'w') as err_output:
-                    subprocess.run(
-                        bash_cmd,
-                        input=stdin,
-                        stdout=output,
-                        stderr=err_output,
-                        universal_newlines=True,
-                        check=True,
-                        shell=True)
-
-        except subprocess.CalledProcessError as e:
-            output = self.get_output('__stdout__.txt', '__stderr__.txt')
-            state = State.runtime_error
-            spacer = '\n' if output else ''
-            if output.startswith('Killed'):
-                # Job killed by bash, almost certainly due to ulimit.
-                # We assume that if wall clock time has run out, that the ulimit
-                # that was hit was cpu time. However, ulimit can actually kill
-                # a job due to CPU time *before* the wall clock time has reached
-                # (evidenced by Java). Hence the cautious classification in
-                # the following.
-                if process_cpu_time() - t_start >= timeout:
-                    # Job timed out. Decide if this is a test case timeout
-                    #  (user's fault) or total time budget exceeded (our fault).
-                    if timeout >= pertest_timeout:
-                        state = State.timeout
-                        output = output.replace('Killed', f'*** Time limit ({timeout} secs) reached ***')
-                    else:
-                        state = State.time_budget_exceeded
-                elif e.returncode == (128 + 9): # Always true? Dunno!
-                    output = output.replace('Killed', '*** Killed by timeout or excessive output ***')
-                elif e.returncode > 128:
-                    # Why did we get killed??
-                    output = output.replace('Killed', f'*** Killed by signal {e.returncode - 128} ***')
-                else:
-                    output = output.replace('Killed', f'*** Killed with returncode = {e.returncode} ***')
-            elif output.endswith('MemoryError'):
-                output = output.replace('MemoryError', '*** Memory limit exceeded ***')
-            elif e.returncode <= 128:
-                # Probably program exited with its own error code
-                output += spacer + f'*** Program exited with return code of {e.returncode} ***'
-            else:  # e.returncode > 128 - a signal
-                output += spacer + f"*** Program failed with signal {e.returncode - 128} ***"
-            if state != state.correct and output:
-                output += "\nFurther testing aborted"
-            
+        if self.java_harness_command:
+            test_result = self.run_in_java_harness(stdin, timeout, pertest_timeout, remaining_secs)
+            if test_result is not None:
+                return test_result
+            self.java_harness_command = None  # Use a JVM per test from now on
+            with open(JAVA_HARNESS_FILES[0], 'rb') as stdin:
+                stdout, stderr, returncode, cpu_used = self.run_with_limits(stdin, timeout)
         else:
-            output = self.get_output('__stdout__.txt', '__stderr__.txt')
-
+            stdout, stderr, returncode, cpu_used = self.run_with_limits(stdin, timeout)
+        return self.run_result(stdout, stderr, returncode, cpu_used, timeout, pertest_timeout)
+
+    def run_in_java_harness(self, stdin, timeout, pertest_timeout, remaining_secs):
+        """Run a test, with the given binary stdin stream and CPU timeout,
+           in the Java test harness, starting the harness if necessary.
+           Return the TestResult, or None if the harness couldn't give the
+           result of a run in a separate JVM. That's the case if the test
+           failed other than by timing out (the harness can't reproduce the
+           JVM's error reporting), if the output reached the fsizelimit size
+           or if the harness died (e.g. from System.exit). The harness is
+           then stopped and the test's stdin is left in JAVA_HARNESS_FILES[0].
+           A test that doesn't end within HARNESS_WALL_CLOCK_FACTOR times its
+           timeout (plus FREE_BOARD_SECS) of wall clock time, e.g. because
+           it's sleeping, is treated as having timed out.
+        """
+        _, stdout_filename, stderr_filename = JAVA_HARNESS_FILES
+        if self.java_harness is None:
+            with self.spawn_limits(int(remaining_secs) + 1):
+                self.java_harness = JavaHarness(self.java_harness_command)
+            self.apply_limits(self.java_harness.process.pid, int(remaining_secs) + 1)
+        if self.java_harness.start(stdin, timeout):
+            verdict, cpu_used = self.java_harness.wait(self.HARNESS_WALL_CLOCK_FACTOR * timeout + self.FREE_BOARD_SECS)
+        else:
+            verdict = ''
+        test_result = None
+        if verdict in ('OK', 'TIMEOUT', None):
+            with open(stdout_filename, 'rb') as stdout, open(stderr_filename, 'rb') as stderr:
+                outputs = [stdout.read(), stderr.read()]
+            if verdict != 'OK':
+                stdout, stderr = [self.decoded(output) for output in outputs]
+                test_result = self.run_result(stdout, stderr, -signal.SIGKILL, max(cpu_used, timeout),
+                                              timeout, pertest_timeout)
+            elif all(len(output) < self.params['fsizelimit'] * 1024 for output in outputs):
+                stdout, stderr = [self.decoded(output) for output in outputs]
+                return self.run_result(stdout, stderr, 0, cpu_used, timeout, pertest_timeout)
+        self.stop_servers()
+        return test_result
+
+    def servers_cpu_time(self):
+        """The CPU secs used by the running Java test harness and Python fork
+           server (and the runs it has forked), which process_cpu_time doesn't
+           include until they're reaped.
+        """
+        return sum(running_cpu_time(process) for process in
+                   [self.java_harness and self.java_harness.process,
+                    self.fork_server and self.fork_server.process] if process)
+
+    def stop_servers(self):
+        """Kill and reap the Java test harness and Python fork server, if running"""
+        if self.java_harness is not None:
+            self.java_harness.stop()
+            self.java_harness = None
+        if self.fork_server is not None:
+            self.fork_server.stop()
+            self.fork_server = None
+
+    def failed_run_result(self, output, returncode, cpu_used, timeout, pertest_timeout):
+        """Return the TestResult for a run of the program that gave the
+           given output and non-zero returncode after using cpu_used CPU secs
+           with a CPU time limit of timeout secs.
+        """
+        state = State.runtime_error
+        spacer = '\n' if output else ''
+        if output.startswith('Killed'):
+            # Job killed by bash, almost certainly due to ulimit.
+            # We assume that if wall clock time has run out, that the ulimit
+            # that was hit was cpu time. However, ulimit can actually kill
+            # a job due to CPU time *before* the wall clock time has reached
+            # (evidenced by Java). Hence the cautious classification in
+            # the following.
+            if cpu_used >= timeout:
+                # Job timed out. Decide if this is a test case timeout
+                #  (user's fault) or total time budget exceeded (our fault).
+                if timeout >= pertest_timeout:
+                    state = State.timeout
+                    output = output.replace('Killed', f'*** Time limit ({timeout} secs) reached ***')
+                else:
+                    state = State.time_budget_exceeded
+            elif returncode == (128 + 9): # Always true? Dunno!
+                output = output.replace('Killed', '*** Killed by timeout or excessive output ***')
+            elif returncode > 128:
+                # Why did we get killed??
+                output = output.replace('Killed', f'*** Killed by signal {returncode - 128} ***')
+            else:
+                output = output.replace('Killed', f'*** Killed with returncode = {returncode} ***')
+        elif output.endswith('MemoryError'):
+            output = output.replace('MemoryError', '*** Memory limit exceeded ***')
+        elif returncode <= 128:
+            # Probably program exited with its own error code
+            output += spacer + f'*** Program exited with return code of {returncode} ***'
+        else:  # returncode > 128 - a signal
+            output += spacer + f"*** Program failed with signal {returncode - 128} ***"
+        if state != state.correct and output:
+            output += "\nFurther testing aborted"
         return TestResult(state, output)
 
     def run_all_tests(self, end_time):
@@ -387,21 +1334,144 @@ class JobRunner:
                 self.params['pertest_timeout'] = self.timeout
             else:
                 self.params['pertest_timeout'] = JobRunner.DEFAULT_PER_TEST_TIMEOUT
+        max_parallel = min(self.params['max_parallel_tests'], os.cpu_count() or 1)
+        if max_parallel > 1:
+            return self.run_tests_in_parallel(end_time, max_parallel)
+
         results = Results()
 
-        for i in self.test_sequence():
-            test_name, is_sample, stdin, expected = self.tests[i]
-            secs_remaining = end_time - process_cpu_time()
-            pertest_timeout = self.params['pertest_timeout']
-            test_result = self.run_one_test(stdin, secs_remaining, pertest_timeout)
-            if test_result.state == State.correct and not self.match(self.tests[i], test_result.output):
-                test_result.state = State.wrong_answer
-            is_shown = is_sample or self.params['show_all_tests'] or i in self.params['show_tests'] or (
-                self.params['show_first_fail'] and test_result.state != State.correct)
-            #test_result.output += f"\n[Job was run with {secs_remaining:.2f} secs remaining]"
-            results.add_row(test_name, test_result, stdin, expected, not is_shown)
+        try:
+            for i in self.test_sequence():
+                secs_remaining = end_time - process_cpu_time() - self.servers_cpu_time()
+                pertest_timeout = self.params['pertest_timeout']
+                with self.tests[i].open_input() as stdin:
+                    test_result = self.run_one_test(stdin, secs_remaining, pertest_timeout)
+                if test_result.state == State.correct and not self.match(self.tests[i], test_result.output):
+                    test_result.state = State.wrong_answer
+                #test_result.output += f"\n[Job was run with {secs_remaining:.2f} secs remaining]"
+                self.add_result_row(results, i, test_result)
+                if test_result.state != State.correct:
+                    break  # Lazy evaluation
+        finally:
+            self.stop_servers()
+        return results
+
+    def add_result_row(self, results, i, test_result):
+        """Add the given result of test i to the given Results object"""
+        test = self.tests[i]
+        is_shown = test.is_sample or self.params['show_all_tests'] or i in self.params['show_tests'] or (
+            self.params['show_first_fail'] and test_result.state != State.correct)
+        results.add_row(test.name, test_result, test.input_preview(), test.expected_preview(), not is_shown)
+        if test_result.state != State.time_budget_exceeded:  # Otherwise not the test's fault
+            self.test_outcomes.append((test.name, test_result.state != State.correct, test_result.cpu_used))
+
+    def start_test(self, position, stdin, timeout):
+        """Start a run of the program, as a new session (process group), on
+           the given binary stdin stream with the given CPU timeout. Input and output are
+           via files specific to the given position in the test sequence.
+           Return the Popen object, which the caller must reap with os.wait4.
+        """
+        with open(f'__stdin__{position}.txt', 'wb') as infile:
+            shutil.copyfileobj(stdin, infile)
+        with open(f'__stdin__{position}.txt', 'rb') as infile, \
+                open(f'__stdout__{position}.txt', 'w') as output, \
+                open(f'__stderr__{position}.txt', 'w') as err_output:
+            with self.spawn_limits(timeout):
+                process = subprocess.Popen(
+                    self.exec_command,
+                    stdin=infile,
+                    stdout=output,
+                    stderr=err_output,
+                    start_new_session=True)
+        self.apply_limits(process.pid, timeout)
+        return process
+
+    def finish_test(self, position, returncode, cpu_used, timeout):
+        """Return the TestResult for the run at the given position in the test
+           sequence, which has terminated with the given returncode after
+           using cpu_used CPU secs (from its rusage), with the given timeout.
+        """
+        outputs = []
+        for filename in [f'__stdout__{position}.txt', f'__stderr__{position}.txt']:
+            with open(filename) as infile:
+                outputs.append(infile.read())
+            os.remove(filename)
+        os.remove(f'__stdin__{position}.txt')
+        stdout, stderr = outputs
+        return self.run_result(stdout, stderr, returncode, cpu_used, timeout, self.params['pertest_timeout'])
+
+    def run_tests_in_parallel(self, end_time, max_parallel):
+        """As for run_all_tests, but with up to max_parallel tests running at
+           once. Tests are started in test_sequence order and the reported
+           results are exactly those of a sequential run: all tests up to
+           and including the first failure in that order.
+           Each test's CPU time comes from its own rusage (via os.wait4)
+           rather than from process_cpu_time, which includes all reaped
+           children. To stay within the time budget, the full timeout of
+           every test still running is reserved when starting another.
+           If there's a validator, it runs asynchronously too: a test's
+           validator counts as one of the running processes.
+        """
+        pertest_timeout = self.params['pertest_timeout']
+        sequence = self.test_sequence()
+        running = {}  # Map from pid to (position in sequence, Popen object, timeout or None for a validator)
+        validating = {}  # Map from position in sequence to TestResult awaiting validation
+        test_results = {}  # Map from position in sequence to TestResult
+        first_failure = len(sequence)  # Position of first known failure
+        next_position = 0
+        while True:
+            while next_position < first_failure and len(running) < max_parallel:
+                reserved = sum(timeout or 0 for (_, _, timeout) in running.values())
+                timeout = int(min(end_time - process_cpu_time() - reserved, pertest_timeout))
+                if timeout <= 0:
+                    if not running:
+                        test_results[next_position] = TestResult(State.time_budget_exceeded,
+                                                                 "*** Time budget exceeded ***")
+                        first_failure = next_position
+                    break  # Otherwise wait for a running test to release its reservation
+                with self.tests[sequence[next_position]].open_input() as stdin:
+                    process = self.start_test(next_position, stdin, timeout)
+                running[process.pid] = (next_position, process, timeout)
+                next_position += 1
+
+            if not running:
+                break
+            pid, status, rusage = os.wait4(-1, 0)
+            if pid not in running:
+                continue
+            position, process, timeout = running.pop(pid)
+            process.returncode = self.returncode(status)  # Already reaped, so Popen mustn't wait for it
+            if timeout is None:  # A validator has finished
+                test_result = validating.pop(position)
+                if position > first_failure:
+                    continue  # Killed, or irrelevant because an earlier test failed
+                if not self.validator_verdict(process.returncode):
+                    test_result.state = State.wrong_answer
+            else:
+                test_result = self.finish_test(position, process.returncode, rusage.ru_utime + rusage.ru_stime, timeout)
+                if position > first_failure:
+                    continue  # Killed, or irrelevant because an earlier test failed
+                i = sequence[position]
+                if test_result.state == State.correct and self.validator:
+                    validator = self.start_validator(self.tests[i], test_result.output)
+                    running[validator.pid] = (position, validator, None)
+                    validating[position] = test_result
+                    continue
+                if test_result.state == State.correct and not self.match(self.tests[i], test_result.output):
+                    test_result.state = State.wrong_answer
+            test_results[position] = test_result
             if test_result.state != State.correct:
-                break  # Lazy evaluation
+                first_failure = position
+                for (other_position, other_process, _) in running.values():
+                    if other_position > position:
+                        try:
+                            os.killpg(other_process.pid, signal.SIGKILL)
+                        except ProcessLookupError:
+                            pass
+
+        results = Results()
+        for position in range(min(first_failure + 1, len(sequence))):
+            self.add_result_row(results, sequence[position], test_results[position])
         return results
 
     def compile(self, filename):
@@ -412,50 +1482,69 @@ class JobRunner:
         """
         basename = '.'.join(filename.split('.')[:-1])
 
-        if self.language == 'c':
-            cflags = self.params['cflags']
-            cldflags = self.params['cldflags']
-            command = f"gcc {cflags} -o {basename} {filename} {cldflags}"
-            compile_result = subprocess.run(
-                command.split(),
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                universal_newlines=True)
-            self.exec_command = [f"./{basename}"]
-
-        elif self.language == 'cpp':
-            cppflags = self.params['cppflags']
-            command = f"g++ {cppflags} -o {basename} {filename}"
-            compile_result = subprocess.run(
-                command.split(),
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                universal_newlines=True)
+        if self.language in ('c', 'cpp'):
+            compile_result = self.run_compiler([filename])
             self.exec_command = [f"./{basename}"]
 
         elif self.language == 'java':
-            compile_result = subprocess.run(
-                ['javac', "-J-Xss64m", "-J-Xmx4g", "-Xlint:-unchecked", filename],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                universal_newlines=True)
-            self.exec_command = ["java", "-Xss64m", "-Xmx800m", basename]
+            cds_flags = java_cds_flags() if self.params['java_cds_archive'] else []
+            filenames = [filename]
+            if self.params['java_test_harness']:
+                filenames.append(JAVA_HARNESS_CLASS + '.java')
+                with open(filenames[-1], 'w') as outfile:
+                    outfile.write(JAVA_HARNESS_SOURCE)
+            compile_result = self.run_compiler(filenames, ['-J' + flag for flag in cds_flags])
+            self.exec_command = ["java"] + cds_flags + ["-Xss64m", "-Xmx800m", basename]
+            if self.params['java_test_harness']:
+                self.java_harness_command = ["java"] + cds_flags + ["-Xss64m", "-Xmx800m", JAVA_HARNESS_CLASS, basename]
             
         elif self.language == 'csharp':
-            compile_result = subprocess.run(	
-                ['mcs', filename],	
-                stdout=subprocess.PIPE,	
-                stderr=subprocess.STDOUT,	
-                universal_newlines=True)	
+            compile_result = self.run_compiler([filename])
             self.exec_command = ["mono", basename + '.exe']	
             
         else:  # Python doesn't need a compile phase
             compile_result = None
             self.exec_command = [self.language, filename] # Either python2, python3, pypy3
+            if self.language in ('python3', 'pypy3') and self.params['python_fork_server']:
+                with open(FORK_SERVER_FILENAME, 'w') as outfile:
+                    outfile.write(FORK_SERVER_SOURCE)
+                self.fork_server_command = [self.language, FORK_SERVER_FILENAME, filename]
 
         compile_output = compile_result.stdout if compile_result else ''
         return compile_output
 
+    def run_compiler(self, source_filenames, extra_flags=()):
+        """Compile the given source files (the main one first) in the current
+           directory, with the command from compile_command plus the given
+           extra flags, which mustn't affect what's built. Return the
+           CompletedProcess, with the compiler's output in its stdout.
+           Clean compiles are cached on the host, keyed by the language, the
+           command, the compiler version and the sources. The cached products
+           are the files the compile created. On a cache hit they're copied
+           into the current directory instead of compiling. On a miss,
+           buildcacheworker.py is asked to compile the sources for the cache.
+        """
+        command = compile_command(self.language, source_filenames, self.params)
+        full_command = command[:1] + list(extra_flags) + command[1:]
+        if not self.params['compile_cache']:
+            return subprocess.run(full_command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                  universal_newlines=True)
+        sources = []
+        for filename in source_filenames:
+            with open(filename, 'rb') as infile:
+                sources.append(infile.read())
+        cache_key = BuildCache.key(self.language, ' '.join(command), program_identity(command[0]), *sources)
+        if BuildCache(COMPILE_CACHE_DIR).get(cache_key, '.'):
+            return subprocess.CompletedProcess(full_command, 0, '')
+        compile_result = subprocess.run(full_command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                        universal_newlines=True)
+        if compile_result.returncode == 0 and not compile_result.stdout:
+            request_build({'kind': 'compile', 'language': self.language,
+                           'options': {name: self.params[name] for name in COMPILE_FLAG_PARAMS},
+                           'sources': [[filename, base64.b64encode(source).decode('ascii')]
+                                       for filename, source in zip(source_filenames, sources)]})
+        return compile_result
+
     def make_executable(self):
         """Try to compile self.student_answer in language self.language.
            Return value is the empty string if all goes well, and in that
@@ -506,6 +1595,8 @@ class JobRunner:
         else:
             # Compile OK: unzip the expected support file and try running all the tests.
             result = self.run_all_tests(end_time)
+            if self.params['order_by_failures'] and self.test_outcomes:
+                TestStats(self.tests).record(self.test_outcomes)
 
         return result
 
@@ -531,32 +1622,32 @@ def is_data_folder(folder):
     
 def tests_and_timeout_from_zip(zipfilename):
     """Return a tuple consisting of the timeout value from the domjudge.ini file
-       (if present - None if not) and a list of (name, isSample, inputdata, outputdata)
-       tuples of test data from the given zipfile. Test data must be either at the top level or
+       (if present - None if not) and a list of ZipTest objects for the test data
+       in the given zipfile. Test data must be either at the top level or
        must be in a folder called 'secret' or 'judge' or 'sample'.
+       Only the archive's index is read here; ZipTest objects read their
+       data from the archive on demand.
     """
-    tests = []
     zf = ZipFile(zipfilename)
     filenames = zf.namelist()
 
-    # Process all test data to get a dictionary mapping from test name to 
-    # a dictionary of the input and output test data.
-    test_data = {}
+    # Process all test data filenames to get a dictionary mapping from test name to
+    # a dictionary of its folder and the names of its input and output files.
+    test_files = {}
     for filename in filenames:
         folder = '/'.join(filename.split('/')[:-1])
         if is_data_folder(folder) and extension(filename) in ['in', 'out', 'ans']:
             test_name = test_name_from_file(filename)
-            if test_name not in test_data:
-                test_data[test_name] = {'input': '', 'output': ''}
-            with zf.open(filename) as infile:
-                contents = infile.read().decode('utf-8')
+            if test_name not in test_files:
+                test_files[test_name] = {'folder': folder, 'input': None, 'output': None}
             if extension(filename) == 'in':
-                test_data[test_name]['input'] = contents
+                test_files[test_name]['input'] = filename
             else:
-                test_data[test_name]['output'] = contents
-    
-    tests = [(name, is_sample_file(folder, name), data['input'], data['output']) for name, data in test_data.items()]
-    
+                test_files[test_name]['output'] = filename
+
+    tests = [ZipTest(zf, name, is_sample_file(files['folder'], name), files['input'], files['output'])
+             for name, files in test_files.items()]
+
     timeout = None
     ini_files = [f for f in filenames if f.endswith('domjudge-problem.ini')]
     if (len(ini_files) == 1):
@@ -587,7 +1678,7 @@ def get_zip_filename(params):
 
 def get_all_tests(params):
     """Unzip the expected .zip attachment and extract a list of tests from it.
-       A test is a (issample, stdin, expected) tuple.
+       A test is a ZipTest object.
        Return value is a tuple: (timeout value. list of tests).
     """
     zipfilename = get_zip_filename(params)
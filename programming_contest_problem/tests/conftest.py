@@ -0,0 +1,62 @@
+"""Test setup for the programming contest template. The template is Twig
+   processed by CodeRunner, so the tests exec its Python source without the
+   final call of main(), which is the only part that needs Twig variables.
+"""
+import io
+import os
+import sys
+import types
+import zipfile
+
+import pytest
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE_FILENAME = os.path.join(PACKAGE_DIR, 'template.py')
+sys.path.insert(0, PACKAGE_DIR)  # For buildcacheworker
+
+
+def load_template():
+    """The template's source, less the call of main(), exec'd as a module"""
+    with open(TEMPLATE_FILENAME) as infile:
+        source = infile.read().rsplit('\nmain()', 1)[0]
+    module = types.ModuleType('template')
+    exec(compile(source, TEMPLATE_FILENAME, 'exec'), module.__dict__)
+    return module
+
+
+@pytest.fixture
+def template():
+    return load_template()
+
+
+@pytest.fixture
+def make_tests(template):
+    """A function mapping a list of (input, expected output) strings to a
+       list of ZipTests (the first is a sample test) in an in-memory zip.
+    """
+    def make(data):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            for i, (stdin, expected) in enumerate(data):
+                archive.writestr(f'test{i}.in', stdin)
+                archive.writestr(f'test{i}.ans', expected)
+        archive = zipfile.ZipFile(buffer)
+        return [template.ZipTest(archive, f'test{i}', i == 0, f'test{i}.in', f'test{i}.ans')
+                for i in range(len(data))]
+    return make
+
+
+@pytest.fixture
+def job_params(template, monkeypatch):
+    """The default question parameters, with host-wide caching turned off"""
+    monkeypatch.setattr(template, 'BUILD_REQUEST_DIR', '/nonexistent')  # No requests to a real worker
+    params = dict(template.KNOWN_PARAMS)
+    params.update(pertest_timeout=5, compile_cache=False, order_by_failures=False)
+    return params
+
+
+@pytest.fixture
+def in_tmp_dir(tmp_path, monkeypatch):
+    """Run the test in an empty directory, as Jobe runs the template"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,243 @@
+"""Tests of the host-wide build caches, which jobs read and only
+   buildcacheworker.py writes
+"""
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import zipfile
+
+import pytest
+
+import buildcacheworker
+
+NOBODY = 65534  # The uid the worker runs as, in these tests
+
+pytestmark = pytest.mark.skipif(os.getuid() != 0, reason="needs root to give the cache to another user")
+
+VALIDATOR_CPP = 'int main() { return 42; }\n'
+
+SQUARE_C = '''#include <stdio.h>
+int main(void) {
+    int n;
+    if (scanf("%d", &n) == 1) printf("%d\\n", n * n);
+    return 0;
+}
+'''
+
+
+def make_zip(files):
+    """The contents of a zip of the given dictionary of filename: contents"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for filename, contents in files.items():
+            archive.writestr(filename, contents)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def cache_root(template, job_params, tmp_path, monkeypatch):
+    """Point the template and the worker at a cache root in tmp_path, set up
+       by the worker (after job_params has turned off requests to a real worker)
+    """
+    root = tmp_path / 'cache'
+    for module in [template, buildcacheworker]:
+        monkeypatch.setattr(module, 'CACHE_ROOT', str(root))
+        for name, dirname in [('BUILD_REQUEST_DIR', 'requests'), ('VALIDATOR_CACHE_DIR', 'validators'),
+                              ('JAVA_CDS_DIR', 'java_cds'), ('COMPILE_CACHE_DIR', 'compiles'),
+                              ('TEST_STATS_DIR', 'test_stats')]:
+            monkeypatch.setattr(module, name, str(root / dirname))
+    # The builds must be reachable by the sandbox user, which tmp_path isn't
+    build_parent = tempfile.mkdtemp()
+    os.chmod(build_parent, 0o711)
+    monkeypatch.setattr(buildcacheworker, 'BUILD_DIR', os.path.join(build_parent, 'builds'))
+    monkeypatch.setattr(buildcacheworker, 'SANDBOX_COMMAND', ['runuser', '-u', 'nobody', '--'])
+    buildcacheworker.prepare_cache_dirs()
+    yield root
+    shutil.rmtree(build_parent)
+
+
+def hand_over(root):
+    """Give the cache to another user, as if the worker were running as that user"""
+    for dirpath, _, filenames in os.walk(root):
+        for path in [dirpath] + [os.path.join(dirpath, filename) for filename in filenames]:
+            os.chown(path, NOBODY, NOBODY)
+
+
+def setup_validator_job(template, job_params, monkeypatch, job_dir, validator_zip):
+    """Start a job with the given validator in job_dir, returning its JobRunner"""
+    os.mkdir(job_dir)
+    monkeypatch.chdir(job_dir)
+    with open('validator.zip', 'wb') as outfile:
+        outfile.write(validator_zip)
+    job_params['validator_zip_filename'] = 'validator.zip'
+    return template.JobRunner('', 'python3', job_params, [], None)
+
+
+def test_validator_built_by_worker_is_used(template, job_params, tmp_path, cache_root, monkeypatch):
+    validator_zip = make_zip({'validate.cpp': VALIDATOR_CPP})
+    setup_validator_job(template, job_params, monkeypatch, tmp_path / 'job1', validator_zip)
+    assert os.path.exists('Validator/optionalhack.h')  # Built by the job
+    assert buildcacheworker.process_build_requests() == 1
+    assert os.listdir(cache_root / 'requests') == []
+    hand_over(cache_root)
+    job_runner = setup_validator_job(template, job_params, monkeypatch, tmp_path / 'job2', validator_zip)
+    assert not os.path.exists('Validator/optionalhack.h')  # Taken from the cache
+    assert subprocess.run([job_runner.validator]).returncode == 42
+
+
+def test_cache_not_trusted_if_jobs_could_write_it(template, job_params, tmp_path, cache_root, monkeypatch):
+    validator_zip = make_zip({'validate.cpp': VALIDATOR_CPP})
+    setup_validator_job(template, job_params, monkeypatch, tmp_path / 'job1', validator_zip)
+    buildcacheworker.process_build_requests()
+    cache = template.BuildCache(template.VALIDATOR_CACHE_DIR)
+    [key] = os.listdir(cache.cache_dir)
+    assert not cache.trusted()  # Owned by the job's user
+    assert not cache.get(key, tmp_path / 'copy')
+    hand_over(cache_root)
+    assert cache.trusted()
+    os.chmod(cache.cache_dir, 0o777)
+    assert not cache.trusted()
+    os.chmod(cache.cache_dir, 0o755)
+    os.chmod(cache_root, 0o775)
+    assert not cache.trusted()
+
+
+@pytest.mark.parametrize('files', [
+    {'validate.cpp': VALIDATOR_CPP, 'build': 'g++ validate.cpp -o run\n'},
+    {'validate.cpp': 'this is not C++\n'},
+    {'a.cpp': VALIDATOR_CPP, 'b.cpp': VALIDATOR_CPP},
+])
+def test_worker_builds_only_single_cpp_validators(template, cache_root, files):
+    template.request_build({'kind': 'validator', 'zip': template.base64.b64encode(make_zip(files)).decode()})
+    assert buildcacheworker.process_build_requests() == 0
+    assert os.listdir(cache_root / 'requests') == []
+    assert os.listdir(cache_root / 'validators') == []
+
+
+def test_worker_ignores_linked_requests(cache_root, tmp_path):
+    target = tmp_path / 'target.json'
+    target.write_text('{"kind": "validator", "zip": ""}')
+    os.symlink(target, cache_root / 'requests' / 'link.json')
+    assert buildcacheworker.process_build_requests() == 0
+    assert os.listdir(cache_root / 'requests') == []
+    assert target.exists()
+
+
+def test_no_request_without_worker(template, tmp_path, monkeypatch):
+    monkeypatch.setattr(template, 'BUILD_REQUEST_DIR', str(tmp_path / 'requests'))
+    template.request_build({'kind': 'validator', 'zip': ''})
+    assert not os.path.exists(tmp_path / 'requests')
+
+
+def test_java_cds_archive_is_built_out_of_band(template, cache_root, tmp_path, monkeypatch):
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    (bin_dir / 'java').write_text('#!/bin/sh\nexit 1\n')  # A JDK that can't build the archive
+    os.chmod(bin_dir / 'java', 0o755)
+    monkeypatch.setenv('PATH', str(bin_dir), prepend=os.pathsep)
+    assert template.java_cds_flags() == []
+    [request] = os.listdir(cache_root / 'requests')
+    assert buildcacheworker.process_build_requests() == 0
+    archive = template.java_cds_archive_path()
+    assert os.path.exists(archive + '.failed')
+    assert template.java_cds_flags() == []
+    assert os.listdir(cache_root / 'requests') == []  # Not asked again
+    os.rename(archive + '.failed', archive)  # As if it had been built
+    assert template.java_cds_flags() == []  # Not trusted
+    hand_over(cache_root)
+    assert f'-XX:SharedArchiveFile={archive}' in template.java_cds_flags()
+    log_flags = [flag for flag in template.java_cds_flags() if flag.startswith('-Xlog')]
+    assert log_flags == ['-Xlog:disable']  # Any log would mix with the graded output
+
+
+def test_java_cds_flags_without_cache(template, tmp_path, monkeypatch):
+    monkeypatch.setattr(template, 'JAVA_CDS_DIR', str(tmp_path / 'missing' / 'java_cds'))
+    monkeypatch.setattr(template, 'BUILD_REQUEST_DIR', str(tmp_path / 'missing' / 'requests'))
+    monkeypatch.setattr(template.shutil, 'which', lambda program: '/bin/sh')
+    assert template.java_cds_flags() == []
+
+
+def compile_job(template, job_params, job_dir):
+    """Compile SQUARE_C in a new job in job_dir. Return the commands it ran."""
+    os.mkdir(job_dir)
+    commands = []
+    run = subprocess.run
+    def recording_run(command, *args, **kwargs):
+        commands.append(command)
+        return run(command, *args, **kwargs)
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(job_dir)
+        patch.setattr(template.subprocess, 'run', recording_run)
+        job_params['compile_cache'] = True
+        job_runner = template.JobRunner(SQUARE_C, 'c', job_params, [], None)
+        assert job_runner.make_executable() == ''
+    assert subprocess.run(job_runner.exec_command, input='7\n', cwd=job_dir, stdout=subprocess.PIPE,
+                          universal_newlines=True).stdout == '49\n'
+    return commands
+
+
+def test_submission_compiled_by_worker_is_used(template, job_params, tmp_path, cache_root):
+    assert compile_job(template, job_params, tmp_path / 'job1')[0][0] == 'gcc'
+    assert buildcacheworker.process_build_requests() == 1
+    hand_over(cache_root)
+    assert compile_job(template, job_params, tmp_path / 'job2') == []
+
+
+def test_sandboxed_compile_cant_include_private_files(template, cache_root):
+    secret = os.path.join(os.path.dirname(buildcacheworker.BUILD_DIR), 'secret')  # Reachable by the sandbox user
+    with open(secret, 'w') as outfile:
+        outfile.write('The worker can read this\n')
+    os.chmod(secret, 0o600)
+    source = f'__asm__(".section .rodata\\n.incbin \\"{secret}\\"\\n.text");\n' + SQUARE_C
+    options = {'cflags': '-w', 'cldflags': '', 'cppflags': ''}
+    template.request_build({'kind': 'compile', 'language': 'c', 'options': options,
+                            'sources': [['prog.c', template.base64.b64encode(source.encode()).decode()]]})
+    assert buildcacheworker.process_build_requests() == 0
+    assert os.listdir(cache_root / 'compiles') == []
+    os.chmod(secret, 0o644)  # Readable by everyone, so jobs could include it anyway
+    template.request_build({'kind': 'compile', 'language': 'c', 'options': options,
+                            'sources': [['prog.c', template.base64.b64encode(source.encode()).decode()]]})
+    assert buildcacheworker.process_build_requests() == 1
+
+
+def test_cache_doesnt_follow_links_from_builds(cache_root, tmp_path):
+    build_dir = tmp_path / 'build'
+    build_dir.mkdir()
+    (tmp_path / 'private').write_text('secret')
+    os.symlink(tmp_path / 'private', build_dir / 'run')
+    cache = buildcacheworker.BuildCache(str(cache_root / 'compiles'), 10)
+    with pytest.raises(OSError):
+        cache.put('key', str(build_dir), ['run'])
+    assert os.listdir(cache_root / 'compiles') == []
+
+
+@pytest.mark.parametrize('options, filename', [
+    ({'cflags': '-B. -w', 'cldflags': '', 'cppflags': ''}, 'prog.c'),
+    ({'cflags': '-w -o /tmp/x', 'cldflags': '', 'cppflags': ''}, 'prog.c'),
+    ({'cflags': '-w', 'cldflags': '', 'cppflags': ''}, '../prog.c'),
+    ({'cflags': '-w', 'cldflags': ''}, 'prog.c'),
+])
+def test_worker_compiles_only_safe_requests(template, cache_root, options, filename):
+    source = template.base64.b64encode(SQUARE_C.encode()).decode()
+    template.request_build({'kind': 'compile', 'language': 'c', 'options': options, 'sources': [[filename, source]]})
+    assert buildcacheworker.process_build_requests() == 0
+    assert os.listdir(cache_root / 'compiles') == []
+
+
+def test_test_stats_recorded_by_worker(template, make_tests, cache_root):
+    stats = template.TestStats(make_tests([('1\n', '1\n'), ('2\n', '4\n')]))
+    stats.record([('test0', False, 0.5), ('test1', True, 1.5)])
+    stats.record([('test0', False, 0.25)])
+    assert buildcacheworker.process_build_requests() == 2
+    assert stats.load() == {}  # Not trusted
+    hand_over(cache_root)
+    assert stats.load() == {'test0': [2, 0, 0.75], 'test1': [1, 1, 1.5]}
+
+
+def test_worker_rejects_bad_test_stats(template, cache_root):
+    template.request_build({'kind': 'test_stats', 'problem': '../x', 'outcomes': []})
+    template.request_build({'kind': 'test_stats', 'problem': 64 * 'a', 'outcomes': [['test0', 'yes', 1]]})
+    assert buildcacheworker.process_build_requests() == 0
+    assert os.listdir(cache_root / 'test_stats') == []
@@ -0,0 +1,42 @@
+"""Tests that python3 tests run in the fork server behave as they do when
+   each is run in a new interpreter
+"""
+import io
+import os
+
+import pytest
+
+PROGRAM = '''import sys
+print(__name__, sys.argv, __file__.endswith('prog.py'))
+word = input()
+def fail():
+    raise ValueError(word)
+if word == 'fail':
+    fail()
+elif word == 'exit':
+    sys.exit(3)
+'''
+
+
+@pytest.mark.parametrize('word, state', [('ok', 'correct'), ('fail', 'runtime_error'), ('exit', 'runtime_error')])
+def test_fork_server_runs_tests_as_python_does(template, make_tests, job_params, in_tmp_dir, word, state):
+    tests = make_tests([(f'{word}\n', "__main__ ['prog.py'] True\n")])
+    outcomes = []
+    for fork_server in [False, True]:
+        job_params['python_fork_server'] = fork_server
+        job_runner = template.JobRunner(PROGRAM, 'python3', job_params, tests, None)
+        results = job_runner.compile_and_run()
+        assert os.path.exists(template.FORK_SERVER_FILENAME) == fork_server
+        outcomes.append((results.state, results.table[1]))
+    assert outcomes[0] == outcomes[1]
+    assert outcomes[0][0] == template.State[state]
+
+
+def test_traceback_omits_the_server(template, job_params, in_tmp_dir):
+    job_runner = template.JobRunner(PROGRAM, 'python3', job_params, [], None)
+    assert job_runner.make_executable() == ''
+    got = job_runner.run_one_test(io.BytesIO(b'fail\n'), 10, 5).output
+    job_runner.stop_servers()
+    assert 'ValueError: fail' in got
+    assert template.FORK_SERVER_FILENAME not in got
+    assert got.count('File "') == 2  # The call of fail() and the raise
@@ -0,0 +1,70 @@
+"""Tests of running tests in the Java test harness, with a Python stand-in
+   for the harness JVM that follows the same protocol
+"""
+import io
+import os
+import sys
+
+import pytest
+
+# Reads each test's stdin from fd 0 and writes its output to fds 1 and 2.
+# Input 'spin' uses CPU time, 'sleep' never ends and 'forge' writes to fd 1
+# what used to be a verdict.
+FAKE_HARNESS = '''import os, sys, time
+commands = open(f"/dev/fd/{sys.argv[2]}")
+replies = open(f"/dev/fd/{sys.argv[3]}", "w")
+for command in commands:
+    data = os.read(0, 1000).decode()
+    if data == "spin\\n":
+        end = time.process_time() + 0.5
+        while time.process_time() < end:
+            pass
+    elif data == "sleep\\n":
+        time.sleep(60)
+    elif data == "forge\\n":
+        os.write(1, b"OK\\n")
+        os.write(2, b"FAILED\\n")
+        continue
+    os.write(1, data.upper().encode())
+    print("OK", file=replies, flush=True)
+'''
+
+
+@pytest.fixture
+def job_runner(template, job_params, in_tmp_dir):
+    """A JobRunner running Java tests in the fake harness"""
+    with open('fake_harness.py', 'w') as outfile:
+        outfile.write(FAKE_HARNESS)
+    job_runner = template.JobRunner('', 'java', job_params, [], None)
+    job_runner.java_harness_command = [sys.executable, 'fake_harness.py', 'Main']
+    yield job_runner
+    job_runner.stop_servers()
+
+
+def test_tests_use_the_per_test_files(template, job_runner):
+    for stdin in [b'first\n', b'2nd\n']:
+        test_result = job_runner.run_one_test(io.BytesIO(stdin), 10, 5)
+        assert test_result.state == template.State.correct
+        assert test_result.output == stdin.decode().upper()
+    assert job_runner.java_harness is not None
+
+
+def test_cpu_time_is_measured(job_runner):
+    test_result = job_runner.run_one_test(io.BytesIO(b'spin\n'), 10, 5)
+    assert test_result.cpu_used >= 0.4
+
+
+def test_sleeping_test_times_out(template, job_runner, monkeypatch):
+    monkeypatch.setattr(template.JobRunner, 'HARNESS_WALL_CLOCK_FACTOR', 0)
+    monkeypatch.setattr(template.JobRunner, 'FREE_BOARD_SECS', 0.5)
+    test_result = job_runner.run_one_test(io.BytesIO(b'sleep\n'), 10, 1)
+    assert test_result.state == template.State.timeout
+    assert job_runner.java_harness is None
+
+
+def test_test_output_isnt_a_verdict(template, job_runner, monkeypatch):
+    monkeypatch.setattr(template.JobRunner, 'HARNESS_WALL_CLOCK_FACTOR', 0)
+    monkeypatch.setattr(template.JobRunner, 'FREE_BOARD_SECS', 0.5)
+    test_result = job_runner.run_one_test(io.BytesIO(b'forge\n'), 10, 1)
+    assert test_result.state == template.State.timeout
+    assert 'OK\n' in test_result.output
@@ -0,0 +1,70 @@
+"""Tests of the resource limits applied to test runs"""
+import io
+import resource
+import shutil
+import signal
+import sys
+
+import pytest
+
+DEEP_RECURSION_C = r'''
+#include <stdio.h>
+int depth(int n, volatile char *parent) {
+    volatile char frame[1024];
+    frame[0] = parent[0];
+    return n == 0 ? 0 : depth(n - 1, frame) + 1 + frame[0];
+}
+int main(void) {
+    int n;
+    char start = 0;
+    if (scanf("%d", &n) == 1) printf("%d\n", depth(n, &start));
+    return 0;
+}
+'''
+
+
+@pytest.mark.skipif(shutil.which('gcc') is None, reason='needs gcc')
+def test_deep_recursion_has_a_big_stack(template, make_tests, job_params, in_tmp_dir):
+    depth = 48 * 1024  # About 48 MB of stack
+    tests = make_tests([('1\n', '1\n'), (f'{depth}\n', f'{depth}\n')])
+    job_runner = template.JobRunner(DEEP_RECURSION_C, 'c', job_params, tests, None)
+    results = job_runner.compile_and_run()
+    assert results.state == template.State.correct, results.table[-1]
+
+
+def test_spawn_limits_are_restored(template, job_params, in_tmp_dir):
+    job_runner = template.JobRunner('', 'python3', job_params, [], None)
+    before = [resource.getrlimit(limit) for limit, _ in job_runner.rlimits(5)]
+    with job_runner.spawn_limits(5):
+        assert resource.getrlimit(resource.RLIMIT_CORE)[0] == 0
+        assert resource.getrlimit(resource.RLIMIT_CPU) == before[[limit for limit, _ in job_runner.rlimits(5)].index(resource.RLIMIT_CPU)]
+    assert [resource.getrlimit(limit) for limit, _ in job_runner.rlimits(5)] == before
+
+
+DEEP_RECURSION_PYTHON = '''import sys
+sys.setrecursionlimit(10 ** 6)
+def depth(n):
+    return 0 if n == 0 else sum(map(depth, [n - 1])) + 1  # map makes each level use the C stack
+print(depth(int(input())))
+'''
+
+
+@pytest.mark.parametrize('fork_server', [False, True])
+def test_deep_python_recursion_has_a_big_stack(template, make_tests, job_params, in_tmp_dir, fork_server):
+    job_params['python_fork_server'] = fork_server
+    depth = 400000
+    tests = make_tests([('1\n', '1\n'), (f'{depth}\n', f'{depth}\n')])
+    job_runner = template.JobRunner(DEEP_RECURSION_PYTHON, 'python3', job_params, tests, None)
+    results = job_runner.compile_and_run()
+    assert results.state == template.State.correct, results.table[-1]
+
+
+@pytest.mark.parametrize('extra_bytes', [0, 1, 100000])
+def test_program_killed_when_output_reaches_the_cap(template, job_params, in_tmp_dir, extra_bytes):
+    job_params['fsizelimit'] = 1  # 1024 bytes
+    job_runner = template.JobRunner('', 'python3', job_params, [], None)
+    code = f'import sys, time; sys.stdout.write("x" * {1024 + extra_bytes}); sys.stdout.flush(); time.sleep(0.5)'
+    job_runner.exec_command = [sys.executable, '-c', code]
+    stdout, _, returncode, _ = job_runner.run_with_limits(io.BytesIO(b''), 5)
+    assert stdout == 'x' * 1024
+    assert returncode == -signal.SIGKILL
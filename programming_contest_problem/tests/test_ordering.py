@@ -0,0 +1,34 @@
+"""Tests of the order in which a problem's tests are run"""
+import pytest
+
+STATS = {
+    'test1': [10, 0, 1.0],   # Rarely fails, quick
+    'test2': [10, 5, 1.0],   # Often fails, quick
+    'test4': [10, 5, 10.0],  # Often fails, slow
+}                            # test3 has never been run
+
+
+@pytest.fixture
+def job_runner(template, make_tests, job_params, in_tmp_dir, monkeypatch):
+    """A JobRunner for a sample test and four secret tests, with STATS as their statistics"""
+    monkeypatch.setattr(template.TestStats, 'load', lambda self: STATS)
+    tests = make_tests([('', '')] * 5)
+    return template.JobRunner('', 'python3', job_params, tests, None)
+
+
+def test_secret_tests_run_in_order_by_default(template, job_runner):
+    assert template.KNOWN_PARAMS['order_by_failures'] is False
+    job_runner.params['show_tests'] = [3]
+    assert job_runner.test_sequence() == [0, 3, 1, 2, 4]
+
+
+def test_failure_ordered(job_runner):
+    # Failures per CPU sec: test1 1/12 / 0.1, test2 6/12 / 0.1, test3 1/2 / 0.4 (the mean), test4 6/12 / 1.0
+    assert job_runner.failure_ordered([1, 2, 3, 4]) == [2, 3, 1, 4]
+    job_runner.params['order_by_failures'] = True
+    assert job_runner.test_sequence() == [0, 2, 3, 1, 4]
+
+
+def test_failure_ordered_without_stats(template, job_runner, monkeypatch):
+    monkeypatch.setattr(template.TestStats, 'load', lambda self: {})
+    assert job_runner.failure_ordered([4, 1, 3, 2]) == [4, 1, 3, 2]
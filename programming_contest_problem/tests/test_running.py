@@ -0,0 +1,50 @@
+"""Tests of running a submission's tests, sequentially and in parallel"""
+import io
+import os
+
+import pytest
+
+SQUARE_PROGRAM = '''n = int(input())
+if n == 3:
+    print("wrong")
+elif n == 5:
+    while True: pass
+else:
+    print(n * n)
+'''
+
+
+def summary(results):
+    """The state and (test id, correct, got) of each row of the given Results"""
+    return results.state, [(row[1], row[0], row[4]) for row in results.table[1:]]
+
+
+@pytest.mark.parametrize('values, state', [
+    ([1, 2, 4], 'correct'),
+    ([1, 2, 3, 4], 'wrong_answer'),
+    ([1, 5, 2], 'timeout'),
+])
+def test_parallel_results_match_sequential(template, make_tests, job_params, in_tmp_dir, monkeypatch, values, state):
+    monkeypatch.setattr(os, 'cpu_count', lambda: 4)
+    job_params['pertest_timeout'] = 1
+    tests = make_tests([(f'{n}\n', f'{n * n}\n') for n in values])
+    outcomes = []
+    for max_parallel in [1, 3]:
+        job_params['max_parallel_tests'] = max_parallel
+        job_params['python_fork_server'] = False
+        job_runner = template.JobRunner(SQUARE_PROGRAM, 'python3', job_params, tests, None)
+        outcomes.append(summary(job_runner.compile_and_run()))
+    assert outcomes[0] == outcomes[1]
+    assert outcomes[0][0] == template.State[state]
+
+
+
+@pytest.mark.parametrize('data, lines', [
+    (b'', []),
+    (b'a\nb\n', [b'a', b'b']),
+    (b'a  \r\n\nb\n\n\n', [b'a', b'', b'b']),
+    (b'\n\nx', [b'', b'', b'x']),
+    (b'x\n \n\t\n', [b'x']),
+])
+def test_iter_byte_lines(template, data, lines):
+    assert list(template.iter_byte_lines(io.BytesIO(data))) == lines
@@ -0,0 +1,79 @@
+"""Tests of checking answers with a validator supplied in a zip"""
+import io
+import os
+import zipfile
+
+import pytest
+
+# Accepts the answer if it's the same word as the judge's answer and the
+# judge input file is readable.
+VALIDATOR_CPP = '''#include <fstream>
+#include <iostream>
+#include <string>
+
+int main(int argc, char **argv) {
+    std::ifstream input(argv[1]), answer(argv[2]);
+    std::string judge_input, expected, got;
+    if (!(input >> judge_input) || !(answer >> expected)) {
+        return 1;
+    }
+    std::cin >> got;
+    return got == expected ? 42 : 43;
+}
+'''
+
+ECHO_PROGRAM = '''word = input()
+print("wrong" if word == "bad" else word)
+'''
+
+
+@pytest.fixture
+def validator_params(job_params, in_tmp_dir):
+    """The job parameters for a problem with VALIDATOR_CPP as its validator"""
+    with zipfile.ZipFile('validator.zip', 'w') as archive:
+        archive.writestr('validate.cpp', VALIDATOR_CPP)
+    job_params['validator_zip_filename'] = 'validator.zip'
+    return job_params
+
+
+def test_memory_file(template):
+    fd = template.JobRunner.memory_file(io.BytesIO(b'judge data\n'))
+    try:
+        with open(f'/dev/fd/{fd}', 'rb') as infile:
+            assert infile.read() == b'judge data\n'
+        assert os.lseek(fd, 0, os.SEEK_CUR) == 0
+    finally:
+        os.close(fd)
+
+
+@pytest.mark.parametrize('got, verdict', [('yes\n', True), ('no\n', False)])
+def test_validator_check(template, make_tests, validator_params, got, verdict):
+    tests = make_tests([('question\n', 'yes\n')])
+    job_runner = template.JobRunner('', 'python3', validator_params, tests, None)
+    assert job_runner.validator_check(tests[0], got) is verdict
+    assert sorted(os.listdir('.')) == ['Validator', 'validator.zip', 'validator_feedback']  # No per-test files
+
+
+def test_validator_failure(template, make_tests, validator_params):
+    tests = make_tests([('', 'yes\n')])  # No judge input, so the validator fails
+    job_runner = template.JobRunner('', 'python3', validator_params, tests, None)
+    with pytest.raises(template.ValidatorFailure):
+        job_runner.validator_check(tests[0], 'yes\n')
+
+
+@pytest.mark.parametrize('words, state', [
+    (['one', 'two', 'three'], 'correct'),
+    (['one', 'bad', 'three'], 'wrong_answer'),
+])
+def test_parallel_validation_matches_sequential(template, make_tests, validator_params, monkeypatch, words, state):
+    monkeypatch.setattr(os, 'cpu_count', lambda: 4)
+    tests = make_tests([(f'{word}\n', f'{word}\n') for word in words])
+    outcomes = []
+    for max_parallel in [1, 3]:
+        validator_params['max_parallel_tests'] = max_parallel
+        job_runner = template.JobRunner(ECHO_PROGRAM, 'python3', validator_params, tests, None)
+        results = job_runner.compile_and_run()
+        outcomes.append((results.state, [(row[1], row[0]) for row in results.table[1:]]))
+        os.rename('Validator', f'Validator{max_parallel}')  # Each JobRunner builds its own
+    assert outcomes[0] == outcomes[1]
+    assert outcomes[0][0] == template.State[state]
@@ -3,16 +3,24 @@ CodeFeedback class - uses an AI to get feedback on a students code, given also t
 reference answer (author's solution).
 This version routes all requests to openrouter.ai through an Cloudflare worker:
 https://openrouterproxy2026.trampgeek.workers.dev/
+Feedback is cached on the Jobe host (see FeedbackCache) so that answers that
+differ only in layout, comments or variable names don't need another request.
+The cache is written only by the AI feedback worker (aifeedbackworker.py).
 """
 
 import ast
+import hashlib
+import os
 import re
 import json
+import time
+import uuid
 import urllib.request
 import urllib.error
 import signal
 
 from __secrets import CLOUDFLARE_API_KEY
+from __promptreducer import reduce_code, CodeTooLong, PromptStats
 
 
 # ======================================
@@ -69,6 +77,35 @@ SYSTEM_PROMPT = open("__ai_feedback_system_prompt.txt").read()
 #DEFAULT_MODEL = 'dsv4flash'
 DEFAULT_MODEL = 'gemini3.1f'
 
+# Feedback is cached on the Jobe host, keyed by a canonicalised AST of the
+# student's code (comments, layout and variable names don't matter) plus the
+# author's code, the extra prompt, the model and the system prompt.
+# Jobs run as the same users as the student code, so they only read the cache.
+# It is written by the worker, which runs as a dedicated user that owns
+# FEEDBACK_CACHE_ROOT, with the feedback for the deferred jobs it processes.
+# A job that misses just asks the LLM itself.
+FEEDBACK_CACHE_ROOT = '/var/cache/coderunner'
+FEEDBACK_CACHE_DIR = os.path.join(FEEDBACK_CACHE_ROOT, 'ai_feedback')
+FEEDBACK_CACHE_MODE = 0o755
+MAX_CACHE_ENTRIES = 5000
+
+# Deferred feedback jobs are queued as files in FEEDBACK_QUEUE_DIR by the
+# template. The worker (aifeedbackworker.py) stores each job's feedback in
+# FEEDBACK_STORE_DIR and serves it over https at <server url>/<job id>, where
+# the server url is the template's aifeedbackurl parameter. The feedback html
+# in the student's browser (and the Moodle export_ai_feedback.php page) fetch
+# it from there, so that url must be reachable from students' browsers. It
+# must be https, as browsers block plain http requests from an https page.
+# Both directories, and the cache directory, are created by the worker in
+# FEEDBACK_CACHE_ROOT, so that no Jobe user can create them first. The queue
+# has mode 1733 so that every Jobe user can add jobs but none can list, and
+# hence read, the others.
+FEEDBACK_QUEUE_DIR = os.path.join(FEEDBACK_CACHE_ROOT, 'ai_feedback_queue')
+FEEDBACK_STORE_DIR = os.path.join(FEEDBACK_CACHE_ROOT, 'ai_feedback_store')
+FEEDBACK_QUEUE_MODE = 0o1733
+FEEDBACK_STORE_MODE = 0o700
+FEEDBACK_SERVER_PORT = 8765
+
 
 # ======================================
 #  Custom timeout exception
@@ -80,6 +117,272 @@ class RequestTimeout(Exception):
 
 
 
+# ======================================
+#  Feedback cache
+# ======================================
+
+def canonicalise(code):
+    """Return a tuple (canonical, names) where canonical is a string dump of
+       the AST of the given code with all variable and parameter names
+       alpha-renamed to _v0, _v1, ... in order of first appearance and names
+       is the map from original to canonical names. Function, class, module
+       and builtin names are left unchanged.
+       Returns (None, None) if the code doesn't parse.
+    """
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None, None
+
+    bound = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            bound.add(node.id)
+        elif isinstance(node, ast.arg):
+            bound.add(node.arg)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            bound.add(node.name)
+
+    names = {}
+    def canonical_name(name):
+        if name not in bound:
+            return name
+        if name not in names:
+            names[name] = f'_v{len(names)}'
+        return names[name]
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            node.id = canonical_name(node.id)
+        elif isinstance(node, ast.arg):
+            node.arg = canonical_name(node.arg)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            node.name = canonical_name(node.name)
+    return ast.dump(tree, annotate_fields=False), names
+
+
+class FeedbackCache:
+    """A simple file-per-entry cache of AI feedback on the Jobe host.
+       Identifiers within `backquoted` code in the feedback are stored in
+       canonical form and mapped back to the current student's names on a
+       cache hit. Identifiers in the prose are left alone, as there's no
+       telling a variable `a` from the English word, so feedback whose prose
+       uses any longer variable name, or comments on naming, is not cached
+       at all.
+       Only the writer (the worker, which owns the cache) stores entries.
+       Anyone else uses the cache only if it can't have been written by a
+       job; see trusted.
+    """
+    def __init__(self, cache_dir=FEEDBACK_CACHE_DIR, max_entries=MAX_CACHE_ENTRIES, writer=False):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.writer = writer
+
+    @staticmethod
+    def key(canonical, *extras):
+        """The cache key for the given canonical code and other inputs"""
+        data = json.dumps([canonical] + [str(extra) for extra in extras])
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    @staticmethod
+    def map_code_spans(text, mapping):
+        """Return text with every identifier that's a key in mapping replaced
+           by its value, but only within `backquoted` code spans.
+        """
+        if not mapping:
+            return text
+        pattern = re.compile(r'(?<![\w⟨])(' + '|'.join(re.escape(name) for name in mapping) + r')(?![\w⟩])')
+        return re.sub(r'`[^`]*`', lambda span: pattern.sub(lambda m: mapping[m[1]], span[0]), text)
+
+    def trusted(self):
+        """True if the cache directory and its parent exist, only their owner
+           can write them and that owner is us if we're the writer, or some
+           other user (the worker's) if we're not.
+        """
+        try:
+            for path in [self.cache_dir, os.path.dirname(self.cache_dir)]:
+                stat = os.stat(path)
+                if stat.st_mode & 0o022 or (stat.st_uid == os.getuid()) != self.writer:
+                    return False
+            return True
+        except OSError:
+            return False
+
+    def get(self, key, names):
+        """Return the cached feedback for the given key, with canonical names
+           mapped back to the student's names, or None if there's no entry
+           or the cache isn't trusted.
+        """
+        if not self.trusted():
+            return None
+        try:
+            with open(os.path.join(self.cache_dir, key + '.json')) as infile:
+                feedback = json.load(infile)['feedback']
+        except (OSError, ValueError, KeyError):
+            return None
+        to_student = {f'⟨{canonical}⟩': name for name, canonical in names.items()}
+        for placeholder, name in to_student.items():
+            feedback = feedback.replace(placeholder, name)
+        if '⟨_v' in feedback:
+            return None  # Names we can't map back
+        return feedback
+
+    def put(self, key, names, feedback):
+        """Store the given feedback under the given key, if we're the writer
+           and it can be safely canonicalised. Return True if it was stored.
+           The cache is only an optimisation, so a failure to write it is not
+           an error.
+        """
+        prose = re.sub(r'`[^`]*`', '', feedback)
+        if feedback.startswith('Sorry') or re.search(r'\bnam(e|es|ed|ing)\b', prose, re.IGNORECASE):
+            return False
+        if any(re.search(rf'\b{re.escape(name)}\b', prose) for name in names if len(name) > 1):
+            return False  # Would be wrong for another student's names
+        if not self.writer or not self.trusted():
+            return False
+        to_canonical = {name: f'⟨{canonical}⟩' for name, canonical in names.items()}
+        filename = os.path.join(self.cache_dir, key + '.json')
+        temp_filename = f'{filename}.{os.getpid()}'
+        try:
+            with open(temp_filename, 'w') as outfile:
+                json.dump({'feedback': self.map_code_spans(feedback, to_canonical)}, outfile)
+            os.chmod(temp_filename, 0o644)
+            os.replace(temp_filename, filename)
+        except OSError:
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+            return False
+        self.evict()
+        return True
+
+    def evict(self):
+        """Delete the oldest tenth of the entries if there are too many."""
+        entries = os.listdir(self.cache_dir)
+        if len(entries) > self.max_entries:
+            paths = [os.path.join(self.cache_dir, entry) for entry in entries]
+            paths.sort(key=lambda path: os.path.getmtime(path) if os.path.exists(path) else 0)
+            for path in paths[:len(paths) // 10]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+# ======================================
+#  Deferred feedback queue
+# ======================================
+
+def prepare_feedback_dirs():
+    """Create the queue, store and cache directories with the right modes, as
+       the worker's user. Raise RuntimeError if any already exists but belongs
+       to another user, who could then read or tamper with the jobs or cache.
+    """
+    for path, mode in [(FEEDBACK_QUEUE_DIR, FEEDBACK_QUEUE_MODE), (FEEDBACK_STORE_DIR, FEEDBACK_STORE_MODE),
+                       (FEEDBACK_CACHE_DIR, FEEDBACK_CACHE_MODE)]:
+        os.makedirs(path, exist_ok=True)
+        if os.stat(path).st_uid != os.getuid():
+            raise RuntimeError(f"{path} belongs to another user. Delete it and restart the worker.")
+        os.chmod(path, mode)
+
+
+def enqueue_feedback_job(student_code, authors_code, extra_prompt='', model=DEFAULT_MODEL):
+    """Add a feedback job to the queue for later processing by the worker.
+       Return the job id, which is also the name (without extension) of the
+       file in FEEDBACK_STORE_DIR to which the feedback will be written.
+       Raise RuntimeError if the queue hasn't been set up by the worker, i.e.
+       if it doesn't have the right mode or doesn't belong to the owner of
+       its parent directory, which only that owner can write.
+    """
+    try:
+        queue_stat = os.stat(FEEDBACK_QUEUE_DIR)
+        root_stat = os.stat(os.path.dirname(FEEDBACK_QUEUE_DIR))
+    except FileNotFoundError:
+        raise RuntimeError("the AI feedback worker isn't running on this host")
+    queue_mode = queue_stat.st_mode & 0o7777
+    if queue_mode != FEEDBACK_QUEUE_MODE:
+        raise RuntimeError(f"the AI feedback queue has mode {queue_mode:o}, not {FEEDBACK_QUEUE_MODE:o}")
+    if root_stat.st_mode & 0o022 or queue_stat.st_uid != root_stat.st_uid:
+        raise RuntimeError("the AI feedback queue wasn't created by the worker")
+    job_id = uuid.uuid4().hex
+    job = {
+        'id': job_id,
+        'time': time.time(),
+        'model': model,
+        'student_code': student_code,
+        'authors_code': authors_code,
+        'extra_prompt': extra_prompt,
+    }
+    filename = os.path.join(FEEDBACK_QUEUE_DIR, job_id + '.json')
+    with open(filename + '.tmp', 'w') as outfile:
+        json.dump(job, outfile)
+    os.chmod(filename + '.tmp', 0o644)  # For the worker, which can't list the queue
+    os.replace(filename + '.tmp', filename)  # Atomic, so the worker never sees a partial job
+    return job_id
+
+
+def process_feedback_queue(get_feedback=None):
+    """Process all jobs currently in the queue, oldest first, storing the
+       feedback for each as json in FEEDBACK_STORE_DIR. get_feedback, which defaults to the get_feedback
+       method of a CodeFeedback(model) that writes the cache, is a function
+       (model, student_code, authors_code, extra_prompt) -> feedback text.
+       Jobs are claimed by renaming, so multiple workers can share a queue.
+       Return the number of jobs processed.
+    """
+    if get_feedback is None:
+        get_feedback = lambda model, *args: CodeFeedback(model, cache_writer=True).get_feedback(*args)
+    try:
+        filenames = [name for name in os.listdir(FEEDBACK_QUEUE_DIR) if name.endswith('.json')]
+    except FileNotFoundError:
+        return 0
+    paths = [os.path.join(FEEDBACK_QUEUE_DIR, name) for name in filenames]
+    paths.sort(key=lambda path: os.path.getmtime(path) if os.path.exists(path) else 0)
+    num_done = 0
+    for path in paths:
+        claimed = path + '.claimed'
+        try:
+            os.rename(path, claimed)
+        except OSError:
+            continue  # Another worker got there first
+        try:
+            with open(claimed) as infile:
+                job = json.load(infile)
+            feedback = get_feedback(job['model'], job['student_code'], job['authors_code'], job['extra_prompt'])
+            store_filename = os.path.join(FEEDBACK_STORE_DIR, job['id'] + '.json')
+            with open(store_filename + '.tmp', 'w') as outfile:
+                json.dump({'feedback': feedback}, outfile)
+            os.replace(store_filename + '.tmp', store_filename)
+            num_done += 1
+        except Exception as e:
+            print(f"Failed to process feedback job {path}: {e}")
+        finally:
+            if os.path.exists(claimed):
+                os.remove(claimed)
+    return num_done
+
+
+def deferred_feedback_url(server_url, job_id):
+    """Return the url from which the feedback for the given job can be
+       fetched, given the worker's server url. Raise ValueError if the
+       server url isn't an https url.
+    """
+    if not isinstance(server_url, str) or not server_url.startswith('https://'):
+        raise ValueError("deferred AI feedback needs an https aifeedbackurl template parameter")
+    return server_url.rstrip('/') + '/' + job_id
+
+
+def stored_feedback(job_id):
+    """Return the stored feedback text for the given job id, or None if
+       there isn't any (yet) or the id isn't a valid job id.
+    """
+    if not re.fullmatch(r'[0-9a-f]{32}', job_id):
+        return None
+    try:
+        with open(os.path.join(FEEDBACK_STORE_DIR, job_id + '.json')) as infile:
+            return json.load(infile)['feedback']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
 # ======================================
 #  CodeFeedback class
 # ======================================
@@ -87,10 +390,13 @@ class RequestTimeout(Exception):
 class CodeFeedback:
     """Get feeback on given student's codeusing the given LLM model, which must be 
        a key in the above models list.
+       Only the worker should set cache_writer; see FeedbackCache.
     """
-    def __init__(self, model=DEFAULT_MODEL):
+    def __init__(self, model=DEFAULT_MODEL, cache_writer=False):
         self.model = model
+        self.cache_writer = cache_writer
         self.system_prompt = SYSTEM_PROMPT
+        self.prompt_stats = PromptStats()
 
 
         # Choose endpoint
@@ -108,9 +414,22 @@ class CodeFeedback:
     # --------------------------------------
     # Public API
     # --------------------------------------
-    def get_feedback(self, student_code, authors_code, extra_prompt=''):
+    def get_feedback(self, student_code, authors_code, extra_prompt='', use_cache=True):
+        if not isinstance(extra_prompt, str):
+            extra_prompt = ', '.join(extra_prompt)  # E.g. a list of taught constructs
         prompt = self.system_prompt.replace("{{EXTRA_GUIDANCE}}", extra_prompt)
-        return self.ask_llm(student_code, authors_code, self.system_prompt)
+        canonical, names = canonicalise(student_code) if use_cache else (None, None)
+        if canonical is None:
+            return self.ask_llm(student_code, authors_code, self.system_prompt)
+
+        cache = FeedbackCache(writer=self.cache_writer)
+        key = cache.key(canonical, authors_code.strip(), extra_prompt, self.model, self.system_prompt)
+        feedback = cache.get(key, names)
+        if feedback is None:
+            feedback = self.ask_llm(student_code, authors_code, self.system_prompt)
+            if self.cache_writer:
+                cache.put(key, names, feedback)
+        return feedback
 
 
  
@@ -118,6 +437,20 @@ class CodeFeedback:
     #  Core request + timeout logic
     # --------------------------------------
     def ask_llm(self, student_code, authors_code, system_prompt):
+        # Feedback is cached by the student's AST, so the comments and layout
+        # of the student's code are left out of the prompt too. The author's
+        # code is fully reduced.
+        original_code = student_code + authors_code
+        try:
+            student_code = ast.unparse(ast.parse(student_code))
+        except (SyntaxError, ValueError):
+            pass  # Not cached either
+        try:
+            student_code = reduce_code(student_code)
+            authors_code = reduce_code(authors_code)
+        except CodeTooLong as e:
+            return f"Sorry, no feedback is available ({e})."
+        self.prompt_stats.record(original_code, student_code + authors_code)
 
         # Handler that SIGALRM invokes
         def timeout_handler(signum, frame):
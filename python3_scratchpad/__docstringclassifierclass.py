@@ -12,6 +12,7 @@ import urllib.error
 import signal
 
 from __secrets import OPEN_ROUTER_KEY
+from __promptreducer import reduce_code, CodeTooLong, PromptStats
 
 
 # ======================================
@@ -19,6 +20,7 @@ from __secrets import OPEN_ROUTER_KEY
 # ======================================
 
 TIMEOUT = 6     # Hard wall-clock timeout in seconds
+STREAM = True   # Use streamed (SSE) responses and stop reading once the verdict is known
 
 MODELS = {
     'dsr1:14b-cosc': "deepseek-r1:14b",
@@ -65,6 +67,20 @@ PROGRAM_SYSTEM_PROMPT   = open("program_system_prompt.txt").read()
 DEFAULT_MODEL = 'gemma3:27b-cosc'
 DEFAULT_MODEL = 'gemini3.1f'
 
+# Patterns that, matched against the whole of the lower-cased docstring with
+# white space collapsed, mark it as an obvious placeholder. Such docstrings
+# are rejected without asking the LLM; everything else goes to the LLM.
+# Each must match the whole docstring, as the same phrases can occur in a
+# genuine one (e.g. "TODO list manager", "Does things in order").
+PLACEHOLDER_PATTERNS = [re.compile(pattern) for pattern in [
+    r'(todo|tbd|fixme)(:.*|\W*)',
+    r'this is a (function|docstring)\.?',
+    r'a function that does (stuff|things|something)\.?',
+    r'(it )?does (stuff|things)\.?',
+    r'((blah|asdf)\W*)+',
+    r'lorem ipsum dolor sit amet\b.*',
+]]
+
 
 # ======================================
 #  Custom timeout exception
@@ -76,6 +92,52 @@ class RequestTimeout(Exception):
 
 
 
+# ======================================
+#  Incremental <think> stripping
+# ======================================
+
+class ThinkStripper:
+    """Strips <think>...</think> blocks from text that arrives in chunks,
+       as in a streamed response. Tags split across chunks are handled.
+    """
+    OPEN, CLOSE = '<think>', '</think>'
+
+    def __init__(self):
+        self.in_think = False
+        self.pending = ''
+
+    def feed(self, chunk):
+        """Add the next chunk of text and return any new visible text"""
+        self.pending += chunk
+        visible = ''
+        while True:
+            tag = self.CLOSE if self.in_think else self.OPEN
+            i = self.pending.find(tag)
+            if i >= 0:
+                if not self.in_think:
+                    visible += self.pending[:i]
+                self.pending = self.pending[i + len(tag):]
+                self.in_think = not self.in_think
+            else:
+                # Hold back any suffix that might be the start of a split tag
+                keep = next((n for n in range(len(tag) - 1, 0, -1)
+                             if self.pending.endswith(tag[:n])), 0)
+                if not self.in_think:
+                    visible += self.pending[:len(self.pending) - keep]
+                self.pending = self.pending[len(self.pending) - keep:]
+                return visible
+
+
+def verdict_complete(text):
+    """True if the (think-stripped) reply text already contains a complete
+       verdict: VALID, or INVALID followed by a reason sentence.
+    """
+    text = text.lstrip()
+    if text.startswith('VALID'):
+        return True
+    return re.match(r'INVALID\b.*?\w.*?[.!?\n]', text, flags=re.DOTALL) is not None
+
+
 # ======================================
 #  Classifier
 # ======================================
@@ -83,9 +145,13 @@ class RequestTimeout(Exception):
 class DocstringClassifier:
     """Classify docstrings using the given LLM model, which must be 
        a key in the above models list.
+       Function docstrings that are obvious placeholders (see
+       placeholder_match) are rejected without calling the LLM.
     """
-    def __init__(self, model=DEFAULT_MODEL):
+    def __init__(self, model=DEFAULT_MODEL, stream=STREAM):
         self.model = model
+        self.stream = stream
+        self.prompt_stats = PromptStats()
         self.function_system_prompt = FUNCTION_SYSTEM_PROMPT + "\nFunction whose docstring is to be classified:\n"
         self.program_system_prompt   = PROGRAM_SYSTEM_PROMPT   + "\nProgram whose module docstring is to be classified:\n"
 
@@ -115,12 +181,34 @@ class DocstringClassifier:
             return None
 
 
+    # --------------------------------------
+    # Cheap local check for placeholder docstrings
+    # --------------------------------------
+    @staticmethod
+    def placeholder_match(docstring):
+        """Return the given docstring, normalised, if it's an obvious
+           placeholder (see PLACEHOLDER_PATTERNS), or None if it isn't.
+        """
+        text = ' '.join(docstring.lower().split())
+        for pattern in PLACEHOLDER_PATTERNS:
+            match = pattern.fullmatch(text)
+            if match:
+                return match.group()
+        return None
+
+
     # --------------------------------------
     # Public API
     # --------------------------------------
     def classify_module_docstring(self, program):
         program = program.rstrip() + "\n"
-        return self.ask_llm(program, self.program_system_prompt)
+        # Function bodies are irrelevant to the module docstring
+        try:
+            reduced = reduce_code(program, elide_bodies=True)
+        except CodeTooLong as e:
+            return f"VALID - but not LLM checked ({e})"
+        self.prompt_stats.record(program, reduced)
+        return self.ask_llm(reduced, self.program_system_prompt)
 
 
     def classify_function_docstring(self, function_string, use_llm=True):
@@ -132,7 +220,15 @@ class DocstringClassifier:
             return "INVALID - docstring must have at least 3 words."
         if not use_llm:
             return "VALID - but not checked by the LLM"
-        return self.ask_llm(function_string, self.function_system_prompt)
+        placeholder = self.placeholder_match(docstring)
+        if placeholder:
+            return f"INVALID - '{placeholder}' is a placeholder, not a docstring."
+        try:
+            reduced = reduce_code(function_string)
+        except CodeTooLong as e:
+            return f"VALID - but not LLM checked ({e})"
+        self.prompt_stats.record(function_string, reduced)
+        return self.ask_llm(reduced, self.function_system_prompt)
 
 
     # --------------------------------------
@@ -172,6 +268,7 @@ class DocstringClassifier:
                     }
                 ],
                 "provider": {"zdr": True},
+                "stream": self.stream,
             }
 
             request = urllib.request.Request(
@@ -183,6 +280,8 @@ class DocstringClassifier:
 
             # This blocking call **will** be interrupted by SIGALRM on Linux
             with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+                if self.stream:
+                    return self.read_streamed_reply(response)
                 result = json.loads(response.read().decode())
                 msg = result["choices"][0]["message"]["content"]
 
@@ -211,6 +310,43 @@ class DocstringClassifier:
             signal.signal(signal.SIGALRM, old_handler)
 
 
+    # --------------------------------------
+    #  Streamed (SSE) response handling
+    # --------------------------------------
+    @staticmethod
+    def read_streamed_reply(response):
+        """Read a streamed chat completion from the given response, stripping
+           <think> blocks as they arrive. Stop reading (which closes the
+           connection) as soon as the verdict is complete.
+           Return the visible reply text, or a "VALID - but not LLM checked"
+           message if the stream carries an error or ends with no verdict,
+           as the non-streamed path does for a failed request.
+        """
+        stripper = ThinkStripper()
+        text = ''
+        for raw_line in response:
+            line = raw_line.decode('utf-8', errors='replace').strip()
+            if not line.startswith('data:'):
+                continue  # Blank separator lines and SSE comments
+            payload = line[len('data:'):].strip()
+            if payload == '[DONE]':
+                break
+            event = json.loads(payload)
+            if 'error' in event:
+                error = event['error']
+                message = error.get('message', error) if isinstance(error, dict) else error
+                return f"VALID - but not LLM checked (the LLM returned an error '{message}')"
+            choices = event.get('choices') or [{}]
+            delta = choices[0].get('delta', {}).get('content') or ''
+            text += stripper.feed(delta)
+            if verdict_complete(text):
+                break
+        text = text.strip()
+        if not text.startswith(('VALID', 'INVALID')):
+            return "VALID - but not LLM checked (the LLM's reply had no verdict)"
+        return text
+
+
 # ======================================
 #  Test
 # ======================================
@@ -1,10 +1,14 @@
 """Define support functions for testing of matplotlib questions.
    The main function is print_plot_info, which displays suitably formatted
-   data about the current matplotlib plot.
+   data about the current matplotlib plot. print_figure_fingerprint instead
+   prints a digest of the whole figure, for comparing figures without
+   printing or rendering them.
 
    This module works only if imported *after* a call to matplotlibg.use("Agg") has
    been done.
 """
+import hashlib
+import json
 import traceback
 import numpy as np
 import matplotlib.pyplot as plt
@@ -28,6 +32,7 @@ DEFAULT_PARAMS = {
     'sort_points': False,  # True to sort data by x then y.
     'first_num_points': 5,  # Number of points to print at the start of the point list.
     'last_num_points': 5,  # Number of points to print at the end of the point list.
+    'downsample_points': None,  # If non-None (at least 3), print this many representative points (LTTB) of larger datasets.
     'float_precision': (1, 1),  # Num digits to display after decimal point for x and y values resp
     'max_label_length': 60,  # Use multiline display if tick label string length exceeds this
     'lines_to_print': None,  # If non-None, a list of indices of lines to print (0 is first line).
@@ -35,6 +40,36 @@ DEFAULT_PARAMS = {
 }
 
 
+def lttb_downsample(data, num_points):
+    """Return num_points representative points from the given N x 2 array of
+       points using the Largest-Triangle-Three-Buckets algorithm, which
+       preserves the visual shape of a line. The first and last points are
+       always kept; the rest are split into equal-size buckets from each of
+       which the point forming the largest triangle with the previously
+       selected point and the mean of the next bucket is chosen.
+       O(N) and deterministic. If there are no more than num_points points
+       (or num_points < 3) the data is returned unchanged.
+    """
+    data = np.asarray(data, dtype=float)
+    n = len(data)
+    if num_points < 3 or n <= num_points:
+        return data
+    edges = np.linspace(1, n - 1, num_points - 1).astype(int)  # Bucket boundaries
+    selected = np.empty(num_points, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    prev_x, prev_y = data[0]
+    for i in range(num_points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = data[end:next_end].mean(axis=0)
+        bucket = data[start:end]
+        areas = np.abs((prev_x - avg_x) * (bucket[:, 1] - prev_y)
+                       - (prev_x - bucket[:, 0]) * (avg_y - prev_y))
+        selected[i + 1] = start + np.argmax(areas)
+        prev_x, prev_y = data[selected[i + 1]]
+    return data[selected]
+
+
 class PlotChecker:
     """Wrapper for all the internal methods used to print plot info."""
 
@@ -46,20 +81,25 @@ class PlotChecker:
     @staticmethod
     def my_interpolate(data, xs):
         """Return the spline interpolated list of (x, y) values at abscissa xs, given
-           a list of (x, y) pairs
+           a list of (x, y) pairs. A line of just two points is linearly
+           interpolated (or extrapolated) at all xs in one vectorised operation.
         """
-
-        def linear(x, xa, ya, xb, yb):
-            return ya + (x - xa) / (xb - xa) * (yb - ya)
-
         if len(data[:, 0]) == 2:
-            x0, y0 = data[0][0], data[0][1]
-            x1, y1 = data[-1][0], data[-1][1]
-            return [(x, linear(x, x0, y0, x1, y1)) for x in xs]
+            (x0, y0), (x1, y1) = data[0], data[-1]
+            xs_array = np.asarray(xs, dtype=float)
+            return zip(xs, y0 + (xs_array - x0) / (x1 - x0) * (y1 - y0))
         else:  # cubic
             tck = interpolate.splrep(data[:, 0], data[:, 1], s=0)  # Cubic spline interpolator
             return zip(xs, interpolate.splev(xs, tck))  # Evaluate at required x values
 
+    @staticmethod
+    def sorted_points(points):
+        """Return the given N x 2 array of points sorted by x then y"""
+        points = np.asarray(points)
+        if len(points) == 0:
+            return points
+        return points[np.lexsort((points[:, 1], points[:, 0]))]
+
     @staticmethod
     def fmt_float(value, digits_precision=2):
         """Return a formatted floating point number to the precision specified,
@@ -101,8 +141,17 @@ class PlotChecker:
     
     
     def print_points(self, data):
-        """Print a subset of the given points"""
+        """Print a subset of the given points: either a downsampled
+           representative set, if the downsample_points param is set and
+           there are more points than that, or the first and last few.
+        """
         print(f"Num points: {len(data)}")
+        num_samples = self.params['downsample_points']
+        if num_samples and len(data) > num_samples:
+            data = lttb_downsample(data, num_samples)
+            points = '\n    '.join(self.fmt_float_pair(p) for p in data)
+            print(f"Downsampled to {len(data)} points:\n    {points}")
+            return
         n = min(len(data), self.params['first_num_points'])
         if n:
             points = '\n    '.join(self.fmt_float_pair(p) for p in data[:n])
@@ -129,7 +178,7 @@ class PlotChecker:
         print("Line style: None")
         points = scatter.get_offsets()
         if self.params['sort_points']:
-            points = np.array(sorted([[point[0], point[1]] for point in points]))
+            points = self.sorted_points(points)
             print("Plotted data, after sorting ...")        
         self.print_points(points)
 
@@ -152,7 +201,7 @@ class PlotChecker:
         data = line.get_xydata()
 
         if self.params['sort_points']:
-            data = np.array(sorted([[row[0], row[1]] for row in data]))
+            data = self.sorted_points(data)
             print("Plotted data, after sorting ...")
 
         if xsamples is not None:
@@ -392,5 +441,118 @@ def print_plot_info(data_type, **kwparams):
         print(f"Unknown parameter(s) passed to print_plot_info: {', '.join(unknown_params)}")
         return
 
+    downsample_points = kwparams.get('downsample_points')
+    if downsample_points is not None and (not isinstance(downsample_points, int) or downsample_points < 3):
+        print(f"downsample_points must be an integer of at least 3, not {downsample_points!r}")
+        return
+
     checker = PlotChecker(kwparams)
-    checker.print_info(data_type)
\ No newline at end of file
+    checker.print_info(data_type)
+
+
+def quantise(values, float_precision):
+    """Return the given number or array of numbers rounded to float_precision
+       decimal places as a (possibly nested) list, with -0.0 replaced by 0.0.
+    """
+    rounded = np.round(np.asarray(values, dtype=float), float_precision) + 0.0
+    return rounded.tolist()
+
+
+def quantised_digest(values, float_precision):
+    """Return a compact string identifying the given (possibly large) array
+       of numbers after quantisation: its shape plus a digest of its data.
+    """
+    rounded = np.ascontiguousarray(np.round(np.asarray(values, dtype=float), float_precision) + 0.0)
+    return f"{rounded.shape}:{hashlib.sha256(rounded.tobytes()).hexdigest()[:16]}"
+
+
+def axes_fingerprint(axes, float_precision):
+    """Return a canonical JSON-serialisable structure describing the given axes.
+       Line and scatter data are represented by digests, to keep the
+       structure small however many points are plotted.
+    """
+    def colour(c):
+        return quantise(colors.to_rgba(c), 2)
+
+    def texts(objects):
+        return [text.get_text() for text in objects]
+
+    legend = axes.get_legend()
+    structure = {
+        'title': axes.get_title(),
+        'xlabel': axes.get_xlabel(),
+        'ylabel': axes.get_ylabel(),
+        'xlim': quantise(axes.get_xlim(), float_precision),
+        'ylim': quantise(axes.get_ylim(), float_precision),
+        'xticks': quantise(axes.get_xticks(), float_precision),
+        'yticks': quantise(axes.get_yticks(), float_precision),
+        'xticklabels': texts(axes.get_xticklabels()),
+        'yticklabels': texts(axes.get_yticklabels()),
+        'legend': None if legend is None else texts(legend.get_texts()),
+        'lines': [{
+            'data': quantised_digest(line.get_xydata(), float_precision),
+            'colour': colour(line.get_color()),
+            'marker': str(line.get_marker()),
+            'linestyle': str(line.get_linestyle()),
+            'label': line.get_label(),
+        } for line in axes.get_lines()],
+        'collections': [{
+            'offsets': quantised_digest(collection.get_offsets(), float_precision),
+            'facecolours': quantise(collection.get_facecolors(), 2),
+        } for collection in axes.collections],
+        'patches': [{
+            'type': type(patch).__name__,
+            'vertices': quantise(patch.get_patch_transform().transform(patch.get_path().vertices),
+                                 float_precision),
+            'facecolour': colour(patch.get_facecolor()),
+        } for patch in axes.patches],
+    }
+    return structure
+
+
+def figure_fingerprint(fig=None, float_precision=3):
+    """Return a tuple (structure, digest) for the given figure (default: the
+       current one). structure is a canonical JSON-serialisable description
+       of the figure's axes, lines, collections, patches, ticks and labels,
+       with all floats rounded to float_precision decimal places; digest is
+       its sha256 hex digest. Nothing is rendered, so two figures can be
+       compared far more cheaply than by rasterising them.
+    """
+    if fig is None:
+        fig = plt.gcf()
+    structure = {
+        'suptitle': [text.get_text() for text in fig.texts],
+        'axes': [axes_fingerprint(axes, float_precision) for axes in fig.get_axes()],
+    }
+    canonical = json.dumps(structure, sort_keys=True, separators=(',', ':'))
+    return structure, hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def first_fingerprint_difference(expected, got, path='figure'):
+    """Return a string giving the path to the first point of difference
+       between the two given fingerprint structures, e.g.
+       "figure.axes[0].lines[1].data", or None if they are the same.
+    """
+    if isinstance(expected, dict) and isinstance(got, dict):
+        for key in sorted(set(expected) | set(got)):
+            if key not in expected or key not in got:
+                return f"{path}.{key}"
+            difference = first_fingerprint_difference(expected[key], got[key], f"{path}.{key}")
+            if difference:
+                return difference
+        return None
+    if isinstance(expected, list) and isinstance(got, list):
+        for i, (expected_item, got_item) in enumerate(zip(expected, got)):
+            difference = first_fingerprint_difference(expected_item, got_item, f"{path}[{i}]")
+            if difference:
+                return path if isinstance(expected_item, (float, int)) else difference
+        return path if len(expected) != len(got) else None
+    return None if expected == got else path
+
+
+def print_figure_fingerprint(float_precision=3):
+    """Print the digest of the current figure's fingerprint. Suitable as test
+       code in useanswerfortests questions to check an entire figure without
+       printing or rendering it.
+    """
+    print("Figure fingerprint:", figure_fingerprint(float_precision=float_precision)[1])
@@ -0,0 +1,111 @@
+"""Code for reducing the size of Python code before it is sent to an LLM.
+   Prompt tokens drive both latency and cost, so comments, blank lines and
+   (where the check doesn't need them) function bodies are removed.
+   Code that is still too long after reduction isn't truncated, as the LLM
+   would then comment on code it can't see; CodeTooLong is raised instead.
+"""
+
+import ast
+import io
+import tokenize
+
+MAX_PROMPT_CHARS = 12000   # Reduced code longer than this isn't sent to the LLM
+CHARS_PER_TOKEN = 4        # Rough estimate, good enough for instrumentation
+
+
+class CodeTooLong(ValueError):
+    """Raised by reduce_code if the reduced code is still too long"""
+    def __init__(self, length, max_chars):
+        super().__init__(f"the code is too long for the LLM ({length} characters after reduction, limit {max_chars})")
+
+
+def estimate_tokens(text):
+    """A rough estimate of the number of LLM tokens in the given text"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def strip_comments_and_blank_lines(code):
+    """Return code with all comments and blank lines removed. Lines within
+       multiline strings are left unchanged. If the code can't be tokenised
+       it is returned unchanged.
+    """
+    lines = code.splitlines()
+    comment_starts = {}   # Map from 0-origin line number to column of comment
+    in_string = set()     # 0-origin numbers of lines that continue a multiline string
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(code).readline):
+            if token.type == tokenize.COMMENT:
+                comment_starts[token.start[0] - 1] = token.start[1]
+            elif token.type == tokenize.STRING and token.end[0] > token.start[0]:
+                in_string.update(range(token.start[0], token.end[0]))
+    except (tokenize.TokenError, SyntaxError):
+        return code
+
+    result = []
+    for i, line in enumerate(lines):
+        if i in comment_starts:
+            line = line[:comment_starts[i]]
+        if i in in_string or line.strip():
+            result.append(line.rstrip())
+    return '\n'.join(result) + '\n'
+
+
+def elide_function_bodies(code):
+    """Return code with the body of every top-level function and method
+       replaced by '...', leaving just the signature and docstring. If the
+       code doesn't parse it is returned unchanged.
+    """
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return code
+
+    functions = []
+    for node in tree.body:
+        candidates = node.body if isinstance(node, ast.ClassDef) else [node]
+        functions += [func for func in candidates
+                      if isinstance(func, (ast.FunctionDef, ast.AsyncFunctionDef))]
+
+    lines = code.splitlines()
+    for func in sorted(functions, key=lambda func: func.lineno, reverse=True):
+        body = func.body
+        if ast.get_docstring(func, clean=False) is not None:
+            body = body[1:]
+        if not body or body[0].lineno == func.lineno:
+            continue  # Nothing to elide, or a one-line function
+        first, last = body[0].lineno - 1, func.end_lineno
+        indent = lines[first][:len(lines[first]) - len(lines[first].lstrip())]
+        lines[first:last] = [indent + '...']
+    return '\n'.join(lines) + '\n'
+
+
+def reduce_code(code, strip_comments=True, elide_bodies=False, max_chars=MAX_PROMPT_CHARS):
+    """Return the reduced version of the given code, applying the given
+       reductions. Raise CodeTooLong if the result is longer than max_chars.
+    """
+    reduced = code
+    if elide_bodies:
+        reduced = elide_function_bodies(reduced)
+    if strip_comments:
+        reduced = strip_comments_and_blank_lines(reduced)
+    if len(reduced) > max_chars:
+        raise CodeTooLong(len(reduced), max_chars)
+    return reduced
+
+
+class PromptStats:
+    """Records the estimated prompt tokens before and after reduction, for
+       instrumentation.
+    """
+    def __init__(self):
+        self.original_tokens = 0
+        self.reduced_tokens = 0
+
+    def record(self, original, reduced):
+        """Record the reduction of the text original to the text reduced"""
+        self.original_tokens += estimate_tokens(original)
+        self.reduced_tokens += estimate_tokens(reduced)
+
+    def __str__(self):
+        saved = self.original_tokens - self.reduced_tokens
+        return f"prompt ~{self.reduced_tokens} tokens, saved ~{saved}"
@@ -71,6 +71,16 @@ class StyleChecker:
         return self._tree
     
     
+    def timing(self, t0, t1, classifier):
+        """Return the instrumentation string for an LLM check that ran
+           from time t0 to t1. When fail_all_llm_checks is set (which authors
+           use to see all LLM results) the prompt token savings are included.
+        """
+        timing = f"{(t1 - t0):.1f} secs"
+        if self.fail_all_llm_checks:
+            timing += f", {classifier.prompt_stats}"
+        return timing
+
     def check_function_docstrings(self):
         """Extract all the function docstrings and check
            them. Only the last non-main function is checked
@@ -102,7 +112,7 @@ class StyleChecker:
             t1 = time.perf_counter()
             done_one = True
             if self.fail_all_llm_checks or validity.startswith('INVALID'):
-                bad_docstrings.append(f"Docstring for function {fname}: {validity} ({(t1 - t0):.1f} secs)")
+                bad_docstrings.append(f"Docstring for function {fname}: {validity} ({self.timing(t0, t1, classifier)})")
         return bad_docstrings
     
 
@@ -131,7 +141,7 @@ class StyleChecker:
             result = classifier.classify_module_docstring(self.student_answer)
             t1 = time.perf_counter()
             if self.fail_all_llm_checks or not result.startswith('VALID'):
-                return [f"Module docstring: {result} ({(t1 - t0):.1f} secs)"]
+                return [f"Module docstring: {result} ({self.timing(t0, t1, classifier)})"]
             else:
                 return []
 
@@ -7,10 +7,21 @@ import html
 import re
 import base64
 from collections import defaultdict
+from itertools import zip_longest
 from urllib.parse import quote
 
 MAX_STRING_LENGTH = 4000  # 4k is default maximum string length
 
+# Float pattern from Markus Schmassmann at
+# https://stackoverflow.com/questions/12643009/regular-expression-for-floating-point-numbers
+# except we don't match inf or nan which can be embedded in text strings.
+FLOAT_PATTERN = re.compile(r'([-+]?(?:(?:(?:[0-9]+[.]?[0-9]*|[.][0-9]+)(?:[ed][-+]?[0-9]+)?)))')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+NON_FINITE_FLOATS = {'inf', 'infinity', 'nan'}
+# The line boundaries recognised by str.splitlines
+LINE_BREAK_PATTERN = re.compile('\r\n|[\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]')
+NUMPY_MIN_FLOATS = 64  # Lines with fewer numeric tokens than this are compared without numpy
+
 
 class ResultTable:
     def __init__(self, params):
@@ -33,10 +44,13 @@ class ResultTable:
         self.column_formats = {}  # Map from raw column name to format
         self.column_formats_by_hdr = {}  # Map from header name to format
         self.images = defaultdict(list)
+        self.first_differences = []  # (row_num, line_num, column) for visible failing rows
         default_params = {
             'stdinfromextra': False,
             'strictwhitespace': True,
             'floattolerance': None,
+            'reportfirstdifference': False,
+            'elidehiddenrows': False,
             'resultcolumns': [['Test', 'testcode'], ['Input', 'stdin'], ['Expected', 'expected'], ['Got', 'got']],
             'ALL_OR_NOTHING': True
         }
@@ -120,22 +134,25 @@ class ResultTable:
         """Return the current result table, with images added to appropriate cells.
            Columns that contain images anywhere are converted to %h format and existing content in that column
            is html-escaped, newlines replaced with <br> and wrapped in a div.
+           The table isn't cloned: only rows that need changing are copied,
+           and all other rows are shared with self.table, so callers must not
+           modify the returned rows.
            """
-        result_table = [row[:] for row in self.table]  # Clone the result table
-
-        # Htmlise all columns containing images
-        for col_num in self.image_column_nums():
-            for row_num in range(1, len(result_table)):
-                result_table[row_num][col_num] = self.htmlise(result_table[row_num][col_num])
-
-        # Append images
-        for ((col,row), image_list) in self.images.items():
-            for image in image_list:
-                try:
-                    result_table[row][col] += "<br>" + image
-                except IndexError:
-                    pass  # Testing must have aborted so discard image
-
+        image_columns = self.image_column_nums()
+        if not image_columns:
+            return list(self.table)
+
+        result_table = [self.table[0]]
+        for row_num, row in enumerate(self.table[1:], 1):
+            # Htmlise all columns containing images, then append the images
+            new_row = list(row)
+            for col_num in image_columns:
+                cell = self.htmlise(row[col_num])
+                for image in self.images.get((col_num, row_num), []):
+                    cell += "<br>" + image
+                new_row[col_num] = cell
+            result_table.append(new_row)
+        # Images for rows beyond the end of the table are discarded (testing must have aborted)
         return result_table
 
     def reset(self):
@@ -144,6 +161,7 @@ class ResultTable:
         self.global_error = ''
         self.num_failed_tests = self.mark = 0
         self.failed_hidden = self.hiding = self.aborted = False
+        self.first_differences = []
 
     def tests_missed(self, num):
         """Record the fact that we're missing some test results (timeout?)"""
@@ -169,8 +187,53 @@ class ResultTable:
         return '<pre>' + extra + '</pre>'
 
     def add_row(self, testcase, result, error=''):
-        """Add a result row to the table for the given test and result"""
-        is_correct = self.check_correctness(result + error, testcase.expected)
+        """Add a result row to the table for the given test and result.
+           If the elidehiddenrows parameter is set, the cells of hidden rows
+           are left empty (except when running the sample answer, whose
+           output is needed), so only correctness and marks are recorded.
+           If the reportfirstdifference parameter is set, the position of the
+           first difference in a visible failing row is recorded for
+           first_differences_html.
+        """
+        difference = self.first_difference(testcase.expected, result + error)
+        is_correct = difference is None
+        display = testcase.display.upper()
+        is_hidden = (
+            self.hiding or
+            display == 'HIDE' or
+            (display == 'HIDE_IF_SUCCEED' and is_correct) or
+            (display == 'HIDE_IF_FAIL' and not is_correct)
+        )
+        if (is_hidden and self.params['elidehiddenrows']
+                and not self.params.get('running_sample_answer', False)):
+            row = [is_correct] + [''] * (len(self.table[0]) - 3)
+        else:
+            row = self.make_visible_row(testcase, result, error, is_correct)
+
+        self.max_mark += testcase.mark
+        if is_correct:
+            self.mark += testcase.mark
+        else:
+            self.num_failed_tests += 1
+            if display == 'HIDE':
+                self.num_failed_hidden_tests += 1
+        row.append(is_correct)
+        row.append(is_hidden)
+        if not is_correct and is_hidden:
+            self.failed_hidden = True
+        if (difference and not is_hidden and self.params['reportfirstdifference']
+                and not self.params.get('running_sample_answer', False)):
+            self.first_differences.append((len(self.table),) + difference)
+        if not is_correct and testcase.hiderestiffail:
+            self.hiding = True
+        self.table.append(row)
+        if error:
+            self.aborted = True
+
+    def make_visible_row(self, testcase, result, error, is_correct):
+        """Return the start of a result table row, up to but excluding the
+           iscorrect and ishidden columns, for the given test and result.
+        """
         row = [is_correct]
         if self.has_tests:
             if getattr(testcase, 'test_code_html', None):
@@ -203,31 +266,19 @@ class ResultTable:
 
         if self.has_got:
             row.append(result)
+        return row
 
-        display = testcase.display.upper()
-        self.max_mark += testcase.mark
-        if is_correct:
-            self.mark += testcase.mark
-        else:
-            self.num_failed_tests += 1
-            if display == 'HIDE':
-                self.num_failed_hidden_tests += 1
-        row.append(is_correct)
-
-        is_hidden = (
-            self.hiding or
-            display == 'HIDE' or
-            (display == 'HIDE_IF_SUCCEED' and is_correct) or
-            (display == 'HIDE_IF_FAIL' and not is_correct)
-        )
-        row.append(is_hidden)
-        if not is_correct and is_hidden:
-            self.failed_hidden = True
-        if not is_correct and testcase.hiderestiffail:
-            self.hiding = True
-        self.table.append(row)
-        if error:
-            self.aborted = True
+    def first_differences_html(self):
+        """Return an html list of the recorded first differences, one per
+           visible failing test, or '' if there are none. This is kept out of
+           the Got column so that it doesn't affect the showdifferences
+           comparison.
+        """
+        if not self.first_differences:
+            return ''
+        items = ''.join(f'<li>Test {row_num}: line {line_num}, column {column}</li>'
+                        for row_num, line_num, column in self.first_differences)
+        return f"<div class='coderunner-test-results bad'>First differences from expected output:<ul>{items}</ul></div>"
 
     def get_mark(self):
         if self.num_failed_tests == 0:
@@ -261,78 +312,161 @@ class ResultTable:
         except (IndexError, ValueError):
             raise Exception(f"Can't insert '{column_name}' image into result table as the column does not exist.")
 
-    def equal_strings(self, s1, s2):
-        """ Compare the two strings s1 and s2 (expected and got respectively)
-            for equality, with regard to the template parameters
-            strictwhitespace and floattolerance.
+    def normalise_line(self, line):
+        """Right-strip the given line and, if strictwhitespace is off,
+           collapse all white space sequences to a single space.
         """
-        s1 = s1.rstrip()
-        s2 = s2.rstrip()
+        line = line.rstrip()
         if not self.params['strictwhitespace']:
-            # Collapse white space if strict whitespace is not enforced
-            s1 = re.sub(r'\s+', ' ', s1)
-            s2 = re.sub(r'\s+', ' ', s2)
-        if self.params['floattolerance'] is None:
-            return s1 == s2
-        else:
-            # Matching with a floating point tolerance.
-            # Use float pattern from Markus Schmassmann at
-            # https://stackoverflow.com/questions/12643009/regular-expression-for-floating-point-numbers
-            # except we don't match inf or nan which can be embedded in text strings.
-            tol = float(self.params['floattolerance'])
-            float_pat = r'([-+]?(?:(?:(?:[0-9]+[.]?[0-9]*|[.][0-9]+)(?:[ed][-+]?[0-9]+)?)))'
-            s1_bits = re.split(float_pat, s1)
-            s2_bits = re.split(float_pat, s2)
-            if len(s1_bits) != len(s2_bits):
-                return False
-            match = True
-            for bit1, bit2 in zip(s1_bits, s2_bits):
-                bit1 = bit1.strip()
-                bit2 = bit2.strip()
+            line = WHITESPACE_PATTERN.sub(' ', line)
+        return line
+
+    @staticmethod
+    def tokenise(line):
+        """Split the given (normalised) line into bits by the float pattern.
+           Return a tuple (values, bits) where bits is the list of bits and
+           values is a list of the stripped bits, converted to float
+           wherever possible.
+        """
+        bits = FLOAT_PATTERN.split(line)
+        values = [bit.strip() for bit in bits]
+        # Odd-numbered bits matched the float pattern. Even-numbered ones
+        # contain no digits so are floats only if they're inf or nan.
+        for i, value in enumerate(values):
+            if i % 2 == 1 or (value and value.lower().lstrip('+-') in NON_FINITE_FLOATS):
                 try:
-                    f1 = float(bit1)
-                    f2 = float(bit2)
-                    if abs(f1 - f2) > tol * 1.001: # Allow tolerance on the float tolerance!
-                        match = False
+                    values[i] = float(value)
                 except ValueError:
-                    if bit1 != bit2:
-                        match = False
-            return match
-
-    def check_correctness(self, expected, got):
-        """True iff expected matches got with relaxed white space requirements.
+                    pass  # E.g. 1d5
+        return values, bits
+
+    def first_float_difference(self, line_pairs):
+        """Return the (line_num, column) of the first difference in the given
+           sequence of (line_num, (expected_line, got_line)) pairs of
+           normalised lines, using the float tolerance, or None if they match.
+           A line of None denotes the end of that output. Identical lines are
+           skipped. Other lines are tokenised and compared structurally
+           (number of bits, non-numeric bits) and numerically, stopping at the
+           first line that differs.
+        """
+        tol = float(self.params['floattolerance']) * 1.001  # Allow tolerance on the float tolerance!
+        for line_num, (exp_line, got_line) in line_pairs:
+            if exp_line == got_line:
+                continue
+            if exp_line is None or got_line is None:
+                return (line_num, 1)
+            exp_values = self.tokenise(exp_line)[0]
+            got_values, got_bits = self.tokenise(got_line)
+            if len(exp_values) != len(got_values):
+                return (line_num, 1)
+            bad_bit = first_bad_bit(exp_values, got_values, tol)
+            if bad_bit is not None:
+                return (line_num, column_of_bit(got_bits, bad_bit))
+        return None
+
+    def first_difference(self, expected, got):
+        """Return None if expected matches got with relaxed white space requirements.
+           Otherwise return a tuple (line_num, column) of the first point of
+           difference (1-origin), where the column is within the normalised
+           line (see normalise_line). A difference in the number of lines is
+           reported at the first line beyond the end of the shorter one.
            Additionally, if the template parameter floattolerance is set and is
            non-zero, the two strings will be split by a floating-point literal
            pattern and the floating-point bits will be matched to within the
            given absolute tolerance.
+           The two strings are walked line by line in step, without building
+           line lists, and comparison stops at the first difference.
         """
-        expected_lines = expected.rstrip().splitlines()
-        got_lines = got.rstrip().splitlines()
-        if len(got_lines) != len(expected_lines):
-            return False
-        else:
-            for exp, got in zip(expected_lines, got_lines):
-                if not self.equal_strings(exp, got):
-                    return False
-        return True
+        expected_lines = (self.normalise_line(line) for line in iter_lines(expected))
+        got_lines = (self.normalise_line(line) for line in iter_lines(got))
+        line_pairs = enumerate(zip_longest(expected_lines, got_lines), 1)
+        if self.params['floattolerance'] is not None:
+            return self.first_float_difference(line_pairs)
+        for line_num, (exp, got) in line_pairs:
+            if exp is None or got is None:
+                return (line_num, 1)
+            if exp != got:
+                column = next((i for i, (c1, c2) in enumerate(zip(exp, got)) if c1 != c2),
+                              min(len(exp), len(got)))
+                return (line_num, column + 1)
+        return None
+
+    def check_correctness(self, expected, got):
+        """True iff expected matches got with relaxed white space requirements.
+           See first_difference.
+        """
+        return self.first_difference(expected, got) is None
+
+
+def iter_lines(s):
+    """Generate the lines of s.rstrip().splitlines() one at a time, without
+       building either the stripped string or the list of lines.
+    """
+    end = len(s)
+    while end > 0 and s[end - 1].isspace():
+        end -= 1
+    start = 0
+    for match in LINE_BREAK_PATTERN.finditer(s, 0, end):
+        yield s[start:match.start()]
+        start = match.end()
+    if start < end:
+        yield s[start:end]
+
+
+def column_of_bit(bits, i):
+    """The 1-origin column at which bit i of the given list of bits starts"""
+    return sum(len(bit) for bit in bits[:i]) + 1
+
+
+def first_bad_bit(exp_values, got_values, tol):
+    """Return the index of the first of the given tokenised values (see
+       ResultTable.tokenise) that don't match, with floats matching if they're
+       within tol, or None if they all match. If there are many floats, as in
+       a line of a numeric table, they're compared with numpy, which is
+       imported only then as it takes tens of milliseconds to import.
+    """
+    numeric_bits = []
+    mismatch = None
+    for i, (exp, got) in enumerate(zip(exp_values, got_values)):
+        if isinstance(exp, float) and isinstance(got, float):
+            numeric_bits.append(i)
+        elif exp != got:
+            mismatch = i
+            break
+    if len(numeric_bits) >= NUMPY_MIN_FLOATS:
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+        if np is not None:
+            exp_floats = np.array([exp_values[i] for i in numeric_bits])
+            got_floats = np.array([got_values[i] for i in numeric_bits])
+            with np.errstate(invalid='ignore'):  # inf - inf is nan, which is never bad
+                bad = np.abs(exp_floats - got_floats) > tol
+            return numeric_bits[int(np.argmax(bad))] if bad.any() else mismatch
+    for i in numeric_bits:
+        if abs(exp_values[i] - got_values[i]) > tol:
+            return i
+    return mismatch
+
+
+# The escape sequences used by sanitise for control chars other than newline.
+# Applied with one str.replace per char actually present, which is much faster
+# than str.translate when the replacements are multi-character.
+SANITISE_ESCAPES = {chr(code): r'\{:03o}'.format(code) for code in range(32) if code != ord('\n')}
+SANITISE_ESCAPES.update({'\t': r'\t', '\r': r'\r'})
 
 
 def sanitise(s, max_len=MAX_STRING_LENGTH):
     """Replace non-printing chars with escape sequences, right-strip.
        Limit s to max_len by snipping out bits in the middle.
     """
-    result = ''
     if len(s) > max_len:
         s = s[0: max_len // 2] + "\n*** <snip> ***\n" + s[-max_len // 2:]
     lines = s.rstrip().splitlines()
-    for line in lines:
-        for c in line.rstrip() + '\n':
-            if c < ' ' and c != '\n':
-                if c == '\t':
-                    c = r'\t'
-                elif c == '\r':
-                    c = r'\r'
-                else:
-                    c = r'\{:03o}'.format(ord(c))
-            result += c
+    result = '\n'.join(line.rstrip() for line in lines)
+    for c, escape in SANITISE_ESCAPES.items():
+        if c in result:
+            result = result.replace(c, escape)
     return result.rstrip()
+
@@ -3,6 +3,8 @@
 """
 from __resulttable import ResultTable
 import html
+import hashlib
+import io
 import os
 import re
 import __languagetask as languagetask
@@ -38,6 +40,43 @@ def get_jpeg_b64(filename):
     return base64.b64encode(contents).decode('utf8')
 
 
+def optimised_png(png_bytes, max_width=None):
+    """Return the given png image data after downsampling it, if necessary,
+       to at most max_width pixels wide and recompressing it losslessly.
+       The original data is returned if Pillow isn't available, the image
+       can't be processed or the result would be no smaller. Pillow is
+       imported only when needed, as it takes around 20 ms to import.
+    """
+    try:
+        from PIL import Image  # Pillow is always installed with matplotlib
+    except ImportError:
+        return png_bytes
+    try:
+        with Image.open(io.BytesIO(png_bytes)) as image:
+            if max_width and image.width > max_width:
+                height = max(1, round(image.height * max_width / image.width))
+                image = image.resize((max_width, height), Image.LANCZOS)
+            buffer = io.BytesIO()
+            image.save(buffer, format='PNG', optimize=True)
+    except Exception:
+        return png_bytes
+    optimised = buffer.getvalue()
+    return optimised if len(optimised) < len(png_bytes) else png_bytes
+
+
+def parse_image_width(image_width):
+    """Return the value of the imagewidth template parameter as a positive
+       number of pixels, or None if it isn't set. A 'px' suffix is allowed.
+       Raise ValueError if it's set to anything else.
+    """
+    if image_width is None:
+        return None
+    width = int(str(image_width).strip().removesuffix('px'))
+    if width <= 0:
+        raise ValueError(f"non-positive width {width}")
+    return width
+
+
 class Tester:
     def __init__(self, params, testcases):
         """Initialise the instance, given the test of template and global parameters plus
@@ -61,6 +100,13 @@ class Tester:
         self.testcases = self.filter_tests(testcases)
         self.result_table = ResultTable(params)
         self.result_table.set_header(self.testcases)
+        try:
+            self.image_width = parse_image_width(params.get('imagewidth'))
+            self.image_width_error = ''
+        except ValueError:
+            self.image_width = None
+            self.image_width_error = (f"Template parameter imagewidth ({params['imagewidth']!r}) "
+                                      "isn't a number of pixels, so images aren't scaled.")
 
         # It is assumed that in general subclasses will prefix student code by a prelude and
         # postfix it by a postlude.
@@ -252,32 +298,50 @@ class Tester:
         """
         return []
 
+    def row_is_hidden(self, row):
+        """True if the given 0-origin result table row (excluding the header)
+           is hidden, or doesn't exist (e.g. because testing aborted).
+        """
+        table = self.result_table.table
+        return row + 1 >= len(table) or bool(table[row + 1][-1])
+
     def get_all_images_html(self):
         r"""Search the current directory for images named _image.*(Expected|Got)(\d+).png.
            For each such file construct an html img element with the data encoded
            in a dataurl.
            If we're running the sample answer, always return [] - images will be
            picked up when we run the actual answer.
+           Images for hidden rows are skipped, the rest are downsampled to
+           self.image_width (if set) and losslessly recompressed.
+           Identical images are sent only once: all copies refer to the
+           first one's filename.
            Returns a list of tuples (filename, image_data_b64, img_html, column_name, row_number) where
            column_name is either 'Expected' or 'Got', defining in which result table
            column the image belongs and row number is the row (0-origin, excluding
-           the header row).
+           the header row). image_data_b64 is None for duplicate images.
         """
         images = []
         if self.params.get('running_sample_answer', False):
             return []
-        if self.params['imagewidth'] is not None:
-            width_spec = " width={}".format(self.params['imagewidth'])
-        else:
-            width_spec = ""
         files = sorted(os.listdir('.'))
+        filenames_by_hash = {}  # Map from image data hash to first filename with that data
         for filename in files:
             match = re.match(r'_image[^.]*\.(Expected|Got)\.(\d+).png', filename)
             if match:
-                image_data = get_jpeg_b64(filename)
-                img_html = f'<img style="margin:3px;border:1px solid black" src="{filename}">'
                 column = match.group(1)   # Name of column
                 row = int(match.group(2)) # 0-origin row number
+                if self.row_is_hidden(row):
+                    continue
+                with open(filename, 'rb') as fin:
+                    png_bytes = optimised_png(fin.read(), self.image_width)
+                digest = hashlib.sha256(png_bytes).hexdigest()
+                if digest in filenames_by_hash:
+                    image_data = None
+                    src = filenames_by_hash[digest]
+                else:
+                    image_data = base64.b64encode(png_bytes).decode('utf8')
+                    src = filenames_by_hash[digest] = filename
+                img_html = f'<img style="margin:3px;border:1px solid black" src="{src}">'
                 images.append((filename, image_data, img_html, column, row))
         return images
 
@@ -313,7 +377,10 @@ class Tester:
         if images:
             for (filename, image_b64, image_html, column, row) in images:
                 self.result_table.add_image(image_html, column, row)
-                files[filename] = image_b64
+                if image_b64 is not None:
+                    files[filename] = image_b64
+            if self.image_width_error:
+                epilogue += f"<div class='coderunner-test-results bad'>{self.htmlize(self.image_width_error)}</div>"
         outcome['columnformats'] = self.result_table.get_column_formats()
 
         if len(self.result_table.table) > 1:
@@ -335,6 +402,8 @@ class Tester:
         if self.result_table.failed_hidden:
             epilogue += "<div class='coderunner-test-results bad'>One or more hidden tests failed.</div>"
 
+        epilogue += self.result_table.first_differences_html()
+
         if epilogue:
             outcome['epiloguehtml'] = epilogue
             
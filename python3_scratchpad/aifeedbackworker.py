@@ -0,0 +1,91 @@
+"""Worker process for deferred AI feedback (template parameter deferaifeedback)
+   and the host's AI feedback cache.
+   Run this on the Jobe host, as a dedicated user (neither root nor a Jobe
+   user) that owns FEEDBACK_CACHE_ROOT, e.g. after
+       sudo mkdir /var/cache/coderunner
+       sudo chown coderunner: /var/cache/coderunner
+   in a directory containing __codefeedback.py, __promptreducer.py,
+   __ai_feedback_system_prompt.txt and __secrets.py. It creates the queue,
+   store and cache directories, then repeatedly processes the queue of
+   feedback jobs written by the template, storing the feedback for each job in
+   FEEDBACK_STORE_DIR as <jobid>.json and adding it to the cache. Only the
+   worker writes the cache, so it never holds text written by a job.
+   It also serves the stored feedback over https on the given port (default
+   FEEDBACK_SERVER_PORT), using the given certificate and key files:
+   GET /<jobid> returns {"feedback": text} as json, or 404 if the job hasn't
+   been processed yet. The question's feedback html polls that URL, so the
+   template's aifeedbackurl parameter (e.g. https://jobe.example.com:8765)
+   must be reachable from students' browsers and from the Moodle server, and
+   the certificate must be valid for its host name.
+   Usage: python3 aifeedbackworker.py --certfile CERT --keyfile KEY [--port PORT]
+          python3 aifeedbackworker.py --once
+"""
+import argparse
+import http.server
+import json
+import ssl
+import threading
+import time
+
+import __codefeedback as codefeedback
+
+POLL_INTERVAL = 2  # Seconds to sleep when the queue is empty
+
+
+class FeedbackRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Serves GET /<jobid> from the feedback store"""
+    def do_GET(self):
+        feedback = codefeedback.stored_feedback(self.path.strip('/'))
+        if feedback is None:
+            self.send_response(404)
+            body = b''
+        else:
+            self.send_response(200)
+            body = json.dumps({'feedback': feedback}).encode()
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')  # Fetched from the Moodle page
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Don't log every poll
+
+
+def start_server(port=codefeedback.FEEDBACK_SERVER_PORT, certfile=None, keyfile=None):
+    """Start serving the feedback store in a daemon thread and return the
+       server. It serves https if a certificate file is given, else http
+       (which browsers won't fetch from an https Moodle page).
+    """
+    server = http.server.ThreadingHTTPServer(('', port), FeedbackRequestHandler)
+    if certfile:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process deferred AI feedback jobs and serve the feedback")
+    parser.add_argument('--once', action='store_true', help="process the queue once, without serving")
+    parser.add_argument('--port', type=int, default=codefeedback.FEEDBACK_SERVER_PORT)
+    parser.add_argument('--certfile', help="the server's certificate (PEM) for https")
+    parser.add_argument('--keyfile', help="the certificate's private key, if not in certfile")
+    args = parser.parse_args()
+    if not args.once and not args.certfile:
+        parser.error("--certfile is needed to serve the feedback over https")
+    codefeedback.prepare_feedback_dirs()
+    if not args.once:
+        start_server(args.port, args.certfile, args.keyfile)
+    while True:
+        num_done = codefeedback.process_feedback_queue()
+        if args.once:
+            print(f"Processed {num_done} feedback job(s)")
+            break
+        if num_done == 0:
+            time.sleep(POLL_INTERVAL)
+
+
+if __name__ == '__main__':
+    main()
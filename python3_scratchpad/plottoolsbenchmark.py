@@ -0,0 +1,45 @@
+"""Benchmark PlotChecker's point sorting and two-point interpolation against
+   the original list-based implementations, on plots of the size students
+   often produce.
+   Usage: python3 plottoolsbenchmark.py
+"""
+import timeit
+
+import matplotlib
+matplotlib.use('Agg')  # Must precede the import of __plottools
+import numpy as np
+
+from __plottools import PlotChecker
+
+
+def sorted_points_by_list(points):
+    """The original sort, for comparison"""
+    return np.array(sorted([[point[0], point[1]] for point in points]))
+
+
+def interpolate_by_list(data, xs):
+    """The original two-point interpolation, for comparison"""
+    (x0, y0), (x1, y1) = data[0], data[-1]
+    return [(x, y0 + (x - x0) / (x1 - x0) * (y1 - y0)) for x in xs]
+
+
+def main():
+    rng = np.random.default_rng(42)
+    for num_points in [10 ** 5, 10 ** 6]:
+        points = rng.integers(0, 1000, size=(num_points, 2)).astype(float)
+        assert np.array_equal(PlotChecker.sorted_points(points), sorted_points_by_list(points))
+        old = timeit.timeit(lambda: sorted_points_by_list(points), number=1)
+        new = timeit.timeit(lambda: PlotChecker.sorted_points(points), number=1)
+        print(f"Sort {num_points} points: {old:.3f} secs -> {new:.3f} secs")
+
+        line = np.array([[0.0, 1.0], [10.0, 21.0]])
+        xs = rng.uniform(-5, 15, num_points)
+        assert np.allclose([y for _, y in interpolate_by_list(line, xs)],
+                           [y for _, y in PlotChecker.my_interpolate(line, xs)])
+        old = timeit.timeit(lambda: interpolate_by_list(line, xs), number=1)
+        new = timeit.timeit(lambda: list(PlotChecker.my_interpolate(line, xs)), number=1)
+        print(f"Interpolate at {num_points} xs: {old:.3f} secs -> {new:.3f} secs")
+
+
+if __name__ == '__main__':
+    main()
@@ -195,7 +195,10 @@ class PyTester(Tester):
         if test.extra and self.params['extra'] == 'posttest':
             tester += test.extra + '\n'
 
-        if self.params['usesmatplotlib']:
+        if self.params['usesmatplotlib'] and not self.figures_displayable(test):
+            # Close all figures without rasterising them: nobody will see them
+            tester += '_mpl.pyplot.close("all")\n'
+        elif self.params['usesmatplotlib']:
             if 'dpi' in self.params and self.params['dpi']:
                 extra = f", dpi={self.params['dpi']}"
             else:
@@ -216,6 +219,18 @@ class PyTester(Tester):
             ]) + '\n'
         return tester
 
+    def figures_displayable(self, test):
+        """True unless it is already known that any figures produced by the
+           given test will never be displayed in the result table, i.e. when
+           the test is always hidden or when all remaining rows are being
+           hidden. Tests that are hidden only on success or failure must still
+           render. The sample answer's images become the Expected column of
+           the subsequent run, whose hiding state can't be known yet.
+        """
+        if test.display.upper() == 'HIDE':
+            return False
+        return self.params.get('running_sample_answer', False) or not self.result_table.hiding
+
     def single_program_build_possible(self):
         """We avoid all the complication of trying to run all tests in
            a single subprocess run by using exec to run each test singly.
@@ -0,0 +1,44 @@
+"""Benchmark __resulttable.sanitise against the original character-at-a-time
+   version, on 1, 4 and 16 MB outputs with and without control characters.
+   Usage: python3 sanitisebenchmark.py
+"""
+import timeit
+
+from __resulttable import MAX_STRING_LENGTH, sanitise
+
+
+def sanitise_by_char(s, max_len=MAX_STRING_LENGTH):
+    """The original implementation, for comparison"""
+    result = ''
+    if len(s) > max_len:
+        s = s[0: max_len // 2] + "\n*** <snip> ***\n" + s[-max_len // 2:]
+    lines = s.rstrip().splitlines()
+    for line in lines:
+        for c in line.rstrip() + '\n':
+            if c < ' ' and c != '\n':
+                if c == '\t':
+                    c = r'\t'
+                elif c == '\r':
+                    c = r'\r'
+                else:
+                    c = r'\{:03o}'.format(ord(c))
+            result += c
+    return result.rstrip()
+
+
+def main():
+    lines = {
+        'plain': 'Some plain output, line 12345\n',
+        'control chars': 'Some output\twith a tab, a bell \a and trailing spaces   \n',
+    }
+    for kind, line in lines.items():
+        for size_mb in [1, 4, 16]:
+            output = line * (size_mb * 1024 * 1024 // len(line))
+            assert sanitise(output, len(output)) == sanitise_by_char(output, len(output))
+            t_new = timeit.timeit(lambda: sanitise(output, len(output)), number=3) / 3
+            t_old = timeit.timeit(lambda: sanitise_by_char(output, len(output)), number=1)
+            print(f"{size_mb:2} MB {kind:13}: sanitise {t_new * 1000:6.1f} ms, original {t_old * 1000:7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -29,14 +29,17 @@ locale.setlocale(locale.LC_ALL, 'C.UTF-8')
 
 KNOWN_PARAMS = {
     'abortonerror': True,
+    'aifeedbackurl': None,  # The https url of the AI feedback worker's server, for deferaifeedback
     'allowglobals': False,
     'allownestedfunctions': False,
     'banfunctionredefinitions': True,
     'banglobalcode': True,
     'checkfileclosure': False,
     'checktemplateparams': True,
+    'deferaifeedback': False,
     'dpi': 65,
     'echostandardinput': True,
+    'elidehiddenrows': False,  # True to send only correctness and marks for hidden rows
     'extra': 'None',
     'failhiddenonlyfract': 0,
     'failallllmchecks': False,
@@ -67,6 +70,7 @@ KNOWN_PARAMS = {
     'pylintoptions': [],
     'pylintmatplotlib': False,
     'requiredconstructs': [],
+    'reportfirstdifference': False,
     'requiredocstrings': {{ (QUIZ.tags is defined and 'requiredocstrings' in QUIZ.tags) ? 'True' : 'False' }},
     'requiredfunctiondefinitions': [],
     'requiredfunctioncalls': [],
@@ -251,17 +255,32 @@ def get_ai_feedback_html(params):
        toggle-wrapped HTML. Returns an empty string if no author's solution is
        available; surfaces any feedback failure as a short message instead of
        raising, so the question still grades cleanly.
+       If the deferaifeedback parameter is set, the feedback request is just
+       queued for the AI feedback worker, so grading doesn't wait for the LLM.
+       The HTML then holds a placeholder plus a script that fetches the
+       feedback from the worker's server, at the https url given by the
+       aifeedbackurl parameter, when it's ready.
     """
     if not params['AUTHORS_CODE']:
         return ''
+    deferred_script = ''
     try:
         import __codefeedback as codefeedback
-        feedback_text = codefeedback.CodeFeedback().get_feedback(
-            params['STUDENT_ANSWER'], params['AUTHORS_CODE'], params['taughtconstructs'])
+        if params['deferaifeedback']:
+            codefeedback.deferred_feedback_url(params['aifeedbackurl'], '')  # Check it before queueing
+            job_id = codefeedback.enqueue_feedback_job(
+                params['STUDENT_ANSWER'], params['AUTHORS_CODE'], params['taughtconstructs'])
+            feedback_text = f"AI feedback is being prepared and will appear here shortly (reference {job_id})."
+            feedback_url = codefeedback.deferred_feedback_url(params['aifeedbackurl'], job_id)
+            with open("__ai_feedback_deferred.html") as file:
+                deferred_script = file.read().strip() % json.dumps(feedback_url)
+        else:
+            feedback_text = codefeedback.CodeFeedback().get_feedback(
+                params['STUDENT_ANSWER'], params['AUTHORS_CODE'], params['taughtconstructs'])
     except Exception as e:
         feedback_text = f"Sorry, AI feedback is unavailable ({e})."
     with open("__ai_feedback.html") as file:
-        return file.read().strip() % html.escape(feedback_text)
+        return file.read().strip() % html.escape(feedback_text) + deferred_script
 
 
 def update_test_cases(test_cases, outcome):
@@ -0,0 +1,14 @@
+"""Test setup for the python3_scratchpad support files, which are normally
+   run from the Jobe working directory with the support files beside them.
+"""
+import os
+import sys
+import types
+
+SUPPORT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SUPPORT_DIR)
+os.chdir(SUPPORT_DIR)  # The classifier reads its prompt files from the current directory
+
+# __secrets.py holds the LLM API key on the Jobe server and isn't in the repo.
+if '__secrets' not in sys.modules:
+    sys.modules['__secrets'] = types.SimpleNamespace(OPEN_ROUTER_KEY='', CLOUDFLARE_API_KEY='')
@@ -0,0 +1,106 @@
+"""Tests of the AI feedback cache in __codefeedback"""
+import json
+import os
+
+import pytest
+
+import __codefeedback as codefeedback
+from __codefeedback import CodeFeedback, FeedbackCache, canonicalise
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    os.chmod(tmp_path, 0o755)
+    path = tmp_path / 'cache'
+    path.mkdir(mode=0o755)
+    return str(path)
+
+
+def test_canonicalise_ignores_names_comments_and_layout():
+    first, names = canonicalise('def f(numbers):\n    total = 0  # Sum\n    for x in numbers:\n        total += x\n    return total\n')
+    second, _ = canonicalise('def f(nums):\n\n    s = 0\n    for n in nums: s += n\n    return s\n')
+    assert first == second
+    assert names == {'numbers': '_v0', 'total': '_v1', 'x': '_v2'}
+
+
+def test_canonicalise_unparseable_code():
+    assert canonicalise('def f(:\n') == (None, None)
+
+
+def test_round_trip_maps_code_spans_to_new_names(cache_dir):
+    cache = FeedbackCache(cache_dir, writer=True)
+    _, names = canonicalise('a = 1\nprint(a)\n')
+    assert cache.put('k', names, 'Well done. You could write `print(a + 1)` as a single line.')
+    _, new_names = canonicalise('b = 1\nprint(b)\n')
+    assert cache.get('k', new_names) == 'Well done. You could write `print(b + 1)` as a single line.'
+
+
+def test_single_letter_names_in_prose_are_left_alone(cache_dir):
+    cache = FeedbackCache(cache_dir, writer=True)
+    _, names = canonicalise('a = 1\nprint(a)\n')
+    feedback = 'This is a good answer. The loop `for a in x` is fine.'
+    assert cache.put('k', names, feedback)
+    assert cache.get('k', names) == feedback
+
+
+@pytest.mark.parametrize('feedback', [
+    'Your total is computed correctly.',
+    'Consider using a while loop instead of a for loop over `range(len(numbers))`. The numbers are fine.',
+])
+def test_feedback_using_names_in_prose_is_not_cached(cache_dir, feedback):
+    cache = FeedbackCache(cache_dir, writer=True)
+    _, names = canonicalise('def f(numbers):\n    total = 0\n    for x in numbers:\n        total += x\n    return total\n')
+    assert not cache.put('k', names, feedback)
+    assert cache.get('k', names) is None
+
+
+def test_feedback_on_naming_is_not_cached(cache_dir):
+    cache = FeedbackCache(cache_dir, writer=True)
+    assert not cache.put('k', {}, 'The names could be more meaningful.')
+    assert not cache.put('k', {}, 'Sorry, no feedback is available.')
+    assert cache.get('k', {}) is None
+
+
+def test_entries_are_read_only(cache_dir):
+    assert FeedbackCache(cache_dir, writer=True).put('k', {}, 'Fine.')
+    assert os.stat(os.path.join(cache_dir, 'k.json')).st_mode & 0o777 == 0o644
+
+
+def test_only_the_writer_stores_entries(cache_dir):
+    assert not FeedbackCache(cache_dir).put('k', {}, 'Fine.')
+    assert not os.path.exists(os.path.join(cache_dir, 'k.json'))
+
+
+def test_cache_written_by_this_user_is_not_trusted_by_a_reader(cache_dir):
+    FeedbackCache(cache_dir, writer=True).put('k', {}, 'Fine.')
+    assert FeedbackCache(cache_dir).get('k', {}) is None
+
+
+def test_writable_cache_is_not_trusted(cache_dir):
+    cache = FeedbackCache(cache_dir, writer=True)
+    cache.put('k', {}, 'Fine.')
+    os.chmod(cache_dir, 0o777)
+    assert not cache.trusted()
+    assert cache.get('k', {}) is None
+    assert not cache.put('j', {}, 'Fine.')
+
+
+def test_prompt_leaves_out_comments_and_layout(monkeypatch):
+    def urlopen(request, timeout):
+        raise OSError(json.loads(request.data)['messages'][1]['content'])
+    monkeypatch.setattr(codefeedback.urllib.request, 'urlopen', urlopen)
+    feedback = CodeFeedback().ask_llm('x=1 # One\n\n\nprint( x )\n', 'print(1)\n', 'prompt')
+    assert "Student's Code: x = 1\nprint(x)\n" in feedback
+    assert 'One' not in feedback
+
+
+def test_reader_miss_asks_the_llm_once(cache_dir, monkeypatch):
+    calls = []
+    monkeypatch.setattr(codefeedback, 'FeedbackCache', lambda writer: FeedbackCache(cache_dir, writer=writer))
+    monkeypatch.setattr(FeedbackCache, 'trusted', lambda self: True)  # As if owned by the worker
+    monkeypatch.setattr(codefeedback, 'enqueue_feedback_job', lambda *args, **kwargs: calls.append('enqueue'))
+    feedback = CodeFeedback()
+    monkeypatch.setattr(feedback, 'ask_llm', lambda *args: calls.append('ask_llm') or 'Well done.')
+    assert feedback.get_feedback('x = 1\n', 'x = 2\n') == 'Well done.'
+    assert calls == ['ask_llm']
+    assert os.listdir(cache_dir) == []
@@ -0,0 +1,113 @@
+"""Tests of the local (non-LLM) parts of DocstringClassifier and its
+   streamed reply handling
+"""
+import json
+
+import pytest
+
+from __docstringclassifierclass import DocstringClassifier, ThinkStripper, verdict_complete
+
+
+@pytest.mark.parametrize('docstring, expected', [
+    ('TODO: write this docstring', 'todo: write this docstring'),
+    ('TBD', 'tbd'),
+    ('This is a function.', 'this is a function.'),
+    ('This is a   docstring', 'this is a docstring'),
+    ('A function that does something.', 'a function that does something.'),
+    ('Blah blah blah blah', 'blah blah blah blah'),
+    ('It does stuff.', 'it does stuff.'),
+    ('Lorem ipsum dolor sit amet, consectetur.', 'lorem ipsum dolor sit amet, consectetur.'),
+])
+def test_placeholders_are_matched(docstring, expected):
+    assert DocstringClassifier.placeholder_match(docstring) == expected
+
+
+@pytest.mark.parametrize('docstring', [
+    'Return the todo_list with the given item added.',
+    'Add the item to the todo list and return it.',
+    'Returns the volume of a sphere of radius width plus height.',
+    'Return the docstring of the given function object.',
+    'A function that does a binary search for target in items.',
+    'This is a function that returns the mean of the numbers.',
+    'TODO list manager: add, remove and list the items.',
+    'Does things in order: sorts the items, then prints them.',
+    'Does stuff with the inputs and returns the total.',
+    'Return n paragraphs of lorem ipsum text.',
+    'Replace every asdf in the text with the given word.',
+    'Return the number of blah entries in the log.',
+])
+def test_ordinary_docstrings_are_not_placeholders(docstring):
+    assert DocstringClassifier.placeholder_match(docstring) is None
+
+
+def test_placeholder_rejected_without_llm():
+    func = 'def area(width, height):\n    """TODO: fill this in later"""\n    return width * height\n'
+    verdict = DocstringClassifier().classify_function_docstring(func)
+    assert verdict.startswith('INVALID')
+
+
+def test_non_placeholder_goes_to_llm(monkeypatch):
+    func = ('def area(width, height):\n'
+            '    """Returns the volume of a sphere of radius width plus height."""\n'
+            '    return width * height\n')
+    classifier = DocstringClassifier()
+    monkeypatch.setattr(classifier, 'ask_llm', lambda code, prompt: 'INVALID - asked the LLM.')
+    assert classifier.classify_function_docstring(func) == 'INVALID - asked the LLM.'
+
+
+@pytest.mark.parametrize('chunks', [
+    ['<think>hmm</think>VALID'],
+    ['<thi', 'nk>hmm VALID?</th', 'ink>', 'VAL', 'ID'],
+    ['<', 'think', '>', 'x', '<', '/think', '>', 'VALID'],
+])
+def test_think_blocks_stripped_across_chunks(chunks):
+    stripper = ThinkStripper()
+    assert ''.join(stripper.feed(chunk) for chunk in chunks) == 'VALID'
+
+
+def test_visible_text_held_back_only_for_possible_tags():
+    stripper = ThinkStripper()
+    assert stripper.feed('INVALID - too short <') == 'INVALID - too short '
+    assert stripper.feed('3 words.') == '<3 words.'
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('VALID', True),
+    ('  VALID', True),
+    ('INVALID', False),
+    ('INVALID - ', False),
+    ('INVALID - the docstring is too vague.', True),
+    ('INVALID - it doesn\'t say what is returned\n', True),
+    ('', False),
+])
+def test_verdict_complete(text, expected):
+    assert verdict_complete(text) == expected
+
+
+def test_streamed_reply_stops_at_verdict():
+    def event(content):
+        return ('data: ' + json.dumps({'choices': [{'delta': {'content': content}}]}) + '\n').encode()
+    lines = [b': keep-alive\n', event('<think>ok'), event('</think>INVALID - vague.'), event(' More text'),
+             b'data: [DONE]\n']
+    consumed = []
+    def response():
+        for line in lines:
+            consumed.append(line)
+            yield line
+    assert DocstringClassifier.read_streamed_reply(response()) == 'INVALID - vague.'
+    assert len(consumed) == 3
+
+
+def test_streamed_error_is_not_checked():
+    lines = [b'data: ' + json.dumps({'error': {'code': 502, 'message': 'Provider down'}}).encode() + b'\n',
+             b'data: [DONE]\n']
+    assert DocstringClassifier.read_streamed_reply(iter(lines)) == \
+        "VALID - but not LLM checked (the LLM returned an error 'Provider down')"
+
+
+@pytest.mark.parametrize('contents', [[], ['<think>Hmm'], ['I think the docstring is fine']])
+def test_streamed_reply_without_verdict_is_not_checked(contents):
+    lines = [('data: ' + json.dumps({'choices': [{'delta': {'content': content}}]}) + '\n').encode()
+             for content in contents] + [b'data: [DONE]\n']
+    assert DocstringClassifier.read_streamed_reply(iter(lines)) == \
+        "VALID - but not LLM checked (the LLM's reply had no verdict)"
@@ -0,0 +1,119 @@
+"""Tests of the deferred AI feedback queue, store and worker server"""
+import json
+import os
+import shutil
+import ssl
+import stat
+import subprocess
+import urllib.error
+import urllib.request
+
+import pytest
+
+import __codefeedback as codefeedback
+import aifeedbackworker
+
+
+@pytest.fixture
+def feedback_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(codefeedback, 'FEEDBACK_QUEUE_DIR', str(tmp_path / 'queue'))
+    monkeypatch.setattr(codefeedback, 'FEEDBACK_STORE_DIR', str(tmp_path / 'store'))
+    monkeypatch.setattr(codefeedback, 'FEEDBACK_CACHE_DIR', str(tmp_path / 'cache'))
+    return tmp_path
+
+
+def test_enqueue_needs_the_worker(feedback_dirs):
+    with pytest.raises(RuntimeError, match="isn't running"):
+        codefeedback.enqueue_feedback_job('x = 1', 'x = 2')
+
+
+def test_enqueue_refuses_a_readable_queue(feedback_dirs):
+    os.mkdir(codefeedback.FEEDBACK_QUEUE_DIR)
+    os.chmod(codefeedback.FEEDBACK_QUEUE_DIR, 0o777)
+    with pytest.raises(RuntimeError, match='mode 777'):
+        codefeedback.enqueue_feedback_job('x = 1', 'x = 2')
+
+
+def test_enqueue_refuses_a_queue_in_a_writable_directory(feedback_dirs):
+    codefeedback.prepare_feedback_dirs()
+    os.chmod(feedback_dirs, 0o777)
+    with pytest.raises(RuntimeError, match="wasn't created by the worker"):
+        codefeedback.enqueue_feedback_job('x = 1', 'x = 2')
+
+
+@pytest.mark.skipif(os.getuid() != 0, reason='needs root to give the queue away')
+def test_enqueue_refuses_a_queue_owned_by_another_user(feedback_dirs):
+    codefeedback.prepare_feedback_dirs()
+    os.chown(codefeedback.FEEDBACK_QUEUE_DIR, 65534, -1)  # nobody
+    with pytest.raises(RuntimeError, match="wasn't created by the worker"):
+        codefeedback.enqueue_feedback_job('x = 1', 'x = 2')
+
+
+def test_prepare_sets_modes(feedback_dirs):
+    codefeedback.prepare_feedback_dirs()
+    assert stat.S_IMODE(os.stat(codefeedback.FEEDBACK_QUEUE_DIR).st_mode) == 0o1733
+    assert stat.S_IMODE(os.stat(codefeedback.FEEDBACK_STORE_DIR).st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(codefeedback.FEEDBACK_CACHE_DIR).st_mode) == 0o755
+
+
+def test_jobs_are_processed_and_stored(feedback_dirs):
+    codefeedback.prepare_feedback_dirs()
+    job_id = codefeedback.enqueue_feedback_job('x = 1', 'x = 2', ['loops'])
+    assert codefeedback.stored_feedback(job_id) is None
+    calls = []
+    def get_feedback(model, *args):
+        calls.append(args)
+        return 'Good work.'
+    assert codefeedback.process_feedback_queue(get_feedback) == 1
+    assert calls == [('x = 1', 'x = 2', ['loops'])]
+    assert codefeedback.stored_feedback(job_id) == 'Good work.'
+    assert os.listdir(codefeedback.FEEDBACK_QUEUE_DIR) == []
+
+
+def test_stored_feedback_rejects_bad_ids(feedback_dirs):
+    assert codefeedback.stored_feedback('../../etc/passwd') is None
+
+
+@pytest.mark.parametrize('server_url', [None, '', 'http://jobe.example.com:8765', 'localhost:8765'])
+def test_deferred_feedback_needs_an_https_url(server_url):
+    with pytest.raises(ValueError, match='https'):
+        codefeedback.deferred_feedback_url(server_url, '0' * 32)
+
+
+def test_deferred_feedback_url():
+    url = codefeedback.deferred_feedback_url('https://jobe.example.com:8765/', 'ab' * 16)
+    assert url == 'https://jobe.example.com:8765/' + 'ab' * 16
+
+
+def test_server_returns_stored_feedback(feedback_dirs):
+    codefeedback.prepare_feedback_dirs()
+    job_id = codefeedback.enqueue_feedback_job('x = 1', 'x = 2')
+    codefeedback.process_feedback_queue(lambda *args: 'Nice.')
+    server = aifeedbackworker.start_server(port=0)
+    try:
+        base_url = f'http://localhost:{server.server_address[1]}/'
+        with urllib.request.urlopen(base_url + job_id) as response:
+            assert response.headers['Access-Control-Allow-Origin'] == '*'
+            assert json.load(response) == {'feedback': 'Nice.'}
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(base_url + '0' * 32)
+        assert error.value.code == 404
+    finally:
+        server.shutdown()
+
+
+@pytest.mark.skipif(shutil.which('openssl') is None, reason='needs openssl to make a certificate')
+def test_server_serves_https(feedback_dirs):
+    certfile = str(feedback_dirs / 'cert.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=localhost',
+                    '-keyout', certfile, '-out', certfile], check=True, capture_output=True)
+    codefeedback.prepare_feedback_dirs()
+    job_id = codefeedback.enqueue_feedback_job('x = 1', 'x = 2')
+    codefeedback.process_feedback_queue(lambda *args: 'Nice.')
+    server = aifeedbackworker.start_server(port=0, certfile=certfile)
+    try:
+        url = codefeedback.deferred_feedback_url(f'https://localhost:{server.server_address[1]}', job_id)
+        with urllib.request.urlopen(url, context=ssl.create_default_context(cafile=certfile)) as response:
+            assert json.load(response) == {'feedback': 'Nice.'}
+    finally:
+        server.shutdown()
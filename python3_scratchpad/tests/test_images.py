@@ -0,0 +1,41 @@
+"""Tests of the result table image helpers in __tester"""
+import io
+import subprocess
+import sys
+
+import pytest
+
+from __tester import optimised_png, parse_image_width
+
+
+def png_bytes(width, height):
+    Image = pytest.importorskip('PIL.Image')
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), 'white').save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('value, width', [(None, None), (400, 400), ('400', 400), ('400px', 400), (' 250 px', 250)])
+def test_parse_image_width(value, width):
+    assert parse_image_width(value) == width
+
+
+@pytest.mark.parametrize('value', ['wide', '40%', '0', -5, ''])
+def test_parse_image_width_rejects_bad_values(value):
+    with pytest.raises(ValueError):
+        parse_image_width(value)
+
+
+def test_images_downscaled_to_width():
+    Image = pytest.importorskip('PIL.Image')
+    with Image.open(io.BytesIO(optimised_png(png_bytes(800, 600), 400))) as image:
+        assert image.size == (400, 300)
+
+
+def test_unprocessable_image_returned_unchanged():
+    assert optimised_png(b'not a png', 400) == b'not a png'
+
+
+def test_pillow_not_imported_with_module():
+    code = 'import sys, __tester; print("PIL" in sys.modules)'
+    assert subprocess.run([sys.executable, '-c', code], capture_output=True, text=True).stdout.strip() == 'False'
@@ -0,0 +1,112 @@
+"""Tests of the point handling in __plottools, against the original
+   list-based implementations kept in plottoolsbenchmark.py.
+"""
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('scipy')
+matplotlib = pytest.importorskip('matplotlib')
+matplotlib.use('Agg')  # Must precede the import of __plottools
+
+import matplotlib.pyplot as plt
+
+from __plottools import (PlotChecker, first_fingerprint_difference, figure_fingerprint, lttb_downsample,
+                         print_figure_fingerprint, print_plot_info)
+from plottoolsbenchmark import interpolate_by_list, sorted_points_by_list
+
+
+def test_sorted_points_by_x_then_y():
+    points = np.array([[2.0, 1.0], [1.0, 5.0], [2.0, 0.0], [1.0, 3.0]])
+    assert PlotChecker.sorted_points(points).tolist() == [[1, 3], [1, 5], [2, 0], [2, 1]]
+
+
+def test_sorted_points_matches_original():
+    points = np.random.default_rng(1).integers(0, 10, size=(500, 2)).astype(float)
+    assert np.array_equal(PlotChecker.sorted_points(points), sorted_points_by_list(points))
+
+
+def test_sorted_points_empty():
+    assert len(PlotChecker.sorted_points(np.empty((0, 2)))) == 0
+
+
+def test_two_point_interpolation_extrapolates():
+    line = np.array([[0.0, 1.0], [10.0, 21.0]])
+    xs = [-5.0, 0.0, 2.5, 15.0]
+    assert np.allclose([y for _, y in PlotChecker.my_interpolate(line, xs)], [-9.0, 1.0, 6.0, 31.0])
+    assert np.allclose([y for _, y in PlotChecker.my_interpolate(line, xs)],
+                       [y for _, y in interpolate_by_list(line, xs)])
+
+
+def test_lttb_keeps_small_data_unchanged():
+    data = np.arange(20.0).reshape(10, 2)
+    assert np.array_equal(lttb_downsample(data, 10), data)
+    assert np.array_equal(lttb_downsample(data, 2), data)
+
+
+def test_lttb_keeps_ends_and_order():
+    xs = np.linspace(0, 10, 1000)
+    data = np.column_stack((xs, np.sin(xs)))
+    sampled = lttb_downsample(data, 50)
+    assert len(sampled) == 50
+    assert np.array_equal(sampled[0], data[0]) and np.array_equal(sampled[-1], data[-1])
+    assert np.all(np.diff(sampled[:, 0]) > 0)
+    assert all(any(np.array_equal(point, row) for row in data) for point in sampled)
+
+
+def test_lttb_picks_spikes():
+    data = np.column_stack((np.arange(100.0), np.zeros(100)))
+    data[37, 1] = 50.0
+    assert 50.0 in lttb_downsample(data, 10)[:, 1]
+
+
+@pytest.mark.parametrize('downsample_points', [0, 1, 2, 2.5, '10'])
+def test_bad_downsample_points_rejected(downsample_points, capsys):
+    plt.figure()
+    plt.plot(np.arange(1000.0))
+    print_plot_info('points', downsample_points=downsample_points)
+    plt.close()
+    assert capsys.readouterr().out == (f"downsample_points must be an integer of at least 3, "
+                                       f"not {downsample_points!r}\n")
+
+
+def test_downsampled_output_is_bounded(capsys):
+    plt.figure()
+    plt.plot(np.arange(1000.0))
+    print_plot_info('points', downsample_points=10, line_info_only=True)
+    plt.close()
+    out = capsys.readouterr().out
+    assert 'Downsampled to 10 points' in out
+    assert out.count('(') == 10
+
+
+def line_figure(ys, title='Squares'):
+    fig = plt.figure()
+    plt.plot(np.arange(len(ys), dtype=float), ys, 'r-', label='data')
+    plt.title(title)
+    plt.legend()
+    return fig
+
+
+def test_same_figures_have_the_same_fingerprint():
+    first, second = line_figure([0.0, 1.0, 4.0]), line_figure([0.0, 1.0, 4.0 + 1e-6])
+    assert figure_fingerprint(first)[1] == figure_fingerprint(second)[1]
+    plt.close('all')
+
+
+def test_first_fingerprint_difference():
+    first, second = line_figure([0.0, 1.0, 4.0]), line_figure([0.0, 1.0, 5.0])
+    expected, expected_digest = figure_fingerprint(first)
+    got, got_digest = figure_fingerprint(second)
+    assert expected_digest != got_digest
+    assert first_fingerprint_difference(expected, expected) is None
+    assert first_fingerprint_difference(expected, got) == 'figure.axes[0].lines[0].data'
+    third = line_figure([0.0, 1.0, 4.0], title='Cubes')
+    assert first_fingerprint_difference(expected, figure_fingerprint(third)[0]) == 'figure.axes[0].title'
+    plt.close('all')
+
+
+def test_print_figure_fingerprint(capsys):
+    fig = line_figure([0.0, -0.0001, 4.0])
+    print_figure_fingerprint(float_precision=2)
+    assert capsys.readouterr().out == f"Figure fingerprint: {figure_fingerprint(fig, 2)[1]}\n"
+    plt.close('all')
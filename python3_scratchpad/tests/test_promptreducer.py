@@ -0,0 +1,32 @@
+"""Tests of the prompt code reductions in __promptreducer"""
+import pytest
+
+from __promptreducer import (CodeTooLong, elide_function_bodies, reduce_code,
+                             strip_comments_and_blank_lines)
+from __docstringclassifierclass import DocstringClassifier
+from __codefeedback import CodeFeedback
+
+
+def test_comments_and_blank_lines_stripped():
+    code = '# Header\n\nx = 1  # One\ns = """a\n\n# not a comment\n"""\n'
+    assert strip_comments_and_blank_lines(code) == 'x = 1\ns = """a\n\n# not a comment\n"""\n'
+
+
+def test_function_bodies_elided():
+    code = 'def f(x):\n    """Doc"""\n    y = x\n    return y\n\nclass C:\n    def m(self): return 1\n'
+    assert elide_function_bodies(code) == 'def f(x):\n    """Doc"""\n    ...\n\nclass C:\n    def m(self): return 1\n'
+
+
+def test_long_code_is_rejected_not_truncated():
+    code = 'x = 1\n' * 10
+    assert reduce_code(code, max_chars=60) == code
+    with pytest.raises(CodeTooLong, match='64 characters'):
+        reduce_code(code + '#\ny\n', strip_comments=False, max_chars=60)
+
+
+def test_too_long_code_skips_the_llm(monkeypatch):
+    monkeypatch.setattr(reduce_code, '__defaults__', (True, False, 10))
+    func = 'def area(width, height):\n    """Return the area of the rectangle"""\n    return width * height\n'
+    assert DocstringClassifier().classify_function_docstring(func).startswith('VALID - but not LLM checked (the code is too long')
+    feedback = CodeFeedback().ask_llm(func, func, '')
+    assert feedback.startswith('Sorry, no feedback is available (the code is too long')
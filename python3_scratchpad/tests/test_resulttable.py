@@ -0,0 +1,157 @@
+"""Tests of output comparison and row building in __resulttable"""
+import subprocess
+import sys
+import types
+
+import pytest
+
+from __resulttable import ResultTable, iter_lines
+
+
+def make_table(**params):
+    params.setdefault('extra', '')
+    params.setdefault('isfunction', True)
+    table = ResultTable(params)
+    return table
+
+
+def make_test(expected, display='SHOW', testcode='print(x)'):
+    return types.SimpleNamespace(testcode=testcode, stdin='', extra='', expected=expected,
+                                 display=display, hiderestiffail=False, mark=1.0)
+
+
+@pytest.mark.parametrize('s', [
+    '', 'a', 'a\nb', 'a\nb\n\n  ', 'a\r\nb\rc\x0bd e', '\n\nx', '  \n', 'a  \nb  ',
+])
+def test_iter_lines_matches_splitlines(s):
+    assert list(iter_lines(s)) == s.rstrip().splitlines()
+
+
+@pytest.mark.parametrize('expected, got, difference', [
+    ('abc\ndef', 'abc\ndef', None),
+    ('abc\ndef', 'abc\ndxf', (2, 2)),
+    ('abc\ndef', 'abc', (2, 1)),
+    ('abc', 'abcd', (1, 4)),
+    ('abc\n\n', 'abc', None),
+])
+def test_first_difference(expected, got, difference):
+    assert make_table().first_difference(expected, got) == difference
+
+
+def test_relaxed_whitespace():
+    table = make_table(strictwhitespace=False)
+    assert table.first_difference('a  b\tc', 'a b c') is None
+
+
+@pytest.mark.parametrize('expected, got, difference', [
+    ('x = 1.000', 'x = 1.0004', None),
+    ('x = 1.000', 'x = 1.01', (1, 5)),
+    ('x = 1.0 y', 'x = 1.0 z', (1, 8)),
+    ('nan inf', 'nan inf', None),
+    ('1 2 3\n4 5 6', '1 2 3\n4 5 7', (2, 5)),
+    ('1 2 3', '1 2', (1, 1)),
+])
+def test_float_tolerance(expected, got, difference):
+    assert make_table(floattolerance=0.001).first_difference(expected, got) == difference
+
+
+def test_float_tolerance_on_long_lines():
+    expected = ' '.join(str(i) for i in range(1000))
+    got = expected.replace(' 500 ', ' 500.5 ')
+    table = make_table(floattolerance=0.1)
+    assert table.first_difference(expected, expected) is None
+    assert table.first_difference(expected, got) == (1, expected.index(' 500 ') + 2)
+    got = expected.replace(' 900 ', ' 900 ,').replace(' 500 ', ' 500.5 ')
+    assert table.first_difference(expected, got) == (1, expected.index(' 500 ') + 2)
+    got = expected.replace(' 100 ', ' 100 ,').replace(' 500 ', ' 500.5 ')
+    assert table.first_difference(expected, got) == (1, expected.index(' 100 ') + 5)
+
+
+def test_first_difference_reported_outside_got():
+    table = make_table(reportfirstdifference=True)
+    tests = [make_test('hello'), make_test('bye', display='HIDE'), make_test('abc')]
+    table.set_header(tests)
+    for test, got in zip(tests, ['hello', 'by', 'abd']):
+        table.add_row(test, got)
+    assert [row[-3] for row in table.table[1:]] == ['hello', 'by', 'abd']
+    assert table.first_differences == [(3, 1, 3)]
+    assert 'Test 3: line 1, column 3' in table.first_differences_html()
+
+
+def test_first_difference_not_reported_for_sample_answer():
+    table = make_table(reportfirstdifference=True, running_sample_answer=True)
+    test = make_test('')
+    table.set_header([test])
+    table.add_row(test, 'output')
+    assert table.table[1][-3] == 'output'
+    assert table.first_differences_html() == ''
+
+
+def test_float_comparison_stops_at_first_differing_line():
+    def line_pairs():
+        yield 1, ('1.0', '1.0')
+        yield 2, ('2.0', '2.5')
+        raise AssertionError('Read past the first difference')
+    table = make_table(floattolerance=0.001)
+    assert table.first_float_difference(line_pairs()) == (2, 1)
+
+
+def test_numpy_not_imported_with_module():
+    code = 'import sys, __resulttable; print("numpy" in sys.modules)'
+    assert subprocess.run([sys.executable, '-c', code], capture_output=True, text=True).stdout.strip() == 'False'
+
+
+def test_hidden_rows_elided():
+    table = make_table(elidehiddenrows=True)
+    tests = [make_test('a'), make_test('b', display='HIDE'), make_test('c', display='HIDE_IF_SUCCEED')]
+    table.set_header(tests)
+    for test, got in zip(tests, ['a', 'x', 'c']):
+        table.add_row(test, got)
+    assert table.table[1] == [True, 'print(x)', 'a', 'a', True, False]
+    assert table.table[2] == [False, '', '', '', False, True]
+    assert table.table[3] == [True, '', '', '', True, True]
+    assert table.failed_hidden
+    assert (table.mark, table.max_mark, table.num_failed_hidden_tests) == (2.0, 3.0, 1)
+
+
+def test_hidden_rows_not_elided_for_sample_answer():
+    table = make_table(elidehiddenrows=True, running_sample_answer=True)
+    test = make_test('b', display='HIDE')
+    table.set_header([test])
+    table.add_row(test, 'b')
+    assert table.table[1] == [True, 'print(x)', 'b', 'b', True, True]
+
+
+def test_get_table_without_images_shares_rows():
+    table = make_table()
+    test = make_test('a')
+    table.set_header([test])
+    table.add_row(test, 'a')
+    result = table.get_table()
+    assert result == table.table and result is not table.table
+    assert result[1] is table.table[1]
+
+
+def test_get_table_adds_images_to_their_column():
+    table = make_table()
+    tests = [make_test('a'), make_test('b')]
+    table.set_header(tests)
+    for test in tests:
+        table.add_row(test, '<b>')
+    table.add_image('<img src="x.png">', 'Got', 1)
+    table.add_image('<img src="y.png">', 'Got', 5)  # Beyond the end of the table
+    result = table.get_table()
+    assert result[0] is table.table[0]
+    assert result[1][3] == '<div><pre class="tablecell">&lt;b&gt;</pre></div>'
+    assert result[2][3] == '<div><pre class="tablecell">&lt;b&gt;</pre></div><br><img src="x.png">'
+    assert result[2][:3] == table.table[2][:3]
+    assert table.table[2][3] == '<b>'  # Unchanged
+    assert len(result) == 3
+    assert table.get_column_formats() == ['%s', '%s', '%h']
+
+
+def test_add_image_needs_the_column():
+    table = make_table(resultcolumns=[['Test', 'testcode'], ['Got', 'got']])
+    table.set_header([make_test('a')])
+    with pytest.raises(Exception, match='Expected'):
+        table.add_image('<img>', 'Expected', 0)
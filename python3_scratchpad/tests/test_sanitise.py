@@ -0,0 +1,33 @@
+"""Tests of __resulttable.sanitise, including a comparison with the original
+   character-at-a-time implementation kept in sanitisebenchmark.py.
+"""
+import random
+
+import pytest
+
+from __resulttable import sanitise
+from sanitisebenchmark import sanitise_by_char
+
+
+@pytest.mark.parametrize('s, expected', [
+    ('hello  \nworld\n\n', 'hello\nworld'),
+    ('tab\there\r\n', r'tab\there'),
+    ('bell\a', r'bell\007'),
+    ('a\rb', 'a\nb'),  # splitlines treats a lone \r as a line break
+    ('', ''),
+])
+def test_sanitise(s, expected):
+    assert sanitise(s) == expected
+
+
+def test_long_strings_snipped_in_the_middle():
+    result = sanitise('a' * 50 + 'b' * 50, max_len=20)
+    assert result == 'a' * 10 + '\n*** <snip> ***\n' + 'b' * 10
+
+
+def test_matches_original_implementation():
+    rng = random.Random(1)
+    alphabet = 'ab \t\r\n\a\x00\x0b\x1c '
+    for _ in range(500):
+        s = ''.join(rng.choice(alphabet) for _ in range(rng.randrange(40)))
+        assert sanitise(s, 20) == sanitise_by_char(s, 20)
@@ -0,0 +1,78 @@
+"""Tests of the result table images and figure handling in Tester and
+   PyTester
+"""
+import base64
+import io
+import types
+
+import pytest
+
+from __tester import Tester as BaseTester, optimised_png
+from pytester import PyTester
+
+
+def make_tester(**params):
+    params = {'STUDENT_ANSWER': '', 'SEPARATOR': '#<ab@17943918#@>#', 'ALL_OR_NOTHING': True,
+              'IS_PRECHECK': False, 'extra': '', 'isfunction': False, **params}
+    tests = [make_test('a'), make_test('b', display='HIDE'), make_test('c')]
+    tester = BaseTester(params, tests)
+    return tester, tests
+
+
+def make_test(expected, display='SHOW'):
+    return types.SimpleNamespace(testcode='print(x)', stdin='', extra='', expected=expected, display=display,
+                                 hiderestiffail=False, mark=1.0, testtype=0)
+
+
+def png_bytes(colour):
+    Image = pytest.importorskip('PIL.Image')
+    buffer = io.BytesIO()
+    Image.new('RGB', (20, 10), colour).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def test_row_is_hidden():
+    tester, tests = make_tester()
+    for test in tests[:2]:
+        tester.result_table.add_row(test, test.expected)
+    assert [tester.row_is_hidden(row) for row in range(3)] == [False, True, True]  # Row 2 doesn't exist
+
+
+def test_images_of_hidden_rows_skipped_and_duplicates_sent_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    tester, tests = make_tester()
+    for test in tests:
+        tester.result_table.add_row(test, test.expected)
+    red, blue = png_bytes('red'), png_bytes('blue')
+    for filename, data in [('_image1.Got.0.png', red), ('_image1.Got.1.png', blue),
+                           ('_image1.Got.2.png', red), ('_image2.Got.2.png', blue)]:
+        (tmp_path / filename).write_bytes(data)
+    images = tester.get_all_images_html()
+    assert [(filename, column, row) for filename, _, _, column, row in images] == [
+        ('_image1.Got.0.png', 'Got', 0), ('_image1.Got.2.png', 'Got', 2), ('_image2.Got.2.png', 'Got', 2)]
+    first, duplicate, other = images
+    assert base64.b64decode(first[1]) == optimised_png(red)
+    assert duplicate[1] is None and 'src="_image1.Got.0.png"' in duplicate[2]
+    assert base64.b64decode(other[1]) == optimised_png(blue) and 'src="_image2.Got.2.png"' in other[2]
+
+
+def test_no_images_for_sample_answer(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / '_image1.Expected.0.png').write_bytes(b'png')
+    tester, _ = make_tester(running_sample_answer=True)
+    assert tester.get_all_images_html() == []
+
+
+@pytest.mark.parametrize('display, hiding, sample_answer, displayable', [
+    ('SHOW', False, False, True),
+    ('HIDE_IF_SUCCEED', False, False, True),
+    ('HIDE_IF_FAIL', False, False, True),
+    ('hide', False, False, False),
+    ('HIDE', False, True, False),
+    ('SHOW', True, False, False),
+    ('SHOW', True, True, True),
+])
+def test_figures_displayable(display, hiding, sample_answer, displayable):
+    tester = types.SimpleNamespace(params={'running_sample_answer': sample_answer},
+                                   result_table=types.SimpleNamespace(hiding=hiding))
+    assert PyTester.figures_displayable(tester, make_test('', display)) == displayable